@@ -0,0 +1,82 @@
+"""Measure (with `tracemalloc`) the memory that `RouteController` and `MariaDBPlacer` use for their in-memory state.
+
+Run with `make bench` (or `python3 bench/bench_memory.py`).
+"""
+
+import logging
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from wp_operator import RouteController, MariaDBPlacer
+
+HOSTS = 50
+ROUTES = 10000
+MARIADBS = 10
+DATABASES = 5000
+
+
+def random_path(depth):
+    return "".join(f"/{random.choice(['labs', 'news', 'research', 'about', 'team'])}-{random.randint(0, 20)}"
+                   for _ in range(depth))
+
+
+def fresh(s):
+    """A copy of `s` that is not the same object, as each watch event brings its own."""
+    return "".join(list(s))
+
+
+def route_events():
+    hosts = [f"site-{i}.epfl.ch" for i in range(HOSTS)]
+    for i in range(ROUTES):
+        yield ('ADDED', fresh('wordpress'), f"wp-route-{i}",
+               {'host': fresh(random.choice(hosts)), 'path': random_path(random.randint(0, 4)),
+                'to': {'kind': 'Service', 'name': fresh('wp-nginx'), 'weight': 100},
+                'port': {'targetPort': '80'},
+                'tls': {'termination': 'edge', 'insecureEdgeTerminationPolicy': 'Redirect'},
+                'wildcardPolicy': 'None'})
+
+
+def database_events():
+    for i in range(DATABASES):
+        yield ('ADDED', fresh('wordpress'), f"wp-db-site-{i}", fresh(f"mariadb-{random.randrange(MARIADBS):02d}"))
+
+
+def measure(what, build):
+    """Events are made up as they get consumed, so that whatever the model keeps of them counts."""
+    random.seed(42)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    print(f"bench_memory: {what} in {size / 1024:.0f} KiB")
+    return kept
+
+
+def main():
+    logging.disable(logging.INFO)
+
+    def build_routes():
+        controller = RouteController()
+        for event in route_events():
+            controller._on_route_event(*event)
+        return controller
+
+    def build_placement():
+        placer = MariaDBPlacer()
+        for i in range(MARIADBS):
+            placer._on_mariadb_event('ADDED', 'wordpress', f"mariadb-{i:02d}", {'wp-auto-allocate': 'true'})
+        for event in database_events():
+            placer._on_database_event(*event)
+        return placer
+
+    measure(f"{ROUTES} Routes", build_routes)
+    measure(f"{DATABASES} Databases", build_placement)
+
+
+if __name__ == '__main__':
+    main()
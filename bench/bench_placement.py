@@ -0,0 +1,63 @@
+"""Replay Database events into a `MariaDBPlacer`, then place new databases.
+
+Run with `make bench` (or `python3 bench/bench_placement.py`).
+"""
+
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from wp_operator import MariaDBPlacer
+
+NAMESPACES = 3
+MARIADBS_PER_NAMESPACE = 10
+DATABASE_EVENTS = 5000
+PLACEMENTS = 1000
+
+
+def main():
+    logging.disable(logging.INFO)
+    random.seed(42)
+    placer = MariaDBPlacer()
+
+    namespaces = [f"wordpress-{i}" for i in range(NAMESPACES)]
+    mariadbs = [f"mariadb-{i:02d}" for i in range(MARIADBS_PER_NAMESPACE)]
+    for namespace in namespaces:
+        for mariadb in mariadbs:
+            placer._on_mariadb_event('ADDED', namespace, mariadb, {'wp-auto-allocate': 'true'})
+
+    # Mostly ADDED, as on startup; then some MODIFIED and DELETED ones for databases we already know of.
+    events = []
+    for i in range(DATABASE_EVENTS):
+        namespace = random.choice(namespaces)
+        if events and random.random() < 0.2:
+            event_type = random.choice(['MODIFIED', 'DELETED'])
+            _, namespace, name, mariadb = random.choice(events)
+        else:
+            event_type = random.choice([None, 'ADDED'])
+            name, mariadb = f"wp-db-site-{i}", random.choice(mariadbs)
+        events.append((event_type, namespace, name, mariadb))
+
+    start = time.perf_counter()
+    for event in events:
+        placer._on_database_event(*event)
+    replay = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(PLACEMENTS):
+        namespace = random.choice(namespaces)
+        mariadb, _ = placer._choose_mariadb(namespace)
+        placer._index.add_database(namespace, f"wp-db-new-{i}", mariadb)
+    placement = time.perf_counter() - start
+
+    print(f"bench_placement: replayed {DATABASE_EVENTS} Database events in {replay * 1000:.1f} ms "
+          f"({replay / DATABASE_EVENTS * 1e6:.1f} µs each); "
+          f"{PLACEMENTS} placements in {placement * 1000:.1f} ms "
+          f"({placement / PLACEMENTS * 1e6:.1f} µs each)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Load Route events into a `RouteController`, then look up the closest parent Route of new sites.
+
+Run with `make bench` (or `python3 bench/bench_route_controller.py`).
+"""
+
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from wp_operator import RouteController
+
+HOSTS = 50
+ROUTES = 10000
+LOOKUPS = 10000
+
+
+def random_path(depth):
+    return "".join(f"/{random.choice(['labs', 'news', 'research', 'about', 'team'])}-{random.randint(0, 20)}"
+                   for _ in range(depth))
+
+
+def main():
+    logging.disable(logging.INFO)
+    random.seed(42)
+    controller = RouteController()
+
+    hosts = [f"site-{i}.epfl.ch" for i in range(HOSTS)]
+    events = [('ADDED', 'wordpress', f"wp-route-{i}",
+               {'host': random.choice(hosts), 'path': random_path(random.randint(0, 4)),
+                'to': {'kind': 'Service', 'name': 'wp-nginx'}})
+              for i in range(ROUTES)]
+    lookups = [(random.choice(hosts), random_path(random.randint(1, 6))) for _ in range(LOOKUPS)]
+
+    start = time.perf_counter()
+    for event in events:
+        controller._on_route_event(*event)
+    load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for hostname, path in lookups:
+        controller._get_closest_parent_route('wordpress', hostname, path)
+    lookup = time.perf_counter() - start
+
+    print(f"bench_route_controller: loaded {ROUTES} Route events in {load * 1000:.1f} ms "
+          f"({load / ROUTES * 1e6:.1f} µs each); "
+          f"{LOOKUPS} closest parent lookups in {lookup * 1000:.1f} ms "
+          f"({lookup / LOOKUPS * 1e6:.1f} µs each)")
+
+
+if __name__ == '__main__':
+    main()
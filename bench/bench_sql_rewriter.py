@@ -0,0 +1,101 @@
+"""Stream a synthetic dump through a `DumpRewriter`; measure its throughput, and (with `tracemalloc`) its peak memory.
+
+Peak memory should stay about the same whatever the size of the dump,
+as `DumpRewriter` holds one line (`mariadb-dump` caps them at 1 MiB)
+at a time.
+
+Run with `make bench` (or `python3 bench/bench_sql_rewriter.py`).
+"""
+
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from sql_rewriter import DumpRewriter
+
+OLD_URL = "https://www.epfl.ch/labs/old-lab"
+NEW_URL = "https://www.epfl.ch/research/labs/new-lab"
+LINE_SIZE = 1024 * 1024   # mariadb-dump's default --net-buffer-length
+SIZES_MIB = [4, 16]
+
+
+def php_serialize_str(s):
+    return f's:{len(s.encode())}:"{s}";'
+
+
+def dump_line(line_no):
+    """One extended INSERT, of about `LINE_SIZE` bytes; some values PHP-serialized, some mentioning `OLD_URL`."""
+    values = []
+    size = 0
+    row = 0
+    while size < LINE_SIZE:
+        row += 1
+        kind = random.random()
+        if kind < 0.2:
+            value = "a:2:{" + php_serialize_str("url") + php_serialize_str(f"{OLD_URL}/page-{row}") + \
+                    php_serialize_str("title") + php_serialize_str(f"Page {row}") + "}"
+        elif kind < 0.4:
+            value = f'<a href=\\"{OLD_URL}/news-{row}\\">News</a>'
+        else:
+            value = "Lorem ipsum dolor sit amet, consectetur adipiscing elit " * 4
+        tuple_ = f"({line_no * 100000 + row},'option_{row}','{value}','yes')"
+        values.append(tuple_)
+        size += len(tuple_) + 1
+    return ("INSERT INTO `wp_options` VALUES " + ",".join(values) + ";\n").encode()
+
+
+class SyntheticDump:
+    """A binary file-like object that serves `size` bytes of dump, cycling through `lines`."""
+    def __init__(self, lines, size):
+        self._lines = lines
+        self._left = size
+        self._buffer = b""
+        self._line_no = 0
+
+    def read(self, n):
+        while len(self._buffer) < n and self._left > 0:
+            line = self._lines[self._line_no % len(self._lines)]
+            self._line_no += 1
+            self._left -= len(line)
+            self._buffer += line
+        chunk, self._buffer = self._buffer[:n], self._buffer[n:]
+        return chunk
+
+
+class NullSink:
+    def write(self, data):
+        pass
+
+
+def rewrite(lines, size_mib, traced):
+    rewriter = DumpRewriter({OLD_URL: NEW_URL, "wp_old_lab": "wp_new_lab"})
+    if traced:
+        tracemalloc.start()
+    started = time.monotonic()
+    rewriter.rewrite(SyntheticDump(lines, size_mib * 1024 * 1024), NullSink())
+    elapsed = time.monotonic() - started
+    peak = tracemalloc.get_traced_memory()[1] if traced else None
+    if traced:
+        tracemalloc.stop()
+    return rewriter.stats, elapsed, peak
+
+
+def main():
+    logging.disable(logging.INFO)
+    random.seed(42)
+    lines = [dump_line(i) for i in range(8)]
+    for size_mib in SIZES_MIB:
+        stats, elapsed, _ = rewrite(lines, size_mib, traced=False)
+        _, _, peak = rewrite(lines, size_mib, traced=True)
+        print(f"bench_sql_rewriter: {stats['bytes_in'] / 2**20:.0f} MiB dump "
+              f"at {stats['bytes_in'] / 2**20 / elapsed:.1f} MiB/s, "
+              f"{stats['values_rewritten']} values rewritten ({stats['lengths_fixed']} serialized lengths fixed); "
+              f"peak memory {peak / 2**20:.1f} MiB (including the dump's own buffer, up to 2 MiB)")
+
+
+if __name__ == '__main__':
+    main()
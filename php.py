@@ -17,7 +17,7 @@ def php_double_quoted_escape(s: str) -> str:
         elif c == '\f':
             return '\\f'
         elif ord(c) < 32 or ord(c) >= 127:
-            return '\\x{:02x}'.format(ord(c))
+            return ''.join('\\x{:02x}'.format(b) for b in c.encode('utf-8'))
         else:
             return c
     escaped = ''.join(escape_char(c) for c in s)
@@ -46,4 +46,5 @@ if __name__ == "__main__":
     assert phpize(['test', 'test1', 'test2', ['test3', 'test4', 2, 5, 6], True, False]) == '''array("test", "test1", "test2", array("test3", "test4", 2, 5, 6), TRUE, FALSE)'''
     assert phpize(['test', 'test1', 'test2', ['test3', 'test4', {"rosa": "rosaOK", "Dom": "DomOK", "Nicolas": 222}, 5, 6], True, False]) == '''array("test", "test1", "test2", array("test3", "test4", array("rosa" => "rosaOK", "Dom" => "DomOK", "Nicolas" => 222), 5, 6), TRUE, FALSE)'''
     assert phpize({'a': [[1]]}) == '''array("a" => array(array(1)))'''
+    assert phpize("Français") == '''"Fran\\xc3\\xa7ais"'''
 
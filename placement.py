@@ -0,0 +1,269 @@
+"""Where to put new databases: the bookkeeping, metrics and strategies of `wp_operator.MariaDBPlacer`."""
+
+import heapq
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import requests
+
+
+class PlacementIndex:
+    """How many databases each MariaDB holds, for `MariaDBPlacer` to pick the least populated one.
+
+    Updates and lookups are O(log n) in the number of MariaDBs of the
+    namespace (thanks to one heap per namespace, whose stale entries
+    are skipped lazily), and O(1) in the number of databases.
+
+    Per database, all it keeps is one dict entry pointing to the
+    (interned) name of its MariaDB.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mariadb_of = {}   # namespace → {database name: MariaDB name}
+        self._counts = {}       # (namespace, MariaDB name) → number of databases
+        self._heaps = {}        # namespace → [(count, MariaDB name)], some of them stale
+
+    def add_mariadb(self, namespace, mariadb_name):
+        with self._lock:
+            if (namespace, mariadb_name) not in self._counts:
+                self._set_count(namespace, mariadb_name, 0)
+
+    def remove_mariadb(self, namespace, mariadb_name):
+        with self._lock:
+            self._counts.pop((namespace, mariadb_name), None)
+            mariadb_of = self._mariadb_of.get(namespace, {})
+            for db_name in [db for db, m in mariadb_of.items() if m == mariadb_name]:
+                del mariadb_of[db_name]
+
+    def add_database(self, namespace, db_name, mariadb_name):
+        """Returns False if that database was already accounted for (on that same MariaDB)."""
+        with self._lock:
+            mariadb_of = self._mariadb_of.setdefault(sys.intern(namespace), {})
+            previous = mariadb_of.get(db_name)
+            if previous == mariadb_name:
+                return False
+            if previous is not None and (namespace, previous) in self._counts:
+                # Moved by the `DatabaseRebalancer`
+                self._set_count(namespace, previous, self._counts[(namespace, previous)] - 1)
+            mariadb_of[db_name] = sys.intern(mariadb_name)
+            self._set_count(namespace, mariadb_name, self._counts.get((namespace, mariadb_name), 0) + 1)
+            return True
+
+    def remove_database(self, namespace, db_name):
+        """Returns the name of the MariaDB that the database was on, or None if it wasn't accounted for."""
+        with self._lock:
+            mariadb_name = self._mariadb_of.get(namespace, {}).pop(db_name, None)
+            if mariadb_name is not None and (namespace, mariadb_name) in self._counts:
+                self._set_count(namespace, mariadb_name, self._counts[(namespace, mariadb_name)] - 1)
+            return mariadb_name
+
+    def mariadb_of(self, namespace, db_name):
+        with self._lock:
+            return self._mariadb_of.get(namespace, {}).get(db_name)
+
+    def databases_on(self, namespace, mariadb_name):
+        """Returns the sorted names of the databases on that MariaDB (in O(n) of all databases)."""
+        with self._lock:
+            return sorted(db for db, m in self._mariadb_of.get(namespace, {}).items() if m == mariadb_name)
+
+    def namespaces(self):
+        with self._lock:
+            return sorted({ns for (ns, _) in self._counts})
+
+    def count(self, namespace, mariadb_name):
+        with self._lock:
+            return self._counts.get((namespace, mariadb_name), 0)
+
+    def counts(self, namespace):
+        """Returns a {MariaDB name: number of databases} dict of all the MariaDBs of `namespace`."""
+        with self._lock:
+            return {m: c for (ns, m), c in self._counts.items() if ns == namespace}
+
+    def least_populated(self, namespace):
+        with self._lock:
+            heap = self._heaps.get(namespace, [])
+            while heap:
+                count, mariadb_name = heap[0]
+                if self._counts.get((namespace, mariadb_name)) == count:
+                    return mariadb_name
+                heapq.heappop(heap)   # Stale
+            return None
+
+    def _set_count(self, namespace, mariadb_name, count):
+        self._counts[(namespace, mariadb_name)] = count
+        heap = self._heaps.setdefault(namespace, [])
+        heapq.heappush(heap, (count, mariadb_name))
+        if len(heap) > 2 * len(self._counts) + 16:
+            heap[:] = [(c, m) for (ns, m), c in self._counts.items() if ns == namespace]
+            heapq.heapify(heap)
+
+
+class MetricsSource:
+    """Load metrics for each MariaDB, as a dict with any of the keys
+    `data_size_bytes`, `qps` and `connections`.
+
+    This base class knows of no metrics at all; see
+    `FileMetricsSource` and `HttpMetricsSource`.
+    """
+    @classmethod
+    def from_location(cls, location):
+        """A local file name or a http(s) URL, or an empty string for no metrics."""
+        if not location:
+            return cls()
+        elif location.startswith(("http://", "https://")):
+            return HttpMetricsSource(location)
+        else:
+            return FileMetricsSource(location)
+
+    def get(self, namespace, mariadb_name):
+        return self._all().get(f"{namespace}/{mariadb_name}", {})
+
+    def _all(self):
+        return {}
+
+
+class FileMetricsSource(MetricsSource):
+    """Reads metrics from a JSON file shaped like `{"namespace/mariadb": {"qps": 12.5, ...}, ...}`.
+
+    The file is re-read whenever it changes.
+    """
+    def __init__(self, path):
+        self._path = path
+        self._mtime = None
+        self._metrics = {}
+
+    def _all(self):
+        try:
+            mtime = os.stat(self._path).st_mtime
+            if mtime != self._mtime:
+                with open(self._path) as f:
+                    self._metrics = json.load(f)
+                self._mtime = mtime
+        except (OSError, ValueError) as e:
+            logging.warning(f"[MariaDBPlacer] cannot read metrics from {self._path}: {e}")
+        return self._metrics
+
+
+class HttpMetricsSource(MetricsSource):
+    """Same as `FileMetricsSource`, from a URL that gets fetched at most once every `ttl` seconds."""
+    def __init__(self, url, ttl=60):
+        self._url = url
+        self._ttl = ttl
+        self._fetched_at = None
+        self._metrics = {}
+
+    def _all(self):
+        if self._fetched_at is None or time.monotonic() - self._fetched_at > self._ttl:
+            self._fetched_at = time.monotonic()
+            try:
+                r = requests.get(self._url, timeout=5)
+                r.raise_for_status()
+                self._metrics = r.json()
+            except (requests.RequestException, ValueError) as e:
+                logging.warning(f"[MariaDBPlacer] cannot fetch metrics from {self._url}: {e}")
+        return self._metrics
+
+
+class PlacementStrategy:
+    """Scores candidate MariaDBs; the lowest score gets the new database.
+
+    Built with `parse()` out of a criterion name (e.g. `"data_size"`),
+    or a weighted combination of them (e.g. `"count:1,qps:2"`). In the
+    latter case, each criterion is normalized to [0, 1] (relative to
+    the highest value among candidates) before weighting.
+
+    A MariaDB that the metrics source knows nothing about gets the
+    average of the others, so that it doesn't look idle.
+    """
+    criteria = {
+        "count": None,   # From the `PlacementIndex`
+        "data_size": "data_size_bytes",
+        "qps": "qps",
+        "connections": "connections",
+    }
+
+    def __init__(self, weights):
+        self.weights = weights
+
+    @classmethod
+    def parse(cls, spec):
+        weights = {}
+        for term in spec.split(","):
+            criterion, _, weight = term.strip().partition(":")
+            if criterion not in cls.criteria:
+                raise ValueError(f"Unknown placement criterion {criterion!r} (expected one of {', '.join(cls.criteria)})")
+            weights[criterion] = float(weight) if weight else 1.0
+        return cls(weights)
+
+    def __str__(self):
+        if list(self.weights.values()) == [1.0]:
+            return list(self.weights)[0]
+        return ",".join(f"{criterion}:{weight:g}" for criterion, weight in self.weights.items())
+
+    def choose(self, namespace, index, metrics):
+        """Returns the name of the MariaDB to use (or None if there is none), and the score of each."""
+        counts = index.counts(namespace)
+        if list(self.weights) == ["count"]:
+            return index.least_populated(namespace), counts
+
+        scores = self.scores(namespace, counts, metrics)
+        if not scores:
+            return None, scores
+        return min(scores, key=lambda m: (scores[m], counts[m], m)), scores
+
+    def plan_moves(self, namespace, index, metrics, tolerance=0.2, movable=lambda db_name: True):
+        """Returns a list of (database name, from MariaDB, to MariaDB) moves that even out the scores.
+
+        A database moves from the highest-scoring MariaDB to the lowest-
+        scoring one, as long as the former scores more than `1 +
+        tolerance` times the latter. Each MariaDB takes part in at most
+        one move per plan, so that metrics (which only reflect a move
+        after the fact) get a chance to catch up before the next one.
+        """
+        counts = index.counts(namespace)
+        moves = []
+        while len(counts) >= 2:
+            scores = self.scores(namespace, counts, metrics)
+            source = max(scores, key=lambda m: (scores[m], counts[m], m))
+            target = min(scores, key=lambda m: (scores[m], counts[m], m))
+            if scores[source] <= scores[target] * (1 + tolerance):
+                break
+            if list(self.weights) == ["count"] and counts[source] - counts[target] < 2:
+                break   # Moving would just swap the imbalance around
+            candidates = [db for db in index.databases_on(namespace, source) if movable(db)]
+            if candidates:
+                moves.append((candidates[0], source, target))
+            del counts[source]
+            del counts[target]
+        return moves
+
+    def scores(self, namespace, counts, metrics):
+        values = {criterion: self._values(criterion, namespace, counts, metrics)
+                  for criterion in self.weights}
+        if len(self.weights) == 1:
+            [(criterion, criterion_values)] = values.items()
+            return criterion_values
+
+        scores = dict.fromkeys(counts, 0.0)
+        for criterion, weight in self.weights.items():
+            highest = max(values[criterion].values(), default=0)
+            for mariadb_name, value in values[criterion].items():
+                scores[mariadb_name] += weight * (value / highest if highest else 0)
+        return {m: round(score, 4) for m, score in scores.items()}
+
+    def _values(self, criterion, namespace, counts, metrics):
+        metric = self.criteria[criterion]
+        if metric is None:
+            return dict(counts)
+
+        known = {}
+        for mariadb_name in counts:
+            value = metrics.get(namespace, mariadb_name).get(metric)
+            if value is not None:
+                known[mariadb_name] = float(value)
+        average = sum(known.values()) / len(known) if known else 0
+        return {m: known.get(m, average) for m in counts}
@@ -0,0 +1,227 @@
+"""Source databases restored from S3 on the mariadb-restore instance, kept around for the next site that needs them."""
+
+import asyncio
+import logging
+import threading
+import time
+
+
+class RestoredSnapshot:
+    """One database restored from the backups of `source` (a MariaDB), as of `restored_at`.
+
+    On the mariadb-restore instance, a Restore brings back a database
+    under its original name; so there is at most one snapshot per
+    (namespace, database) at any time.
+    """
+    def __init__(self, namespace, database, source, k8s_name, restored_at=None):
+        self.namespace = namespace
+        self.database = database
+        self.source = source
+        self.k8s_name = k8s_name
+        self.restored_at = restored_at   # Wall-clock time; None while being restored
+        self.refs = 0
+        self.last_used = time.monotonic()
+        self.error = None
+
+    @property
+    def key(self):
+        return (self.namespace, self.database)
+
+    @property
+    def moniker(self):
+        return f"{self.namespace}/{self.database} (from {self.source})"
+
+
+class RestoredSnapshotCache:
+    """Share restored source databases between site restores.
+
+    `acquire()` returns a snapshot, and whether the caller must restore
+    it (and then call either `restored()` or `failed()`). Concurrent
+    callers for the same snapshot wait for that one restore, rather
+    than each running their own. Callers `release()` the snapshot once
+    they are done dumping it. `acquire_async()` waits without holding
+    a thread, for asyncio callers.
+
+    Snapshots that nobody uses get dropped (through `drop(snapshot)`)
+    once older than `ttl` seconds, or when there are more than
+    `max_entries` of them, least recently used first. With `ttl` = 0,
+    snapshots are dropped as soon as they are released.
+
+    Restores bring back the latest backup, whichever it is at the time,
+    without telling which; so snapshots are not told apart by backup,
+    and `ttl` bounds how far behind the latest backup a reused one can
+    be.
+    """
+    def __init__(self, drop, ttl, max_entries, sweep_interval=60):
+        self._drop = drop
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._sweep_interval = sweep_interval
+        self._changed = threading.Condition()
+        self._snapshots = {}   # (namespace, database) → RestoredSnapshot
+        self._to_drop = []
+        self._stats = dict(hits=0, misses=0, shared_in_flight=0, expired=0, dropped=0, failed=0)
+        self._async_waiters = set()   # Callables that wake up an `acquire_async()`
+        self._stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name="restore-cache", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def stats(self):
+        with self._changed:
+            return dict(self._stats,
+                        snapshots=len(self._snapshots),
+                        in_use=sum(1 for s in self._snapshots.values() if s.refs))
+
+    def adopt(self, snapshot):
+        """Take over a snapshot restored before the operator (re)started."""
+        with self._changed:
+            self._snapshots.setdefault(snapshot.key, snapshot)
+
+    def acquire(self, namespace, database, source, k8s_name, blocking=True):
+        """Returns `(snapshot, must_restore)`. Blocks while another caller restores, or uses, an unsuitable one.
+
+        Without `blocking`, returns None instead of blocking.
+        """
+        with self._changed:
+            while True:
+                snapshot = self._snapshots.get((namespace, database))
+                if snapshot is None:
+                    break
+                elif snapshot.restored_at is None and snapshot.source == source:
+                    if not blocking:
+                        return None
+                    snapshot.refs += 1
+                    self._stats["shared_in_flight"] += 1
+                    while snapshot.restored_at is None and snapshot.error is None:
+                        self._changed.wait()
+                    if snapshot.error is not None:
+                        snapshot.refs -= 1
+                        raise snapshot.error
+                    return (snapshot, False)
+                elif snapshot.restored_at is not None and self._usable(snapshot, source):
+                    snapshot.refs += 1
+                    snapshot.last_used = time.monotonic()
+                    self._stats["hits"] += 1
+                    return (snapshot, False)
+                elif snapshot.refs:
+                    if not blocking:
+                        return None
+                    self._changed.wait()   # Until whoever has it is done
+                else:
+                    # Restoring again overwrites it; no need to drop it first
+                    del self._snapshots[snapshot.key]
+                    self._stats["expired"] += 1
+                    break
+
+            snapshot = RestoredSnapshot(namespace, database, source, k8s_name)
+            snapshot.refs = 1
+            self._snapshots[snapshot.key] = snapshot
+            self._stats["misses"] += 1
+            self._evict()
+        self._flush_drops()
+        return (snapshot, True)
+
+    async def acquire_async(self, namespace, database, source, k8s_name):
+        """Same as `acquire()`, but waits on the event loop rather than in a thread.
+
+        If the restore that it waits for fails, the caller gets to
+        restore the snapshot itself (rather than the error).
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            changed = asyncio.Event()
+
+            def wake_up():
+                loop.call_soon_threadsafe(changed.set)
+            with self._changed:
+                # Before trying, so as not to miss a change in between
+                self._async_waiters.add(wake_up)
+            try:
+                # In a thread all the same, as it may drop snapshots (see `_flush_drops()`)
+                acquired = await asyncio.to_thread(self.acquire, namespace, database, source, k8s_name,
+                                                   blocking=False)
+                if acquired is not None:
+                    return acquired
+                await changed.wait()
+            finally:
+                with self._changed:
+                    self._async_waiters.discard(wake_up)
+
+    def restored(self, snapshot):
+        with self._changed:
+            snapshot.restored_at = time.time()
+            snapshot.last_used = time.monotonic()
+            self._notify_all()
+
+    def failed(self, snapshot, error):
+        """Called instead of `restored()`; also releases the caller's reference."""
+        with self._changed:
+            self._stats["failed"] += 1
+            snapshot.error = error
+            snapshot.refs -= 1
+            if self._snapshots.get(snapshot.key) is snapshot:
+                del self._snapshots[snapshot.key]
+            self._notify_all()
+
+    def release(self, snapshot):
+        with self._changed:
+            snapshot.refs -= 1
+            snapshot.last_used = time.monotonic()
+            if snapshot.refs == 0 and self._ttl == 0 and self._snapshots.get(snapshot.key) is snapshot:
+                self._forget(snapshot)
+            self._notify_all()
+        self._flush_drops()
+
+    def sweep(self):
+        with self._changed:
+            self._evict()
+        self._flush_drops()
+
+    def _notify_all(self):
+        """Must be called with `_changed` held."""
+        self._changed.notify_all()
+        for wake_up in self._async_waiters:
+            try:
+                wake_up()
+            except RuntimeError:
+                pass   # Its event loop is closed
+
+    def _usable(self, snapshot, source):
+        return snapshot.source == source and time.time() - snapshot.restored_at < self._ttl
+
+    def _evict(self):
+        """Must be called with `_changed` held."""
+        idle = [s for s in self._snapshots.values() if s.refs == 0 and s.restored_at is not None]
+        for s in idle:
+            if time.time() - s.restored_at >= self._ttl:
+                self._forget(s)
+        idle = sorted((s for s in idle if s.key in self._snapshots), key=lambda s: s.last_used)
+        for s in idle[:max(len(self._snapshots) - self._max_entries, 0)]:
+            self._forget(s)
+
+    def _forget(self, snapshot):
+        """Must be called with `_changed` held, and followed by `_flush_drops()` once released."""
+        del self._snapshots[snapshot.key]
+        self._to_drop.append(snapshot)
+        self._stats["dropped"] += 1
+
+    def _flush_drops(self):
+        with self._changed:
+            to_drop, self._to_drop = self._to_drop, []
+        for snapshot in to_drop:
+            logging.info(f"[RestoredSnapshotCache] dropping {snapshot.moniker}")
+            try:
+                self._drop(snapshot)
+            except Exception:
+                logging.exception(f"[RestoredSnapshotCache] could not drop {snapshot.moniker}")
+
+    def _run(self):
+        while not self._stopped.wait(self._sweep_interval):
+            try:
+                self.sweep()
+            except Exception:
+                logging.exception("[RestoredSnapshotCache] sweep failed")
@@ -0,0 +1,132 @@
+"""A queue of site restores, that runs them in its own threads (rather than in kopf's handlers)."""
+
+import collections
+import logging
+import threading
+import time
+
+
+RestoreJob = collections.namedtuple("RestoreJob", ["namespace", "name", "source", "target", "attempt"],
+                                    defaults=[1])
+"""One site to restore: `source` is the MariaDB that it was backed up from, `target` the one it goes to.
+
+`attempt` counts from 1.
+"""
+
+
+class RestoreQueue:
+    """Runs `run_job(job)` for each `RestoreJob`, oldest first, within concurrency limits.
+
+    At most `max_concurrent` jobs run at once; of those, at most
+    `max_per_source` restore from the same source MariaDB, and at most
+    `max_per_target` into the same target MariaDB. A job that cannot
+    start yet because of the latter two doesn't hold back the ones
+    behind it.
+
+    A job that fails gets retried, up to `max_attempts` attempts in all,
+    after `retry_delay` seconds, then twice as long after each further
+    failure.
+
+    Jobs are kept in memory only; whoever enqueues them is responsible
+    for persisting them, and enqueuing them again after a restart.
+    """
+    def __init__(self, run_job, max_concurrent, max_per_source, max_per_target, max_attempts=1, retry_delay=60):
+        self._run_job = run_job
+        self._max_per_source = max_per_source
+        self._max_per_target = max_per_target
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+        self._changed = threading.Condition()
+        self._queued = []                                # RestoreJobs, oldest first
+        self._not_before = {}                            # (namespace, name) → time.monotonic() of the next retry
+        self._running = {}                               # (namespace, name) → RestoreJob
+        self._running_by_source = collections.Counter()
+        self._running_by_target = collections.Counter()
+        self._stats = collections.Counter()
+        self._stopped = False
+        self._workers = [threading.Thread(target=self._work, name=f"restore-{i}", daemon=True)
+                         for i in range(max_concurrent)]
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self):
+        """Let the running jobs finish, but don't start any more."""
+        with self._changed:
+            self._stopped = True
+            self._changed.notify_all()
+
+    def enqueue(self, job):
+        """Returns False if that site is already queued or running."""
+        key = (job.namespace, job.name)
+        with self._changed:
+            if key in self._running or any((j.namespace, j.name) == key for j in self._queued):
+                return False
+            self._queued.append(job)
+            self._stats["enqueued"] += 1
+            self._changed.notify_all()
+            return True
+
+    def retry_delay(self, attempt):
+        """How long to wait after the failure of attempt number `attempt`."""
+        return self._retry_delay * 2 ** (attempt - 1)
+
+    def stats(self):
+        with self._changed:
+            return dict(self._stats,
+                        queued=len(self._queued),
+                        waiting_retry=len(self._not_before),
+                        running=len(self._running),
+                        running_by_source=dict(+self._running_by_source),
+                        running_by_target=dict(+self._running_by_target))
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            outcome = "failed"
+            try:
+                self._run_job(job)
+                outcome = "succeeded"
+            except Exception:
+                logging.exception(f"[RestoreQueue] restore of {job.namespace}/{job.name} failed")
+            finally:
+                with self._changed:
+                    self._stats[outcome] += 1
+                    key = (job.namespace, job.name)
+                    del self._running[key]
+                    self._running_by_source[job.source] -= 1
+                    self._running_by_target[job.target] -= 1
+                    if outcome == "failed" and job.attempt < self._max_attempts:
+                        delay = self.retry_delay(job.attempt)
+                        logging.warning(f"[RestoreQueue] retrying the restore of {job.namespace}/{job.name} "
+                                        f"in {delay}s (attempt {job.attempt + 1} of {self._max_attempts})")
+                        self._queued.append(job._replace(attempt=job.attempt + 1))
+                        self._not_before[key] = time.monotonic() + delay
+                        self._stats["retried"] += 1
+                    self._changed.notify_all()
+
+    def _next_job(self):
+        with self._changed:
+            while True:
+                if self._stopped:
+                    return None
+                now = time.monotonic()
+                next_retry = None
+                for job in self._queued:
+                    key = (job.namespace, job.name)
+                    not_before = self._not_before.get(key)
+                    if not_before is not None and not_before > now:
+                        next_retry = min(next_retry or not_before, not_before)
+                        continue
+                    if (self._running_by_source[job.source] < self._max_per_source and
+                            self._running_by_target[job.target] < self._max_per_target):
+                        self._queued.remove(job)
+                        self._not_before.pop(key, None)
+                        self._running[key] = job
+                        self._running_by_source[job.source] += 1
+                        self._running_by_target[job.target] += 1
+                        return job
+                self._changed.wait(None if next_retry is None else next_retry - now)
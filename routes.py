@@ -0,0 +1,163 @@
+"""Where Routes are: the bookkeeping of `wp_operator.RouteController`."""
+
+from collections.abc import Mapping
+import json
+import sys
+
+
+class RouteRecord:
+    """What `RouteController` needs to know about a Route, and nothing more.
+
+    Hosts and service names are interned, as there are many more
+    Routes than there are of either.
+    """
+    __slots__ = ("name", "host", "path", "service", "length", "fingerprint")
+
+    def __init__(self, name, host, path, service, fingerprint=None):
+        self.name = name
+        self.host = sys.intern(host or "")
+        self.path = path or ""
+        self.service = sys.intern(service) if service else None
+        self.length = len(self.host) + len(self.path)
+        self.fingerprint = fingerprint   # See `fingerprint_of()`
+
+    @classmethod
+    def from_spec(cls, name, spec, previous=None, fingerprint=None):
+        """Fields that `spec` lacks (e.g. in a partial update) are kept from `previous`."""
+        def pick(value, previous_value):
+            return value if value is not None else previous_value
+        return cls(name,
+                   pick(spec.get('host'), previous and previous.host),
+                   pick(spec.get('path'), previous and previous.path),
+                   pick((spec.get('to') or {}).get('name'), previous and previous.service),
+                   fingerprint=fingerprint)
+
+    @staticmethod
+    def fingerprint_of(body, paths):
+        """A hash of the fields of `body` at `paths` (tuples of keys).
+
+        Rather than whole Routes, records keep this hash of the fields
+        that the operator sets; so that it can tell whether a Route
+        already is as it wants it, without keeping all of it around.
+        Missing and empty values count as the same (as the API server
+        omits empty ones).
+        """
+        def plain(value):
+            if isinstance(value, Mapping):
+                return {k: plain(v) for k, v in value.items()}
+            elif isinstance(value, (list, tuple)):
+                return [plain(v) for v in value]
+            return value
+
+        values = []
+        for path in paths:
+            value = body
+            for key in path:
+                value = value.get(key) if isinstance(value, Mapping) else None
+            values.append(plain(value) or None)
+        return hash(json.dumps(values, sort_keys=True))
+
+    @property
+    def segments(self):
+        return [sys.intern(part) for part in f"{self.host}{self.path}".split('/') if part]
+
+    @property
+    def spec(self):
+        """The subset of the Route's spec that this record knows of."""
+        spec = {'host': self.host}
+        if self.path:
+            spec['path'] = self.path
+        spec['to'] = {'name': self.service}
+        return spec
+
+
+class RouteTrie:
+    """The Routes of one namespace, by host then path segment.
+
+    `closest_parent()` (the longest prefix match of a site URL) costs
+    O(d) in the depth d of the site's path, regardless of the number
+    of Routes. So do updates, which happen in place.
+    """
+    class _Node:
+        __slots__ = ("children", "routes")
+
+        def __init__(self):
+            self.children = None   # segment → _Node, once there are any
+            self.routes = None     # route name → RouteRecord, once there are any
+
+    def __init__(self):
+        self._root = self._Node()   # Its children are keyed by host
+        self._records = {}          # route name → RouteRecord
+
+    def __contains__(self, name):
+        return name in self._records
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, name):
+        """Returns the `RouteRecord` of that Route, or None."""
+        return self._records.get(name)
+
+    def records(self):
+        return list(self._records.values())
+
+    def set(self, record):
+        """Add or update a Route."""
+        self.remove(record.name)
+        self._records[record.name] = record
+        node = self._root
+        for segment in record.segments:
+            if node.children is None:
+                node.children = {}
+            node = node.children.setdefault(segment, self._Node())
+        if node.routes is None:
+            node.routes = {}
+        node.routes[record.name] = record
+
+    def remove(self, name):
+        record = self._records.pop(name, None)
+        if record is None:
+            return
+        segments = record.segments
+        path = [self._root]
+        for segment in segments:
+            path.append(path[-1].children[segment])
+        node = path[-1]
+        del node.routes[name]
+        if not node.routes:
+            node.routes = None
+        # Prune the nodes that are left empty, deepest first
+        for parent, segment, node in reversed(list(zip(path, segments, path[1:]))):
+            if node.routes or node.children:
+                break
+            del parent.children[segment]
+            if not parent.children:
+                parent.children = None
+
+    def closest_parent(self, hostname, path):
+        """Returns the `RouteRecord` of the longest prefix of that site URL, or None."""
+        return self._closest(
+            [part for part in f"{hostname}{path or ''}".split('/') if part],
+            max_length=None)
+
+    def closest_parent_of(self, name):
+        """Returns the `RouteRecord` of the closest strict prefix of Route `name`, or None.
+
+        Exact duplicates (same host and path) don't count.
+        """
+        record = self._records[name]
+        return self._closest(record.segments, max_length=record.length)
+
+    def _closest(self, segments, max_length):
+        closest = None
+        closest_length = 0
+        node = self._root
+        for segment in segments:
+            node = node.children.get(segment) if node.children else None
+            if node is None:
+                break
+            for record in (node.routes or {}).values():
+                if record.length > closest_length and (max_length is None or record.length < max_length):
+                    closest, closest_length = record, record.length
+        return closest
@@ -0,0 +1,136 @@
+"""Rewrite a `mariadb-dump` on the fly, without breaking PHP-serialized values.
+
+A `sed` on a dump changes the strings in `serialize()`d option and
+meta values, but not the `s:N:"..."` lengths in front of them; PHP
+then fails to unserialize them. `DumpRewriter` does all the
+replacements in one pass, and fixes the lengths as it goes.
+"""
+
+import logging
+import re
+import time
+
+
+class DumpRewriter:
+    """Replace each key of `replacements` with its value, throughout a dump.
+
+    The dump is read in `chunk_size` chunks, and processed one line
+    (that is, one SQL statement) at a time; so memory use is bounded by
+    the longest line, which `mariadb-dump` caps with its
+    `--net-buffer-length` (1 MiB by default).
+    """
+    _literal = re.compile(rb"'((?:[^'\\]|\\.)*)'", re.DOTALL)
+    _escaped = re.compile(rb"\\(.)", re.DOTALL)
+    _unescapes = {b"0": b"\x00", b"b": b"\x08", b"n": b"\n", b"r": b"\r", b"t": b"\t", b"Z": b"\x1a"}
+    _escapes = [(b"\\", b"\\\\"), (b"\x00", b"\\0"), (b"\n", b"\\n"), (b"\r", b"\\r"),
+                (b"\x1a", b"\\Z"), (b"'", b"\\'"), (b'"', b'\\"')]
+    _serialized = re.compile(rb"^(?:[aO]:\d+:|s:\d+:\"|[idb]:[^;]*;|N;)")
+    _serialized_string = re.compile(rb's:(\d+):"')
+
+    def __init__(self, replacements, chunk_size=1024 * 1024, label="rewrite"):
+        self._replacements = {k.encode("utf-8"): v.encode("utf-8")
+                              for k, v in replacements.items() if k and k != v}
+        # Longest first, so that the longest match wins
+        self._pattern = re.compile(b"|".join(
+            re.escape(k) for k in sorted(self._replacements, key=len, reverse=True))) if self._replacements else None
+        self._chunk_size = chunk_size
+        self._label = label
+        self.stats = dict(bytes_in=0, bytes_out=0, lines=0, values_rewritten=0, lengths_fixed=0, seconds=0)
+
+    @staticmethod
+    def total_stats(rewriters):
+        """Sums up the `stats` of several `DumpRewriter`s (that may have run in parallel)."""
+        total = dict(bytes_in=0, bytes_out=0, lines=0, values_rewritten=0, lengths_fixed=0, seconds=0)
+        for rewriter in rewriters:
+            for k, v in rewriter.stats.items():
+                total[k] = max(total[k], v) if k == "seconds" else total[k] + v
+        return total
+
+    def rewrite(self, infile, outfile):
+        """Copy binary `infile` into binary `outfile`, rewritten."""
+        started = time.monotonic()
+        pending = b""
+        while True:
+            chunk = infile.read(self._chunk_size)
+            if not chunk:
+                break
+            self.stats["bytes_in"] += len(chunk)
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                self._write(outfile, self.rewrite_line(line) + b"\n")
+        if pending:
+            self._write(outfile, self.rewrite_line(pending))
+
+        self.stats["seconds"] = round(time.monotonic() - started, 3)
+        logging.info(f"[{self._label}] {self._report()}")
+
+    def _write(self, outfile, data):
+        self.stats["bytes_out"] += len(data)
+        outfile.write(data)
+
+    def _report(self):
+        seconds = self.stats["seconds"] or 1e-9
+        return (f"rewrote {self.stats['bytes_in'] / 2**20:.1f} MiB "
+                f"({self.stats['bytes_in'] / 2**20 / seconds:.1f} MiB/s) and "
+                f"{self.stats['values_rewritten']} values ({self.stats['values_rewritten'] / seconds:.0f}/s) "
+                f"in {self.stats['seconds']}s, fixing {self.stats['lengths_fixed']} serialized lengths")
+
+    def rewrite_line(self, line):
+        self.stats["lines"] += 1
+        if self._pattern is None or not self._pattern.search(line):
+            return line
+
+        rewritten = []
+        pos = 0
+        for m in self._literal.finditer(line):
+            rewritten.append(self._replace(line[pos:m.start()]))
+            literal = m.group(1)
+            if self._pattern.search(literal):
+                self.stats["values_rewritten"] += 1
+                literal = self._escape(self.rewrite_value(self._unescape(literal)))
+            rewritten.append(b"'" + literal + b"'")
+            pos = m.end()
+        rewritten.append(self._replace(line[pos:]))
+        return b"".join(rewritten)
+
+    def rewrite_value(self, value):
+        """Rewrite one (unescaped) value, fixing its serialized lengths if it is `serialize()`d."""
+        if self._serialized.match(value):
+            try:
+                return self._rewrite_serialized(value)
+            except ValueError:
+                pass   # Just looked serialized
+        return self._replace(value)
+
+    def _rewrite_serialized(self, value):
+        rewritten = []
+        pos = 0
+        while True:
+            m = self._serialized_string.search(value, pos)
+            if m is None:
+                break
+            start = m.end()
+            end = start + int(m.group(1))
+            if value[end:end + 2] != b'";':
+                raise ValueError("not a serialized string")
+            rewritten.append(self._replace(value[pos:m.start()]))
+            # Strings may themselves be serialized (e.g. widgets in some plugins)
+            content = self.rewrite_value(value[start:end])
+            if len(content) != end - start:
+                self.stats["lengths_fixed"] += 1
+            rewritten.append(b's:%d:"%s";' % (len(content), content))
+            pos = end + 2
+        rewritten.append(self._replace(value[pos:]))
+        return b"".join(rewritten)
+
+    def _replace(self, data):
+        return self._pattern.sub(lambda m: self._replacements[m.group(0)], data)
+
+    def _unescape(self, literal):
+        return self._escaped.sub(lambda m: self._unescapes.get(m.group(1), m.group(1)), literal)
+
+    def _escape(self, value):
+        for raw, escaped in self._escapes:
+            value = value.replace(raw, escaped)
+        return value
@@ -0,0 +1,40 @@
+import threading
+import unittest
+from wp_kubernetes import ConditionWaiter
+
+
+def with_condition(name, condition_type, message):
+    return {
+        'metadata': {'namespace': 'namespace-test', 'name': name},
+        'status': {'conditions': [{'type': condition_type, 'message': message}]}
+    }
+
+
+class TestConditionWaiter(unittest.TestCase):
+    def setUp(self):
+        self.waiter = ConditionWaiter()
+
+    def wait(self, get, timeout=5):
+        self.waiter.wait('databases', 'namespace-test', 'db1', 'Ready', 'Created',
+                         timeout=timeout, get=get)
+
+    def test_already_ready(self):
+        self.wait(lambda: with_condition('db1', 'Ready', 'Created'))
+
+    def test_ready_from_event(self):
+        def send_event():
+            self.waiter.on_event('databases', 'MODIFIED', with_condition('db1', 'Ready', 'Created'))
+        timer = threading.Timer(0.1, send_event)
+        timer.start()
+        self.wait(lambda: with_condition('db1', 'Ready', 'Pending'))
+        timer.join()
+
+    def test_timeout_reports_last_message(self):
+        self.waiter.on_event('databases', 'MODIFIED', with_condition('db2', 'Ready', 'Created'))
+        with self.assertRaisesRegex(TimeoutError, 'Pending'):
+            self.wait(lambda: with_condition('db1', 'Ready', 'Pending'), timeout=0.1)
+        self.assertEqual(self.waiter._waiters, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from wp_kubernetes import MariaDBIndex
+
+
+def service(name, mariadb_name, port=3306, headless=False):
+    return {
+        'metadata': {'namespace': 'namespace-test', 'name': name,
+                     'ownerReferences': [{'kind': 'MariaDB', 'name': mariadb_name}]},
+        'spec': {'ports': [{'name': 'mariadb', 'port': port}],
+                 'publishNotReadyAddresses': headless}
+    }
+
+
+class TestMariaDBIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = MariaDBIndex()
+
+    def test_endpoint(self):
+        self.index.on_service_event('ADDED', service('mariadb-min-internal', 'mariadb-min', headless=True))
+        self.assertIsNone(self.index.endpoint('namespace-test', 'mariadb-min'))
+        self.index.on_service_event('ADDED', service('mariadb-min', 'mariadb-min'))
+        self.assertEqual(self.index.endpoint('namespace-test', 'mariadb-min'), ('mariadb-min', 3306))
+        self.index.on_service_event('MODIFIED', service('mariadb-min', 'mariadb-min', port=3307))
+        self.assertEqual(self.index.endpoint('namespace-test', 'mariadb-min'), ('mariadb-min', 3307))
+        self.index.on_service_event('DELETED', service('mariadb-min', 'mariadb-min'))
+        self.assertIsNone(self.index.endpoint('namespace-test', 'mariadb-min'))
+
+    def test_second_service_deleted(self):
+        self.index.on_service_event('ADDED', service('mariadb-min', 'mariadb-min'))
+        self.index.on_service_event('ADDED', service('mariadb-min-primary', 'mariadb-min'))
+        self.index.on_service_event('DELETED', service('mariadb-min-primary', 'mariadb-min'))
+        self.assertEqual(self.index.endpoint('namespace-test', 'mariadb-min'), ('mariadb-min', 3306))
+
+    def test_first_service_deleted(self):
+        self.index.on_service_event('ADDED', service('mariadb-min', 'mariadb-min'))
+        self.index.on_service_event('ADDED', service('mariadb-min-primary', 'mariadb-min'))
+        self.index.on_service_event('DELETED', service('mariadb-min', 'mariadb-min'))
+        self.assertEqual(self.index.endpoint('namespace-test', 'mariadb-min'), ('mariadb-min-primary', 3306))
+
+    def test_service_changes_owner(self):
+        self.index.on_service_event('ADDED', service('mariadb-min', 'mariadb-min'))
+        self.index.on_service_event('MODIFIED', service('mariadb-min', 'mariadb-other'))
+        self.assertIsNone(self.index.endpoint('namespace-test', 'mariadb-min'))
+        self.assertEqual(self.index.endpoint('namespace-test', 'mariadb-other'), ('mariadb-min', 3306))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+import asyncio
+import contextlib
+import os
+import subprocess
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import kopf
+
+import wp_operator
+from wp_operator import MediaRestoreOperator, ParallelMediaRestoreOperator
+
+
+class FakeCluster:
+    """Runs the pods of `ParallelMediaRestoreOperator` as soon as they get created; `broken` shards fail."""
+    def __init__(self, shards):
+        self.shards = shards
+        self.broken = set()
+        self.pods = {}      # name → (phase, log)
+        self.created = []   # The shards of each worker pod
+
+    def create_namespaced_pod(self, namespace, body):
+        command = body.spec.containers[0].command
+        if command[3] == "plan-media":
+            phase, log = "Succeeded", "".join(f"SHARD\t{shard}\t{files}\t{size}\n"
+                                               for shard, (files, size) in self.shards.items())
+        else:
+            shards = command[6:]
+            self.created.append(shards)
+            phase, log = "Succeeded", ""
+            for shard in shards:
+                if shard in self.broken:
+                    phase = "Failed"
+                    break
+                log += f"DONE\t{shard}\n"
+        self.pods[body.metadata.name] = (phase, log)
+
+    def pod(self, name):
+        return SimpleNamespace(metadata=SimpleNamespace(name=name),
+                               status=SimpleNamespace(phase=self.pods[name][0], container_statuses=[]))
+
+    def list_namespaced_pod(self, namespace, label_selector):
+        return SimpleNamespace(items=[self.pod(name) for name in self.pods])
+
+    def read_namespaced_pod_log(self, namespace, name):
+        return self.pods[name][1]
+
+    def delete_namespaced_pod(self, namespace, name):
+        del self.pods[name]
+
+
+class FakeWatch:
+    def stream(self, func, **kwargs):
+        for pod in list(func(**{k: v for k, v in kwargs.items() if k != "timeout_seconds"}).items):
+            yield {"type": "ADDED", "object": pod}
+
+    def stop(self):
+        pass
+
+
+class AsyncFakeCluster:
+    """`FakeCluster` as `AsyncKubernetesAPI.core`."""
+    def __init__(self, cluster):
+        self._cluster = cluster
+
+    def __getattr__(self, name):
+        method = getattr(self._cluster, name)
+
+        async def call(**kwargs):
+            return method(**kwargs)
+        return call
+
+
+class AsyncFakeWatch:
+    @contextlib.asynccontextmanager
+    async def stream(self, func, **kwargs):
+        pods = await func(**{k: v for k, v in kwargs.items() if k != "timeout_seconds"})
+
+        async def events():
+            for pod in list(pods.items):
+                yield {"type": "ADDED", "object": pod}
+        yield events()
+
+
+class TestMediaRestore(unittest.TestCase):
+    def test_failure_without_log(self):
+        terminated = SimpleNamespace(exit_code=23, message="rsync: [sender] change_dir \"/wp-media-data-source/lab\" "
+                                                          "failed: No such file or directory (2)")
+        pod = SimpleNamespace(metadata=SimpleNamespace(name="lab-media-restore-pod"),
+                              status=SimpleNamespace(phase="Failed", container_statuses=[
+                                  SimpleNamespace(state=SimpleNamespace(terminated=terminated))]))
+        core = mock.Mock()
+        core.read_namespaced_pod_log.side_effect = wp_operator.ApiException(status=403, reason="Forbidden")
+        watch = mock.Mock()
+        watch.return_value.stream.return_value = [{"type": "ADDED", "object": pod}]
+        with mock.patch.object(wp_operator, "KubernetesAPI", SimpleNamespace(core=core)), \
+             mock.patch.object(wp_operator.kubernetes.watch, "Watch", watch), \
+             mock.patch.multiple(wp_operator.Config, create=True, media_restore_timeout=60):
+            restore = MediaRestoreOperator(namespace="wordpress", wp_name="lab", source_pvc="old-media",
+                                           source_subdir="lab", dest_pvc="media", dest_subdir="lab", owner={})
+            with self.assertLogs(level="WARNING"), self.assertRaises(kopf.PermanentError) as caught:
+                restore._wait_pod()
+        self.assertIn("exit code 23", str(caught.exception))
+        self.assertIn("No such file or directory", str(caught.exception))
+
+
+class TestParallelMediaRestore(unittest.TestCase):
+    def test_split_shards(self):
+        shards = {'2023/01': [10, 900], '2023/02': [5, 500], '2023/03': [4, 400], '.': [1, 100]}
+        split = ParallelMediaRestoreOperator.split_shards(shards, 2)
+        self.assertEqual(split, [['2023/01', '.'], ['2023/02', '2023/03']])
+
+    def run_plan_script(self, directory):
+        return subprocess.run(["/bin/sh", "-c", ParallelMediaRestoreOperator._plan_script, "plan-media", directory],
+                              capture_output=True, text=True)
+
+    def test_plan_script(self):
+        with tempfile.TemporaryDirectory() as media:
+            for path, size in (("2023/01/a.jpg", 10), ("2023/01/thumbs/a-150x150.jpg", 5),
+                               ("2023/02/with space.pdf", 100), ("2023/1x/b.jpg", 1),
+                               ("fonts/c.woff", 20), ("d.txt", 3)):
+                os.makedirs(os.path.join(media, os.path.dirname(path)), exist_ok=True)
+                with open(os.path.join(media, path), "wb") as f:
+                    f.write(b"x" * size)
+            result = self.run_plan_script(media + "/")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(ParallelMediaRestoreOperator._parse_plan("plan", result.stdout),
+                         {'2023/01': [2, 15], '2023/02': [1, 100], '.': [3, 24]})
+
+    def test_plan_failures(self):
+        result = self.run_plan_script("/nonexistent/")
+        self.assertNotEqual(result.returncode, 0)
+        with tempfile.TemporaryDirectory() as media:
+            result = self.run_plan_script(media)
+        self.assertEqual(result.returncode, 0)
+        with self.assertRaises(kopf.PermanentError):
+            ParallelMediaRestoreOperator._parse_plan("plan", result.stdout)
+
+    def test_more_workers_than_shards(self):
+        split = ParallelMediaRestoreOperator.split_shards({'2024/12': [1, 1]}, 8)
+        self.assertEqual(split, [['2024/12']])
+        self.assertEqual(ParallelMediaRestoreOperator.split_shards({}, 8), [])
+
+    def setUp(self):
+        self.cluster = FakeCluster({'2023/01': [10, 900], '2023/02': [5, 500], '2023/03': [4, 400], '.': [1, 100]})
+        for patcher in (mock.patch.object(wp_operator, "KubernetesAPI", SimpleNamespace(core=self.cluster)),
+                        mock.patch.object(wp_operator, "AsyncKubernetesAPI",
+                                          SimpleNamespace(core=AsyncFakeCluster(self.cluster))),
+                        mock.patch.object(wp_operator.kubernetes.watch, "Watch", FakeWatch),
+                        mock.patch.object(wp_operator.kubernetes_asyncio.watch, "Watch", AsyncFakeWatch),
+                        mock.patch.multiple(wp_operator.Config, create=True, media_restore_timeout=60,
+                                            image_pull_secret="", image_for_restore="rsync")):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.statuses = []
+
+    def operator(self, previous_status):
+        return ParallelMediaRestoreOperator(
+            workers=2, previous_status=previous_status,
+            set_status=lambda status: self.statuses.append(dict(status)),
+            namespace="wordpress", wp_name="lab", source_pvc="old-media", source_subdir="lab",
+            dest_pvc="media", dest_subdir="lab", owner={})
+
+    def check_retry_resumes(self, restore):
+        cluster = self.cluster
+        # The second shard of the worker that gets 2023/02 and 2023/03 fails
+        cluster.broken = {'2023/03'}
+        with self.assertRaises(kopf.TemporaryError):
+            restore(None)
+        self.assertEqual(cluster.created, [['2023/01', '.'], ['2023/02', '2023/03']])
+        self.assertEqual(sorted(self.statuses[-1]["shardsDone"]), ['.', '2023/01', '2023/02'])
+        # Only the failed pod is left
+        self.assertEqual([name.rsplit('-', 1)[0] for name in cluster.pods], ["lab-media-restore-1"])
+
+        # The retry (e.g. by `RestoreQueue`) only copies what is left, after cleaning up
+        cluster.broken = set()
+        restore(self.statuses[-1])
+        self.assertEqual(cluster.created[2:], [['2023/03']])
+        self.assertEqual(len(self.statuses[-1]["shardsDone"]), 4)
+        self.assertEqual((self.statuses[-1]["bytesDone"], self.statuses[-1]["bytesTotal"]), (1900, 1900))
+        self.assertEqual(cluster.pods, {})
+
+    def test_retry_resumes(self):
+        self.check_retry_resumes(lambda previous_status: self.operator(previous_status).run_pod())
+
+    def test_unreadable_logs(self):
+        # Without the logs, there is no telling what got copied
+        self.cluster.read_namespaced_pod_log = mock.Mock(
+            side_effect=wp_operator.ApiException(status=403, reason="Forbidden"))
+        with self.assertRaises(wp_operator.ApiException):
+            self.operator(None).run_pod()
+        self.assertEqual(self.cluster.created, [])
+
+    def test_retry_resumes_async(self):
+        self.check_retry_resumes(lambda previous_status: asyncio.run(self.operator(previous_status).run_pod_async()))
+
+if __name__ == '__main__':
+    unittest.main()
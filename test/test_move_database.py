@@ -0,0 +1,125 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import wp_operator
+from wp_operator import WordPressSiteOperator
+
+# Plays `mariadb-dump` and `mariadb` (argv[1]) against the servers in $FAKE_MARIADB_STATE,
+# a {host: {database: [tables]}} JSON file.
+FAKE_MARIADB = r"""
+import json, os, re, sys
+with open(os.environ["FAKE_MARIADB_STATE"]) as f:
+    state = json.load(f)
+program, args = sys.argv[1], sys.argv[2:]
+host = args[args.index("-h") + 1]
+positional = [a for i, a in enumerate(args) if not a.startswith("-") and args[i - 1] not in ("-h", "-u")]
+if program == "mariadb-dump":
+    [db] = positional
+    if db not in state.get(host, {}):
+        sys.exit(f"mariadb-dump: Got error: 1049: Unknown database '{db}'")
+    print(f"CREATE DATABASE /*!32312 IF NOT EXISTS*/ `{db}`;")
+    print(f"USE `{db}`;")
+    for table in state[host][db]:
+        print(f"CREATE TABLE `{table}` (id int);")
+    sys.exit(0)
+
+databases = state.setdefault(host, {})
+current = positional[0] if positional else None
+if current is not None and current not in databases:
+    sys.exit(f"ERROR 1049 (42000): Unknown database '{current}'")
+for line in sys.stdin:
+    if m := re.match(r"CREATE DATABASE .*`(.*)`;", line):
+        databases.setdefault(m.group(1), [])
+    elif m := re.match(r"USE `(.*)`;", line):
+        if m.group(1) not in databases:
+            sys.exit(f"ERROR 1049 (42000): Unknown database '{m.group(1)}'")
+        current = m.group(1)
+    elif m := re.match(r"CREATE TABLE `(.*)`", line):
+        if current is None:
+            sys.exit("ERROR 1046 (3D000): No database selected")
+        databases[current].append(m.group(1))
+with open(os.environ["FAKE_MARIADB_STATE"], "w") as f:
+    json.dump(state, f)
+"""
+
+
+class TestMoveDatabase(unittest.TestCase):
+    def setUp(self):
+        self.state_file = os.path.join(tempfile.mkdtemp(), "state.json")
+        with open(self.state_file, "w") as f:
+            json.dump({"mariadb-old": {"wp-db-lab": ["wp_posts", "wp_options"]}}, f)
+        real_popen = subprocess.Popen
+
+        def fake_popen(cmdline, **kwargs):
+            kwargs["env"] = dict(kwargs["env"], FAKE_MARIADB_STATE=self.state_file)
+            return real_popen([sys.executable, "-c", FAKE_MARIADB] + cmdline, **kwargs)
+        for patcher in (mock.patch.object(wp_operator.subprocess, "Popen", fake_popen),
+                        mock.patch.object(wp_operator.subprocess, "run"),
+                        mock.patch.object(wp_operator.MariaDB, "get_cached",
+                                          lambda namespace, name: mock.Mock(service_name=name,
+                                                                            root_password="secret"))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sql_run = wp_operator.subprocess.run
+        self.sql_run.return_value = subprocess.CompletedProcess([], 0, stdout="12\n34\n", stderr="")
+
+        self.op = WordPressSiteOperator.__new__(WordPressSiteOperator)
+        self.op.wp = mock.Mock(namespace="wordpress", moniker="wordpress/lab")
+        self.op.wp.name = "lab"
+        self.op.prefix = {"db": "wp-db-", "user": "wp-user-", "grant": "wp-grant-"}
+        self.op.ownerReferences = {}
+        self.op.placer = mock.Mock()
+        for method in ("create_grant", "create_user", "create_ingress", "_waitMariaDBObjectReady"):
+            setattr(self.op, method, mock.Mock())
+
+    def databases(self, host):
+        with open(self.state_file) as f:
+            return json.load(f).get(host, {})
+
+    def test_move_creates_the_target_database(self):
+        self.op.move_database("mariadb-old", "mariadb-new")
+
+        self.assertEqual(self.databases("mariadb-new"), {"wp-db-lab": ["wp_posts", "wp_options"]})
+        # Writes were revoked on the source, beyond what the Grant says, and open sessions killed
+        self.op.create_grant.assert_any_call(privileges=["SELECT"])
+        [revoke, list_sessions, kill] = self.sql_run.call_args_list
+        self.assertEqual(revoke.args[0][:3], ["mariadb", "-h", "mariadb-old"])
+        self.assertIn("REVOKE ALL PRIVILEGES ON `wp-db-lab`.* FROM 'wp-user-lab'@'%'", revoke.args[0][-1])
+        self.assertIn("WHERE user = 'wp-user-lab'", list_sessions.args[0][-1])
+        self.assertEqual(kill.args[0][-1], "KILL CONNECTION 12; KILL CONNECTION 34")
+        self.op.placer.move_database.assert_called_once()
+        self.assertEqual(self.op.mariadb_name, "mariadb-new")
+        # The copy left behind is on record
+        self.op.wp.status_set_key.assert_called_once_with("databaseLeftBehind", mock.ANY)
+        self.assertEqual(self.op.wp.status_set_key.call_args.args[1]["mariadb"], "mariadb-old")
+
+    def test_failed_copy_thaws(self):
+        with open(self.state_file, "w") as f:
+            json.dump({"mariadb-old": {}}, f)   # mariadb-dump fails, as there is nothing to dump
+        with self.assertLogs(level="ERROR"), self.assertRaises(Exception):
+            self.op.move_database("mariadb-old", "mariadb-new")
+        self.assertEqual(self.op.create_grant.call_args_list[-1], mock.call())
+        self.op.placer.move_database.assert_not_called()
+
+    def test_failed_flip_goes_back(self):
+        def wait_ready(kind, name):
+            if kind == "grants" and self.op.mariadb_name == "mariadb-new":
+                raise TimeoutError("The Grant on the target never gets Ready")
+        self.op._waitMariaDBObjectReady.side_effect = wait_ready
+        with self.assertLogs(level="ERROR"), self.assertRaises(TimeoutError):
+            self.op.move_database("mariadb-old", "mariadb-new")
+        self.assertEqual([call.args[4] for call in self.op.placer.move_database.call_args_list],
+                         ["mariadb-new", "mariadb-old"])
+        self.assertEqual(self.op.mariadb_name, "mariadb-old")
+        self.assertEqual(self.op.create_grant.call_args_list[-1], mock.call())
+        self.op.create_ingress.assert_called_once()   # Only on the way back
+        self.op.wp.status_set_key.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
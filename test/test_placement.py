@@ -0,0 +1,133 @@
+import json
+import tempfile
+import unittest
+from placement import PlacementIndex, PlacementStrategy, MetricsSource, FileMetricsSource
+from wp_operator import MariaDBPlacer
+
+
+class TestPlacementIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = PlacementIndex()
+        for mariadb in ['mariadb-a', 'mariadb-b', 'mariadb-c']:
+            self.index.add_mariadb('namespace-test', mariadb)
+
+    def test_least_populated(self):
+        self.index.add_database('namespace-test', 'db1', 'mariadb-a')
+        self.index.add_database('namespace-test', 'db2', 'mariadb-b')
+        self.assertEqual(self.index.least_populated('namespace-test'), 'mariadb-c')
+
+        self.index.add_database('namespace-test', 'db3', 'mariadb-c')
+        self.index.add_database('namespace-test', 'db4', 'mariadb-c')
+        self.index.remove_database('namespace-test', 'db1')
+        self.assertEqual(self.index.least_populated('namespace-test'), 'mariadb-a')
+
+    def test_duplicate_events(self):
+        self.assertTrue(self.index.add_database('namespace-test', 'db1', 'mariadb-a'))
+        self.assertFalse(self.index.add_database('namespace-test', 'db1', 'mariadb-a'))
+        self.assertEqual(self.index.count('namespace-test', 'mariadb-a'), 1)
+        self.assertEqual(self.index.remove_database('namespace-test', 'db1'), 'mariadb-a')
+        self.assertIsNone(self.index.remove_database('namespace-test', 'db1'))
+        self.assertEqual(self.index.count('namespace-test', 'mariadb-a'), 0)
+
+    def test_moved_database(self):
+        self.index.add_database('namespace-test', 'db1', 'mariadb-a')
+        self.assertTrue(self.index.add_database('namespace-test', 'db1', 'mariadb-b'))
+        self.assertEqual(self.index.count('namespace-test', 'mariadb-a'), 0)
+        self.assertEqual(self.index.databases_on('namespace-test', 'mariadb-b'), ['db1'])
+
+    def test_removed_mariadb(self):
+        self.index.add_database('namespace-test', 'db1', 'mariadb-b')
+        self.index.add_database('namespace-test', 'db2', 'mariadb-c')
+        self.index.remove_mariadb('namespace-test', 'mariadb-a')
+        self.assertIn(self.index.least_populated('namespace-test'), ['mariadb-b', 'mariadb-c'])
+        self.assertIsNone(self.index.least_populated('other-namespace'))
+
+
+class TestMariaDBPlacerEvents(unittest.TestCase):
+    def setUp(self):
+        self.placer = MariaDBPlacer()
+
+    def test_parked_until_mariadb_shows_up(self):
+        self.placer._on_database_event('ADDED', 'namespace-test', 'db1', 'mariadb-a')
+        self.placer._on_database_event('ADDED', 'namespace-test', 'db2', 'mariadb-a')
+        self.placer._on_database_event('DELETED', 'namespace-test', 'db2', 'mariadb-a')
+        self.assertEqual(self.placer._index.count('namespace-test', 'mariadb-a'), 0)
+
+        self.placer._on_mariadb_event('ADDED', 'namespace-test', 'mariadb-a', {'wp-auto-allocate': 'true'})
+        self.assertEqual(self.placer._index.count('namespace-test', 'mariadb-a'), 1)
+
+    def test_not_auto_allocated(self):
+        self.placer._on_database_event('ADDED', 'namespace-test', 'db1', 'mariadb-z')
+        self.placer._on_mariadb_event('ADDED', 'namespace-test', 'mariadb-z', {})
+        self.placer._on_database_event('ADDED', 'namespace-test', 'db2', 'mariadb-z')
+        self.assertIsNone(self.placer._index.least_populated('namespace-test'))
+        self.assertIsNone(self.placer._index.mariadb_of('namespace-test', 'db1'))
+
+
+class FakeMetricsSource(MetricsSource):
+    def __init__(self, metrics):
+        self._metrics = metrics
+
+    def _all(self):
+        return self._metrics
+
+
+class TestPlacementStrategy(unittest.TestCase):
+    def setUp(self):
+        self.index = PlacementIndex()
+        for mariadb, count in [('mariadb-a', 1), ('mariadb-b', 2), ('mariadb-c', 3)]:
+            self.index.add_mariadb('namespace-test', mariadb)
+            for i in range(count):
+                self.index.add_database('namespace-test', f'{mariadb}-db{i}', mariadb)
+        self.metrics = FakeMetricsSource({
+            'namespace-test/mariadb-a': {'data_size_bytes': 9000, 'qps': 50},
+            'namespace-test/mariadb-b': {'data_size_bytes': 1000, 'qps': 10},
+            'namespace-test/mariadb-c': {'data_size_bytes': 2000},
+        })
+
+    def choose(self, spec):
+        return PlacementStrategy.parse(spec).choose('namespace-test', self.index, self.metrics)
+
+    def test_count(self):
+        self.assertEqual(self.choose('count'), ('mariadb-a', {'mariadb-a': 1, 'mariadb-b': 2, 'mariadb-c': 3}))
+
+    def test_data_size(self):
+        self.assertEqual(self.choose('data_size')[0], 'mariadb-b')
+
+    def test_missing_metrics_are_averaged(self):
+        mariadb, scores = self.choose('qps')
+        self.assertEqual(mariadb, 'mariadb-b')
+        self.assertEqual(scores['mariadb-c'], 30)
+
+    def test_weighted(self):
+        self.assertEqual(self.choose('count:1,data_size:1')[0], 'mariadb-b')
+        self.assertEqual(str(PlacementStrategy.parse('count:1,qps:2')), 'count:1,qps:2')
+        with self.assertRaises(ValueError):
+            PlacementStrategy.parse('colour')
+
+    def test_plan_moves(self):
+        for i in range(3, 6):
+            self.index.add_database('namespace-test', f'mariadb-c-db{i}', 'mariadb-c')
+        strategy = PlacementStrategy.parse('count')
+        self.assertEqual(strategy.plan_moves('namespace-test', self.index, self.metrics),
+                         [('mariadb-c-db0', 'mariadb-c', 'mariadb-a')])
+        self.assertEqual(strategy.plan_moves('namespace-test', self.index, self.metrics,
+                                             movable=lambda db: db != 'mariadb-c-db0'),
+                         [('mariadb-c-db1', 'mariadb-c', 'mariadb-a')])
+
+    def test_plan_no_moves_when_balanced(self):
+        strategy = PlacementStrategy.parse('count')
+        self.assertEqual(strategy.plan_moves('namespace-test', self.index, self.metrics, tolerance=5), [])
+        self.index.add_database('namespace-test', 'extra', 'mariadb-a')   # 2, 2, 3
+        self.assertEqual(strategy.plan_moves('namespace-test', self.index, self.metrics), [])
+
+    def test_metrics_from_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump({'namespace-test/mariadb-a': {'qps': 1}}, f)
+            f.flush()
+            self.assertEqual(MetricsSource.from_location(f.name).get('namespace-test', 'mariadb-a'), {'qps': 1})
+            self.assertIsInstance(MetricsSource.from_location(f.name), FileMetricsSource)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+import concurrent.futures
+import threading
+import unittest
+from unittest import mock
+
+from restore_cache import RestoredSnapshotCache
+from wp_operator import WordPressSiteOperator
+
+
+class TestRestoredSnapshotCache(unittest.TestCase):
+    def setUp(self):
+        self.dropped = []
+
+    def cache(self, ttl=3600, max_entries=10):
+        return RestoredSnapshotCache(drop=lambda snapshot: self.dropped.append(snapshot.database),
+                                     ttl=ttl, max_entries=max_entries)
+
+    def restore(self, cache, database, source="mariadb-old"):
+        (snapshot, must_restore) = cache.acquire("wordpress", database, source, f"{database}-restore")
+        if must_restore:
+            cache.restored(snapshot)
+        cache.release(snapshot)
+        return must_restore
+
+    def test_reuse(self):
+        cache = self.cache()
+        self.assertTrue(self.restore(cache, "wp_lab"))
+        self.assertFalse(self.restore(cache, "wp_lab"))
+        self.assertTrue(self.restore(cache, "wp_lab", source="mariadb-other"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(self.dropped, [])
+
+    def test_reuse_is_logged(self):
+        # The snapshot may come from an older backup than the latest; say so
+        op = WordPressSiteOperator.__new__(WordPressSiteOperator)
+        op.wp = mock.Mock(namespace="wordpress", moniker="wordpress/lab")
+        op.restored_snapshots = self.cache()
+        restore = {"wpDbBackupRef": {"mariaDBLookup": {"databaseNameSource": "wp_lab",
+                                                       "mariadbNameSource": "mariadb-old"}}}
+        self.restore(op.restored_snapshots, "wp_lab", source="mariadb-old")
+        with self.assertLogs(level="WARNING") as logs:
+            (snapshot, must_restore) = op._acquire_restored_snapshot(restore)
+        self.assertFalse(must_restore)
+        self.assertIn("reusing wordpress/wp_lab (from mariadb-old), restored at", logs.output[0])
+
+    def test_in_flight_restore_is_shared(self):
+        cache = self.cache()
+        (first, must_restore) = cache.acquire("wordpress", "wp_lab", "mariadb-old", "wp_lab-restore")
+        self.assertTrue(must_restore)
+        results = []
+
+        def second():
+            results.append(cache.acquire("wordpress", "wp_lab", "mariadb-old", "wp_lab-restore"))
+        waiter = threading.Thread(target=second)
+        waiter.start()
+        waiter.join(0.1)
+        self.assertEqual(results, [])   # Still waiting
+        cache.restored(first)
+        waiter.join(5)
+        self.assertEqual(results, [(first, False)])
+        self.assertEqual(first.refs, 2)
+
+    def test_in_flight_restore_is_shared_async(self):
+        cache = self.cache()
+        (first, _) = cache.acquire("wordpress", "wp_lab", "mariadb-old", "wp_lab-restore")
+
+        async def main():
+            # With a single executor thread, waiting must not hold it
+            asyncio.get_running_loop().set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=1))
+            waiter = asyncio.create_task(cache.acquire_async("wordpress", "wp_lab", "mariadb-old", "wp_lab-restore"))
+            await asyncio.sleep(0.1)
+            self.assertFalse(waiter.done())
+            self.assertEqual(await asyncio.wait_for(asyncio.to_thread(lambda: "free"), 1), "free")
+            threading.Timer(0.1, cache.restored, [first]).start()
+            return await asyncio.wait_for(waiter, 5)
+
+        self.assertEqual(asyncio.run(main()), (first, False))
+        self.assertEqual(first.refs, 2)
+
+    def test_failed_restore(self):
+        cache = self.cache()
+        (first, _) = cache.acquire("wordpress", "wp_lab", "mariadb-old", "wp_lab-restore")
+        cache.failed(first, RuntimeError("S3 is down"))
+        self.assertTrue(self.restore(cache, "wp_lab"))
+
+    def test_eviction(self):
+        cache = self.cache(max_entries=2)
+        for database in ("wp_a", "wp_b", "wp_c"):
+            self.restore(cache, database)
+        self.assertEqual(self.dropped, ["wp_a"])
+        self.assertFalse(self.restore(cache, "wp_b"))   # Now more recently used than wp_c
+        self.restore(cache, "wp_d")
+        self.assertEqual(self.dropped, ["wp_a", "wp_c"])
+
+        uncached = self.cache(ttl=0)
+        self.restore(uncached, "wp_a")
+        self.assertEqual(self.dropped[-1], "wp_a")
+        self.assertEqual(uncached.stats()["snapshots"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
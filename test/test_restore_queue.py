@@ -0,0 +1,93 @@
+import threading
+import time
+import unittest
+from restore_queue import RestoreQueue, RestoreJob
+
+
+class TestRestoreQueue(unittest.TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.running = []
+        self.peak = {}
+        self.release = threading.Event()
+        self.attempts = []
+
+    def run_job(self, job):
+        with self.lock:
+            self.running.append(job)
+            for key, count in (("all", len(self.running)),
+                               (("source", job.source), sum(1 for j in self.running if j.source == job.source)),
+                               (("target", job.target), sum(1 for j in self.running if j.target == job.target))):
+                self.peak[key] = max(self.peak.get(key, 0), count)
+        self.release.wait(5)
+        with self.lock:
+            self.running.remove(job)
+        self.attempts.append((job.name, job.attempt))
+        if job.name == "broken" or (job.name == "flaky" and job.attempt == 1):
+            raise RuntimeError("boom")
+
+    def wait_for(self, queue, finished):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            stats = queue.stats()
+            if stats.get("succeeded", 0) + stats.get("failed", 0) == finished:
+                return stats
+            time.sleep(0.01)
+        self.fail(f"Only {stats} after 5 seconds")
+
+    def test_limits(self):
+        queue = RestoreQueue(self.run_job, max_concurrent=3, max_per_source=1, max_per_target=2)
+        jobs = [RestoreJob("wordpress", f"site-{i}", source=f"mariadb-old-{i % 2}", target=f"mariadb-{i % 3}")
+                for i in range(12)]
+        queue.start()
+        for job in jobs:
+            queue.enqueue(job)
+        # Let the first wave start, then everything else go through
+        threading.Timer(0.2, self.release.set).start()
+        stats = self.wait_for(queue, len(jobs))
+        queue.stop()
+
+        self.assertLessEqual(self.peak["all"], 3)
+        for key, peak in self.peak.items():
+            if key != "all" and key[0] == "source":
+                self.assertEqual(peak, 1)
+            elif key != "all":
+                self.assertLessEqual(peak, 2)
+        self.assertEqual(stats["succeeded"], 12)
+
+    def test_duplicates_and_failures(self):
+        queue = RestoreQueue(self.run_job, max_concurrent=2, max_per_source=2, max_per_target=2)
+        job = RestoreJob("wordpress", "broken", source=None, target="mariadb-0")
+        self.assertTrue(queue.enqueue(job))
+        self.assertFalse(queue.enqueue(job))
+        self.release.set()
+        with self.assertLogs(level="ERROR"):
+            queue.start()
+            stats = self.wait_for(queue, 1)
+        queue.stop()
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["running"], 0)
+
+    def test_retries(self):
+        queue = RestoreQueue(self.run_job, max_concurrent=2, max_per_source=2, max_per_target=2,
+                             max_attempts=3, retry_delay=0.05)
+        self.release.set()
+        started = time.monotonic()
+        with self.assertLogs(level="WARNING") as logs:
+            queue.start()
+            queue.enqueue(RestoreJob("wordpress", "flaky", source=None, target="mariadb-0"))
+            queue.enqueue(RestoreJob("wordpress", "broken", source=None, target="mariadb-0"))
+            stats = self.wait_for(queue, 5)   # 2 attempts of "flaky", 3 of "broken"
+        queue.stop()
+
+        self.assertEqual(sorted(self.attempts),
+                         [("broken", 1), ("broken", 2), ("broken", 3), ("flaky", 1), ("flaky", 2)])
+        self.assertEqual((stats["succeeded"], stats["failed"], stats["retried"]), (1, 4, 3))
+        self.assertEqual((stats["queued"], stats["waiting_retry"]), (0, 0))
+        # Backing off: 0.05s, then 0.1s before the third attempt of "broken"
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+        self.assertIn("attempt 3 of 3", "\n".join(logs.output))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,41 +1,36 @@
 import unittest
+from unittest import mock
+
+import wp_operator
 from wp_operator import RouteController
 
 
 class TestRouteController(unittest.TestCase):
     def setUp(self):
         self.controller = RouteController()
-        self.controller._routes_by_namespace = {
-            'namespace-test': {
-                'route_root': {
-                    'spec': {
-                        'host': 'www.example.com',
-                        'to': {'name': 'service1'}
-                    }
-                },
-                'route_foo': {
-                    'spec': {
-                        'host': 'www.example.com',
-                        'path': '/foo',
-                        'to': {'name': 'service2'}
-                    }
-                },
-                'route_foo_bar': {
-                    'spec': {
-                        'host': 'www.example.com',
-                        'path': '/foo/bar',
-                        'to': {'name': 'service3'}
-                    }
-                },
-                'route_foo_bar_sanka': {
-                    'spec': {
-                        'host': 'www.example.com',
-                        'path': '/foo/bar/sanka/',
-                        'to': {'name': 'service4'}
-                    }
-                }
+        routes = {
+            'route_root': {
+                'host': 'www.example.com',
+                'to': {'name': 'service1'}
+            },
+            'route_foo': {
+                'host': 'www.example.com',
+                'path': '/foo',
+                'to': {'name': 'service2'}
+            },
+            'route_foo_bar': {
+                'host': 'www.example.com',
+                'path': '/foo/bar',
+                'to': {'name': 'service3'}
+            },
+            'route_foo_bar_sanka': {
+                'host': 'www.example.com',
+                'path': '/foo/bar/sanka/',
+                'to': {'name': 'service4'}
             }
         }
+        for name, spec in routes.items():
+            self.controller._on_route_event('ADDED', 'namespace-test', name, spec)
 
     def test_get_closest_parent_route_match_route_root(self):
         result = self.controller._get_closest_parent_route('namespace-test', 'www.example.com', '/fooooo')
@@ -100,6 +95,85 @@ class TestRouteController(unittest.TestCase):
         result = self.controller._get_closest_parent_route('namespace-test', 'www.example.fi', '/foo/drebin')
         self.assertIsNone(result)
 
+    def test_get_closest_parent_route_no_partial_segment_match(self):
+        result = self.controller._get_closest_parent_route('namespace-test', 'www.example.com', '/foo/barbar')
+        self.assertEqual(result['name'], 'route_foo')
+
+    def test_get_closest_parent_route_after_delete(self):
+        self.controller._on_route_event('DELETED', 'namespace-test', 'route_foo_bar', {})
+        result = self.controller._get_closest_parent_route('namespace-test', 'www.example.com', '/foo/bar/suomi')
+        self.assertEqual(result['name'], 'route_foo')
+
+    def test_get_closest_parent_route_after_path_change(self):
+        self.controller._on_route_event('MODIFIED', 'namespace-test', 'route_foo_bar', {'path': '/elsewhere'})
+        result = self.controller._get_closest_parent_route('namespace-test', 'www.example.com', '/foo/bar/suomi')
+        self.assertEqual(result['name'], 'route_foo')
+        result = self.controller._get_closest_parent_route('namespace-test', 'www.example.com', '/elsewhere/x')
+        self.assertEqual(result['spec'], {'host': 'www.example.com', 'path': '/elsewhere', 'to': {'name': 'service3'}})
+
+    def test_redundant_routes(self):
+        for name, path, service in [('wp-route-child', '/foo/bar/sanka/child', 'service4'),
+                                    ('wp-route-other', '/foo/bar/sanka/other', 'service9'),
+                                    ('not-ours', '/foo/bar/sanka/not-ours', 'service4'),
+                                    ('wp-route-grandchild', '/foo/bar/sanka/other/grandchild', 'service4')]:
+            self.controller._on_route_event('ADDED', 'namespace-test', name,
+                                            {'host': 'www.example.com', 'path': path, 'to': {'name': service}})
+        self.assertEqual(self.controller.redundant_routes('namespace-test'),
+                         [('wp-route-child', 'route_foo_bar_sanka')])
+        self.assertEqual(self.controller.consolidate('namespace-test', dry_run=True), 1)
+        self.assertIsNotNone(self.controller._routes_at('namespace-test').get('wp-route-child'))
+
+    def test_create_route_skips_unchanged(self):
+        with self.controller.ready.warming_up():
+            pass
+        patcher = mock.patch.object(wp_operator, 'KubernetesAPI')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Another Route at the same URL, to another service, so that the site's own Route is not the closest parent
+        self.controller._on_route_event('ADDED', 'namespace-test', 'lab-legacy',
+                                        {'host': 'www.example.org', 'path': '/lab', 'to': {'name': 'legacy'}})
+        owner = {'apiVersion': 'wordpress.epfl.ch/v2', 'kind': 'WordpressSite', 'name': 'lab', 'uid': '1234'}
+        with mock.patch.object(wp_operator, 'server_side_apply') as apply:
+            self.controller.create_route('namespace-test', 'lab', 'wp-route-lab', 'www.example.org', '/lab',
+                                         'wp-nginx', owner)
+            self.assertEqual(apply.call_count, 1)
+            [body] = [call.args[1] for call in apply.call_args_list]
+
+        # What the watch then sees: defaults filled in, empty fields left out
+        live = dict(body, metadata=dict(body['metadata'], uid='5678', resourceVersion='42'),
+                    spec={k: v for k, v in body['spec'].items() if k != 'alternateBackends'})
+        live['spec']['to'] = dict(live['spec']['to'], weight=100)
+        live['spec']['tls'] = {k: v for k, v in live['spec']['tls'].items() if v}
+        self.controller._on_route_event('MODIFIED', 'namespace-test', 'wp-route-lab', live['spec'], live)
+
+        with mock.patch.object(wp_operator, 'server_side_apply') as apply:
+            self.controller.create_route('namespace-test', 'lab', 'wp-route-lab', 'www.example.org', '/lab',
+                                         'wp-nginx', owner)
+            self.assertEqual(apply.call_count, 0)
+            self.controller.create_route('namespace-test', 'lab', 'wp-route-lab', 'www.example.org', '/lab',
+                                         'wp-nginx', dict(owner, uid='4321'))
+            self.assertEqual(apply.call_count, 1)
+
+    def test_create_route_failure_is_not_recorded(self):
+        with self.controller.ready.warming_up():
+            pass
+        patcher = mock.patch.object(wp_operator, 'KubernetesAPI')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        owner = {'apiVersion': 'wordpress.epfl.ch/v2', 'kind': 'WordpressSite', 'name': 'lab', 'uid': '1234'}
+        with mock.patch.object(wp_operator, 'server_side_apply',
+                               side_effect=wp_operator.ApiException(status=422)), \
+             self.assertLogs(level='ERROR'), self.assertRaises(wp_operator.ApiException):
+            self.controller.create_route('namespace-test', 'lab', 'wp-route-lab', 'www.example.org', '/lab',
+                                         'wp-nginx', owner)
+        self.assertIsNone(self.controller._routes_at('namespace-test').get('wp-route-lab'))
+        self.assertIsNone(self.controller._get_closest_parent_route('namespace-test', 'www.example.org', '/lab/x'))
+
+        with mock.patch.object(wp_operator, 'server_side_apply') as apply:
+            self.controller.create_route('namespace-test', 'lab', 'wp-route-lab', 'www.example.org', '/lab',
+                                         'wp-nginx', owner)
+            self.assertEqual(apply.call_count, 1)
+
 
 if __name__ == '__main__':
     unittest.main()
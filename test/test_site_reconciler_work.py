@@ -0,0 +1,91 @@
+import re
+import unittest
+from unittest import mock
+
+import kopf
+
+from wp_operator import SiteReconcilerWork
+
+
+def parse_str_to_argv(arguments):
+    """A port of WP-CLI's `WP_CLI\\Utils\\parse_str_to_argv()`, which `WP_CLI::runcommand()` splits with."""
+    matches = re.finditer(r"""(?:--[^\s=]+=(["'])((\\{2})*|(?:[^\1]+?[^\\](\\{2})*))\1|--[^\s=]+=[^\s]+|--[^\s=]+|(["'])((\\{2})*|(?:[^\5]+?[^\\](\\{2})*))\5|[^\s]+)""",
+                          arguments)
+    argv = []
+    for arg in (m.group(0) for m in matches):
+        for char in ('"', "'"):
+            if arg[:1] == char and arg[-1:] == char:
+                arg = arg[1:-1]
+                break
+        argv.append(arg)
+    return argv
+
+
+class TestSiteReconcilerWork(unittest.TestCase):
+    def setUp(self):
+        self.wp_op = mock.Mock()
+        self.work = SiteReconcilerWork(self.wp_op)
+
+    def programs(self):
+        return [step_names for _, step_names, _ in self.work._compile()]
+
+    def test_order_of_steps(self):
+        # As reconcile_plugins() queues work when activating Polylang and deactivating another plugin
+        self.work.activate_plugin("polylang")
+        self.work.set_wp_option("polylang", {"browser": 0})
+        self.work.add_language({"name": "Français", "slug": "fr", "locale": "fr_FR",
+                                "rtl": 0, "term_group": 0, "flag": "fr"})
+        self.work.delete_transient("pll_activation_redirect")
+        self.work.deactivate_plugin("hello-dolly")
+        self.work.set_wp_option("plugin:epfl_accred:unit_id", 1234)
+        self.work.update_php_status()
+
+        self.assertEqual(self.programs(), [
+            ["activate plugins polylang", "set option polylang"],
+            ["languages +fr", "delete transient pll_activation_redirect",
+             "deactivate plugins hello-dolly", "set option plugin:epfl_accred:unit_id"],
+            ["read status"]
+        ])
+
+    def test_single_program_without_plugin_changes(self):
+        self.work.set_wp_option("blogname", "Lab")
+        self.work.delete_language("de")
+        self.work.delete_language("de")
+        self.work.add_language({"name": "English", "slug": "en", "locale": "en_US",
+                                "rtl": 0, "term_group": 1, "flag": "us"})
+        self.work.delete_language("it")   # Not in the same batch, as "en" was added before it
+        self.work.update_php_status()
+        self.assertEqual(self.programs(), [["set option blogname", "languages -de, +en", "languages -it",
+                                            "read status"]])
+
+    def test_wp_cli_quoting(self):
+        for cmdline in (["plugin", "activate", "polylang", "epfl-menus"],
+                        ["option", "update", "blogname", "EPFL's lab"],
+                        ["option", "update", "blogdescription", 'The "best" lab'],
+                        ["option", "update", "blogname", "'quoted'"],
+                        ["option", "update", "blogname", ""]):
+            self.assertEqual(parse_str_to_argv(SiteReconcilerWork._wp_cli_command_line(cmdline)), cmdline)
+        with self.assertRaises(ValueError):
+            SiteReconcilerWork._wp_cli_command_line(["option", "update", "blogname", """It's "ours" """])
+
+    def test_failed_steps(self):
+        self.work.set_wp_option("blogname", "Lab")
+        self.work.delete_transient("foo")
+        self.work.update_php_status()
+        self.wp_op.wp.run_wp_eval_json.return_value = {
+            "steps": [{"name": "set option blogname", "ok": True},
+                      {"name": "delete transient foo", "ok": False, "error": "nope"},
+                      {"name": "read status", "ok": True}],
+            "status": {"plugins": {}}}
+
+        with self.assertLogs(level="ERROR") as logs, self.assertRaises(kopf.TemporaryError) as caught:
+            self.work.flush()
+        self.assertIn("delete transient foo: FAILED: nope", logs.output[0])
+        self.assertIn("delete transient foo", str(caught.exception))
+        self.assertNotIn("blogname", str(caught.exception))
+        # The status still gets recorded
+        self.wp_op.wp.status_set_key.assert_called_once_with("wordpresssite", {"plugins": {}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import io
+import unittest
+from sql_rewriter import DumpRewriter
+
+
+class TestDumpRewriter(unittest.TestCase):
+    def setUp(self):
+        self.rewriter = DumpRewriter({'https://old.epfl.ch/lab': 'https://www.epfl.ch/labs/new-lab',
+                                      'wp_old_db': 'wp-db-new'})
+
+    def rewrite(self, dump, chunk_size=7):
+        self.rewriter._chunk_size = chunk_size
+        out = io.BytesIO()
+        self.rewriter.rewrite(io.BytesIO(dump), out)
+        return out.getvalue()
+
+    def test_plain_replacement(self):
+        dump = (b"CREATE DATABASE `wp_old_db`;\n"
+                b"INSERT INTO `wp_options` VALUES (1,'home','https://old.epfl.ch/lab','yes');\n")
+        self.assertEqual(self.rewrite(dump),
+                         b"CREATE DATABASE `wp-db-new`;\n"
+                         b"INSERT INTO `wp_options` VALUES (1,'home','https://www.epfl.ch/labs/new-lab','yes');\n")
+
+    def test_serialized_lengths(self):
+        dump = (b"INSERT INTO `wp_options` VALUES "
+                b"(2,'widget','a:2:{s:3:\\\"url\\\";s:27:\\\"https://old.epfl.ch/lab/foo\\\";"
+                b"s:4:\\\"name\\\";s:3:\\\"Lab\\\";}','yes');\n")
+        self.assertEqual(self.rewrite(dump),
+                         b"INSERT INTO `wp_options` VALUES "
+                         b"(2,'widget','a:2:{s:3:\\\"url\\\";s:36:\\\"https://www.epfl.ch/labs/new-lab/foo\\\";"
+                         b"s:4:\\\"name\\\";s:3:\\\"Lab\\\";}','yes');\n")
+        self.assertEqual(self.rewriter.stats['lengths_fixed'], 1)
+
+    def test_nested_serialized_and_multibyte(self):
+        def serialized(s):
+            return b's:%d:"%s";' % (len(s), s)
+        value = serialized(serialized('https://old.epfl.ch/lab/été'.encode('utf-8')))
+        self.assertEqual(self.rewriter.rewrite_value(value),
+                         serialized(serialized('https://www.epfl.ch/labs/new-lab/été'.encode('utf-8'))))
+
+    def test_not_actually_serialized(self):
+        self.assertEqual(self.rewriter.rewrite_value(b's:99:"https://old.epfl.ch/lab";'),
+                         b's:99:"https://www.epfl.ch/labs/new-lab";')
+
+    def test_escapes_survive(self):
+        dump = b"INSERT INTO `t` VALUES ('it\\'s at https://old.epfl.ch/lab\\n\\\\');"
+        self.assertEqual(self.rewrite(dump, chunk_size=1024),
+                         b"INSERT INTO `t` VALUES ('it\\'s at https://www.epfl.ch/labs/new-lab\\n\\\\');")
+
+
+if __name__ == '__main__':
+    unittest.main()
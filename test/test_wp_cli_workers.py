@@ -0,0 +1,87 @@
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+import wp_cli_workers
+from wp_cli_workers import WpCliWorkerPool
+
+# Speaks the protocol of wp-cli-worker.php; what it does depends on argv[0] of each request.
+FAKE_WORKER = r"""
+import json, sys
+armor = "===== WP-CLI WORKER RESPONSE ====="
+def reply(response):
+    print(armor); print(json.dumps(response), flush=True)
+reply({"ready": True})
+for line in sys.stdin:
+    argv = json.loads(line)["argv"]
+    if argv[0] == "crash":
+        sys.exit(1)
+    elif argv[0] == "stale":
+        reply({"stale": True, "recycle": True})
+        sys.exit(0)
+    reply({"returncode": 3 if argv[0] == "fail" else 0, "stdout": " ".join(argv), "stderr": "",
+           "recycle": argv[0] == "recycle"})
+    if argv[0] == "recycle":
+        sys.exit(0)
+"""
+
+
+class TestWpCliWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.booted = []
+        real_popen = subprocess.Popen
+
+        def fake_popen(cmdline, **kwargs):
+            self.booted.append(cmdline[1])   # --ingress=...
+            return real_popen([sys.executable, "-c", FAKE_WORKER], **kwargs)
+        patcher = mock.patch.object(wp_cli_workers.subprocess, "Popen", fake_popen)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.pool = WpCliWorkerPool(size=2, script="wp-cli-worker.php")
+        self.addCleanup(self.pool.shutdown)
+
+    def run_wp(self, ingress_name, cmdline, **kwargs):
+        return self.pool.run(ingress_name, cmdline, capture_output=True, text=True, **kwargs)
+
+    def test_reuse(self):
+        self.assertEqual(self.run_wp("site-a", ["option", "get", "home"]).stdout, "option get home")
+        self.assertEqual(self.run_wp("site-a", ["plugin", "list"]).stdout, "plugin list")
+        self.assertEqual(self.booted, ["--ingress=site-a"])
+        self.assertEqual(self.pool.stats()["reused"], 1)
+
+    def test_lru_eviction(self):
+        for site in ("site-a", "site-b", "site-a", "site-c"):
+            self.run_wp(site, ["plugin", "list"])
+        self.assertEqual(self.booted, ["--ingress=site-a", "--ingress=site-b", "--ingress=site-c"])
+        self.assertEqual(self.pool.stats()["evicted"], 1)
+        self.run_wp("site-a", ["plugin", "list"])   # Still there
+        self.assertEqual(len(self.booted), 3)
+
+    def test_unsafe_args_fall_back(self):
+        self.assertIsNone(self.run_wp("site-a", ["option", "update", "blogname", "EPFL's lab"]))
+        self.assertIsNone(self.run_wp("site-a", ["plugin", "list"], stdin=subprocess.DEVNULL))
+        self.assertIsNotNone(self.run_wp("site-a", ["eval", "echo 'hello';"]))
+
+    def test_failures(self):
+        with self.assertRaises(subprocess.CalledProcessError) as caught:
+            self.run_wp("site-a", ["fail"])
+        self.assertEqual(caught.exception.returncode, 3)
+        self.assertEqual(self.run_wp("site-a", ["fail"], check=False).returncode, 3)
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.run_wp("site-a", ["crash"])
+
+    def test_recycle_and_stale(self):
+        self.run_wp("site-a", ["recycle"])
+        self.run_wp("site-a", ["plugin", "list"])
+        self.assertEqual(len(self.booted), 2)
+        self.assertEqual(self.pool.stats()["recycled"], 1)
+
+        # A stale worker declines; the request goes to a fresh one, which is just as stale here
+        self.assertIsNone(self.run_wp("site-a", ["stale"]))
+        self.assertEqual(self.pool.stats()["stale"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
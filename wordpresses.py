@@ -1,3 +1,5 @@
+import asyncio
+import contextlib
 import os
 import shlex
 import subprocess
@@ -12,6 +14,44 @@ from kubernetes.client.exceptions import ApiException
 from wp_kubernetes import WordpressSite, KubernetesAPI
 
 
+async def subprocess_run_async (cmdline, check=True, capture_output=False, text=False, input=None):
+    """Like `subprocess.run()`, except that it waits in the asyncio event loop."""
+    pipe_or_inherit = subprocess.PIPE if capture_output else None
+    process = await asyncio.create_subprocess_exec(
+        *cmdline,
+        stdin=subprocess.PIPE if input is not None else None,
+        stdout=pipe_or_inherit, stderr=pipe_or_inherit)
+    if text and input is not None:
+        input = input.encode("utf-8")
+    stdout, stderr = await process.communicate(input)
+    if text and capture_output:
+        stdout, stderr = stdout.decode("utf-8"), stderr.decode("utf-8")
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmdline, stdout, stderr)
+    return subprocess.CompletedProcess(cmdline, process.returncode, stdout, stderr)
+
+
+def redacted (cmdline, redact):
+    """Returns a copy of `cmdline` with every occurrence of the strings in `redact` replaced by `***`."""
+    def redact_arg (arg):
+        for secret in redact:
+            if secret:
+                arg = arg.replace(secret, "***")
+        return arg
+    return [redact_arg(arg) for arg in cmdline]
+
+
+@contextlib.contextmanager
+def redacting (redact):
+    """Redact the command line of any `subprocess.CalledProcessError` that escapes."""
+    try:
+        yield
+    except subprocess.CalledProcessError as e:
+        if redact:
+            e.cmd = redacted(e.cmd, redact)
+        raise e
+
+
 class _BagBase:
     def __init__ (self, items):
         self._bag = {}
@@ -90,33 +130,106 @@ class WordpressSiteWithWpCli (WordpressSite):
         if 'DEBUG' in os.environ:
             return
 
-        armor = "===== %s WORDPRESS JSON STATUS ====="
-        armor_begin = armor % "BEGIN"
-        armor_end = armor % "END"
+        status_wordpresssite = self.run_wp_eval_json(self._status_php_code)
+        self.status_set_key("wordpresssite", status_wordpresssite)
+
+    async def update_php_status_async (self):
+        """Same as `update_php_status`, from within the asyncio event loop."""
+        logging.info(f"{self.moniker}: update_php_status_async")
+        if 'DEBUG' in os.environ:
+            return
+
+        status_wordpresssite = await self.run_wp_eval_json_async(self._status_php_code)
+        await self.status_set_key_async("wordpresssite", status_wordpresssite)
+
+    _status_php_code = '''$wp_operator_json = apply_filters('wp_operator_status',[]); '''
+
+    _armor = "===== %s WORDPRESS JSON STATUS ====="
 
-        cmdline = ['eval',
-                   '''$w = apply_filters('wp_operator_status',[]); ''' +
-                   '''echo("%s\n"); ''' % armor_begin +
-                   '''echo(json_encode($w, JSON_PRETTY_PRINT)); ''' +
-                   '''echo("%s\n");''' % armor_end]
-        result = self.run_wp_cli(cmdline, capture_output=True, text=True)
+    def run_wp_eval_json (self, php_code, redact=()):
+        """
+        Run `php_code` with `wp eval`, and return (decoded) whatever
+        JSON-serializable value it left in `$wp_operator_json`.
+
+        Returns None in DEBUG mode, as nothing actually runs then.
+        """
+        result = self.run_wp_cli(self._wp_eval_json_cmdline(php_code), redact=redact,
+                                 capture_output=True, text=True)
+        return self._parse_wp_eval_json(result.stdout)
+
+    async def run_wp_eval_json_async (self, php_code, redact=()):
+        """Same as `run_wp_eval_json`, from within the asyncio event loop."""
+        result = await self.run_wp_cli_async(self._wp_eval_json_cmdline(php_code), redact=redact,
+                                             capture_output=True, text=True)
+        return self._parse_wp_eval_json(result.stdout)
+
+    def _wp_eval_json_cmdline (self, php_code):
+        armor_begin = self._armor % "BEGIN"
+        armor_end = self._armor % "END"
+
+        return ['eval',
+                php_code +
+                '''echo("%s\n"); ''' % armor_begin +
+                '''echo(json_encode($wp_operator_json, JSON_PRETTY_PRINT)); ''' +
+                '''echo("%s\n");''' % armor_end]
+
+    def _parse_wp_eval_json (self, stdout):
+        if 'DEBUG' in os.environ:
+            return None
+
+        armor_begin = self._armor % "BEGIN"
+        armor_end = self._armor % "END"
 
-        start = result.stdout.find(armor_begin)
-        end = result.stdout.find(armor_end)
+        start = stdout.find(armor_begin)
+        end = stdout.find(armor_end)
         if start == -1 or end == -1 or end <= start:
-          raise RuntimeError("No armored JSON output: %s" % result.stdout)
+          raise RuntimeError("No armored JSON output: %s" % stdout)
 
-        unarmored = result.stdout[start + len(armor_begin):end]
+        unarmored = stdout[start + len(armor_begin):end]
         try:
-          status_wordpresssite = json.loads(unarmored)
+          return json.loads(unarmored)
         except json.JSONDecodeError:
           raise RuntimeError("unparseable JSON: %s" % unarmored)
 
-        self.status_set_key("wordpresssite", status_wordpresssite)
+    wp_cli_workers = None
+    """Set to a `wp_cli_workers.WpCliWorkerPool` to run WP-CLI commands in pre-booted workers."""
+
+    def run_wp_cli (self, cmdline, redact=(), **kwargs):
+        """Run `wp` with `cmdline` against this site.
 
-    def run_wp_cli (self, cmdline, **kwargs):
+        Substrings of `cmdline` that are in `redact` get replaced with
+        `***` in the logs, and in exceptions.
+        """
+        with redacting(redact):
+            if self.wp_cli_workers is not None and 'DEBUG' not in os.environ:
+                result = self.wp_cli_workers.run(self._ingress_name, cmdline,
+                                                 log_cmdline=redacted(cmdline, redact), **kwargs)
+                if result is not None:
+                    return result
+
+            cmdline = self._wp_cli_cmdline(cmdline)
+            logging.info("Running: %s" % shlex.join(redacted(cmdline, redact)))
+            return subprocess.run(cmdline, check=True, **kwargs)
+
+    async def run_wp_cli_async (self, cmdline, redact=(), **kwargs):
+        """Same as `run_wp_cli`, from within the asyncio event loop.
+
+        Pre-booted workers (if any) are still talked to from a thread,
+        but they answer quickly.
+        """
+        with redacting(redact):
+            if self.wp_cli_workers is not None and 'DEBUG' not in os.environ:
+                result = await asyncio.to_thread(self.wp_cli_workers.run, self._ingress_name, cmdline,
+                                                 log_cmdline=redacted(cmdline, redact), **kwargs)
+                if result is not None:
+                    return result
+
+            cmdline = self._wp_cli_cmdline(cmdline)
+            logging.info("Running: %s" % shlex.join(redacted(cmdline, redact)))
+            return await subprocess_run_async(cmdline, check=True, **kwargs)
+
+    def _wp_cli_cmdline (self, cmdline):
         cmdline = ['wp', f'--ingress={self._ingress_name}'] + cmdline
         if 'DEBUG' in os.environ:
             cmdline.insert(0, 'echo')
-        logging.info("Running: %s" % shlex.join(cmdline))
-        return subprocess.run(cmdline, check=True, **kwargs)
+        return cmdline
@@ -0,0 +1,96 @@
+<?php
+/**
+ * A long-lived WP-CLI worker, for `wp_cli_workers.py` to spare itself one
+ * full WordPress bootstrap per `wp` command.
+ *
+ * It is meant to be started as
+ *
+ *     wp --ingress=<name> eval-file wp-cli-worker.php <max-requests> <max-memory-mb>
+ *
+ * so that WP-CLI boots WordPress for that site exactly once. Then, each line
+ * read from standard input is a JSON-encoded request of the form
+ * `{"argv": ["plugin", "activate", "foo"]}` (that is, a `wp` command line
+ * without the `wp --ingress=...` part). Each response is written on standard
+ * output as a line of armor, followed by one line of JSON with the
+ * `returncode`, `stdout` and `stderr` of the command.
+ *
+ * The worker exits (and says so in its last response, with `"recycle": true`)
+ * after <max-requests> requests, when its memory usage goes above
+ * <max-memory-mb>, or when the set of active plugins no longer is the one it
+ * booted with (as the code that it has loaded no longer matches what the site
+ * would run). Plugins may also change outside of the worker (from the admin
+ * UI, another pod, a one-shot `wp`...); so the worker checks before serving
+ * each request too, and if they did, declines it with `"stale": true` (and
+ * `"recycle": true`) for the caller to retry on a fresh worker.
+**/
+
+define('__WP_CLI_WORKER_ARMOR', '===== WP-CLI WORKER RESPONSE =====');
+
+$max_requests = intval($args[0] ?? 100);
+$max_memory = intval($args[1] ?? 192) * 1024 * 1024;
+
+function wp_cli_worker_reply ($response) {
+  fwrite(STDOUT, __WP_CLI_WORKER_ARMOR . "\n" . json_encode($response) . "\n");
+  fflush(STDOUT);
+}
+
+/**
+ * Like `wp eval`, minus the bootstrap.
+ */
+function wp_cli_worker_eval ($php_code) {
+  ob_start();
+  try {
+    eval($php_code);
+    return ['returncode' => 0, 'stdout' => ob_get_clean(), 'stderr' => ''];
+  } catch (Throwable $e) {
+    return ['returncode' => 255, 'stdout' => ob_get_clean(), 'stderr' => (string) $e];
+  }
+}
+
+function wp_cli_worker_run_command ($argv) {
+  $result = WP_CLI::runcommand(
+    implode(' ', array_map('escapeshellarg', $argv)),
+    ['launch' => false, 'return' => 'all', 'exit_error' => false]);
+  return ['returncode' => $result->return_code,
+          'stdout' => $result->stdout,
+          'stderr' => $result->stderr];
+}
+
+function wp_cli_worker_plugins_changed ($active_plugins_at_boot) {
+  // So as to read the option afresh from the database. Not `wp_cache_flush()`,
+  // which would also empty a persistent object cache, shared with the site
+  wp_cache_delete('alloptions', 'options');
+  wp_cache_delete('notoptions', 'options');
+  wp_cache_delete('active_plugins', 'options');   // In case it is not autoloaded
+  return get_option('active_plugins') !== $active_plugins_at_boot;
+}
+
+$active_plugins_at_boot = get_option('active_plugins');
+wp_cli_worker_reply(['ready' => true]);
+
+for ($served = 1; ($line = fgets(STDIN)) !== false; $served++) {
+  if (wp_cli_worker_plugins_changed($active_plugins_at_boot)) {
+    wp_cli_worker_reply(['stale' => true, 'recycle' => true]);
+    exit(0);
+  }
+
+  $request = json_decode($line, true);
+
+  if (! is_array($request) || empty($request['argv'])) {
+    $response = ['returncode' => 1, 'stdout' => '', 'stderr' => "Bad request: $line"];
+  } elseif ($request['argv'][0] === 'eval' && count($request['argv']) === 2) {
+    $response = wp_cli_worker_eval($request['argv'][1]);
+  } else {
+    $response = wp_cli_worker_run_command($request['argv']);
+  }
+
+  $response['recycle'] = (
+    $served >= $max_requests ||
+    memory_get_usage(true) > $max_memory ||
+    wp_cli_worker_plugins_changed($active_plugins_at_boot));
+  wp_cli_worker_reply($response);
+
+  if ($response['recycle']) {
+    exit(0);
+  }
+}
@@ -0,0 +1,201 @@
+"""A pool of long-lived WP-CLI processes, to run `wp` commands without
+paying for one full WordPress bootstrap each time.
+
+See `wp-cli-worker.php` for the other end of the pipe.
+"""
+
+import collections
+import json
+import logging
+import re
+import shlex
+import subprocess
+import sys
+import threading
+
+
+class WpCliWorkerError (Exception):
+    pass
+
+
+class WpCliWorker:
+    """One `wp eval-file wp-cli-worker.php` process, bound to one site."""
+
+    armor = "===== WP-CLI WORKER RESPONSE ====="
+
+    def __init__ (self, ingress_name, script, max_requests, max_memory_mb):
+        self.ingress_name = ingress_name
+        self.served = 0
+        self._process = subprocess.Popen(
+            ['wp', f'--ingress={ingress_name}', 'eval-file', script,
+             str(max_requests), str(max_memory_mb)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        if not self._read_response().get("ready"):
+            raise WpCliWorkerError(f"WP-CLI worker for {ingress_name} failed to start")
+
+    @property
+    def alive (self):
+        return self._process.poll() is None
+
+    def run (self, argv):
+        self._process.stdin.write(json.dumps(dict(argv=argv)) + "\n")
+        self._process.stdin.flush()
+        response = self._read_response()
+        self.served = self.served + 1
+        if response.get("recycle"):
+            self.close()
+        return response
+
+    def _read_response (self):
+        while True:
+            line = self._process.stdout.readline()
+            if not line:
+                self.close()
+                raise WpCliWorkerError(f"WP-CLI worker for {self.ingress_name} exited unexpectedly")
+            if line.rstrip("\n") == self.armor:
+                return json.loads(self._process.stdout.readline())
+            logging.debug(f"WP-CLI worker for {self.ingress_name}: {line.rstrip()}")
+
+    def close (self):
+        if self.alive:
+            self._process.stdin.close()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        self._process.wait()
+        self._process.stdout.close()
+
+
+class WpCliWorkerPool:
+    """Up to `size` `WpCliWorker`s, recycled LRU-first across sites.
+
+    A worker is only ever reused for the site it booted for (there is
+    no such thing as switching the plugins that a PHP process has
+    loaded), so the pool helps when the same site receives several
+    `wp` commands in a row — which is the case for every reconcile.
+    """
+
+    _safe_arg = re.compile(r"""^[^'\\]*$""")
+
+    def __init__ (self, size, script, max_requests=100, max_memory_mb=192):
+        self.size = size
+        self._script = script
+        self._max_requests = max_requests
+        self._max_memory_mb = max_memory_mb
+        self._lock = threading.Lock()
+        self._idle = collections.OrderedDict()   # ingress name → [WpCliWorker]
+        self._busy = 0
+        self._stats = collections.Counter()
+
+    def stats (self):
+        with self._lock:
+            return dict(self._stats,
+                        busy=self._busy,
+                        idle=sum(len(workers) for workers in self._idle.values()))
+
+    def run (self, ingress_name, cmdline, check=True, capture_output=False, text=False, log_cmdline=None, **kwargs):
+        """Run `cmdline` like `subprocess.run(['wp', f'--ingress={ingress_name}'] + cmdline)` would.
+
+        `log_cmdline`, if set, is what gets logged instead of `cmdline`.
+
+        Returns None if the pool cannot serve the request (in which
+        case the caller should fall back to `subprocess.run`).
+        """
+        if kwargs or not self._can_serve(cmdline):
+            return None
+
+        full_cmdline = ['wp', f'--ingress={ingress_name}'] + cmdline
+        logging.info("Running (in WP-CLI worker): %s" % shlex.join(
+            ['wp', f'--ingress={ingress_name}'] + (log_cmdline if log_cmdline is not None else cmdline)))
+        # A worker whose plugins changed under its feet declines the
+        # request, and exits; the next one boots with the new plugins.
+        for attempt in range(2):
+            try:
+                worker = self._checkout(ingress_name)
+            except WpCliWorkerError as e:
+                raise subprocess.CalledProcessError(-1, full_cmdline, stderr=str(e))
+            if worker is None:
+                return None
+
+            try:
+                response = worker.run(cmdline)
+            except WpCliWorkerError as e:
+                raise subprocess.CalledProcessError(-1, full_cmdline, stderr=str(e))
+            finally:
+                self._checkin(worker)
+
+            if not response.get("stale"):
+                break
+            with self._lock:
+                self._stats["stale"] += 1
+        else:
+            return None
+
+        stdout, stderr = response["stdout"], response["stderr"]
+        if not capture_output:
+            sys.stdout.write(stdout)
+            sys.stderr.write(stderr)
+            stdout = stderr = None
+        elif not text:
+            stdout, stderr = stdout.encode("utf-8"), stderr.encode("utf-8")
+
+        if check and response["returncode"] != 0:
+            raise subprocess.CalledProcessError(response["returncode"], full_cmdline, stdout, stderr)
+        return subprocess.CompletedProcess(full_cmdline, response["returncode"], stdout, stderr)
+
+    def _can_serve (self, cmdline):
+        if len(cmdline) == 2 and cmdline[0] == 'eval':
+            return True
+        return all(self._safe_arg.match(arg) for arg in cmdline)
+
+    def _checkout (self, ingress_name):
+        with self._lock:
+            workers = self._idle.get(ingress_name)
+            if workers:
+                worker = workers.pop()
+                if not workers:
+                    del self._idle[ingress_name]
+                self._busy = self._busy + 1
+                self._stats["reused"] += 1
+                return worker
+
+            evicted = None
+            if self._busy + sum(len(w) for w in self._idle.values()) >= self.size:
+                if not self._idle:
+                    self._stats["overflow"] += 1
+                    return None   # All busy
+                lru_ingress_name, lru_workers = next(iter(self._idle.items()))
+                evicted = lru_workers.pop(0)
+                if not lru_workers:
+                    del self._idle[lru_ingress_name]
+                self._stats["evicted"] += 1
+            self._busy = self._busy + 1
+            self._stats["booted"] += 1
+
+        if evicted is not None:
+            evicted.close()
+
+        try:
+            return WpCliWorker(ingress_name, self._script,
+                               self._max_requests, self._max_memory_mb)
+        except Exception:
+            with self._lock:
+                self._busy = self._busy - 1
+            raise
+
+    def _checkin (self, worker):
+        with self._lock:
+            self._busy = self._busy - 1
+            if worker.alive:
+                self._idle.setdefault(worker.ingress_name, []).append(worker)
+                self._idle.move_to_end(worker.ingress_name)
+            else:
+                self._stats["recycled"] += 1
+
+    def shutdown (self):
+        with self._lock:
+            workers = [w for ws in self._idle.values() for w in ws]
+            self._idle.clear()
+        for w in workers:
+            w.close()
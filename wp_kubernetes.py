@@ -1,6 +1,11 @@
 """A Kubernetes bag-of-tricks, with no pretention for general reusability."""
 
+import asyncio
 import base64
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
 from functools import cached_property
 import logging
 import re
@@ -15,6 +20,8 @@ import kubernetes.dynamic
 import kubernetes.leaderelection.leaderelection
 import kubernetes.leaderelection.electionconfig
 from kubernetes.leaderelection.resourcelock.configmaplock import ConfigMapLock
+import kubernetes_asyncio.client
+import kubernetes_asyncio.config
 
 
 class classproperty:
@@ -24,10 +31,193 @@ class classproperty:
         return self.fget(owner)
 
 
+class RateLimiter:
+    """Token buckets for requests to the Kubernetes API server, one per verb class.
+
+    Requests are made on behalf of one of two lanes: “creation” (for
+    new sites, which someone is waiting for) or “resync” (everything
+    else). `creation_headroom` (a fraction of each bucket) is reserved
+    to the creation lane, so that a burst of resyncs (e.g. all sites at
+    operator startup) can't starve it.
+    """
+    lanes = ("creation", "resync")
+    _lane = contextvars.ContextVar("kubernetes_api_lane", default="resync")
+
+    class _Bucket:
+        def __init__ (self, qps, burst):
+            self.qps = qps
+            self.burst = burst
+            self.tokens = burst
+            self.last_refill = time.monotonic()
+
+        def refill (self):
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.qps)
+            self.last_refill = now
+
+    def __init__ (self, read_qps, write_qps, creation_headroom=0.25):
+        self._lock = threading.Lock()
+        self._buckets = dict(read=self._Bucket(read_qps, 2 * read_qps),
+                             write=self._Bucket(write_qps, 2 * write_qps))
+        self._creation_headroom = creation_headroom
+        self._stats = collections.Counter()
+
+    @classmethod
+    @contextlib.contextmanager
+    def lane (cls, lane):
+        """Within this context (thread or asyncio task), requests go through `lane`."""
+        assert lane in cls.lanes
+        token = cls._lane.set(lane)
+        try:
+            yield
+        finally:
+            cls._lane.reset(token)
+
+    @staticmethod
+    def verb_class (method):
+        return "read" if method in ("GET", "HEAD") else "write"
+
+    def _try_acquire (self, verb_class):
+        """Returns 0 if a token was taken, or else how long to wait before trying again."""
+        lane = self._lane.get()
+        with self._lock:
+            bucket = self._buckets[verb_class]
+            bucket.refill()
+            threshold = 1 if lane == "creation" else 1 + self._creation_headroom * bucket.burst
+            if bucket.tokens >= threshold:
+                bucket.tokens -= 1
+                return 0
+            return (threshold - bucket.tokens) / bucket.qps
+
+    def acquire (self, verb_class):
+        start = time.monotonic()
+        while (wait := self._try_acquire(verb_class)):
+            time.sleep(wait)
+        self._record_wait(time.monotonic() - start)
+
+    async def acquire_async (self, verb_class):
+        start = time.monotonic()
+        while (wait := self._try_acquire(verb_class)):
+            await asyncio.sleep(wait)
+        self._record_wait(time.monotonic() - start)
+
+    def _record_wait (self, waited):
+        lane = self._lane.get()
+        with self._lock:
+            self._stats[f"{lane}_requests"] += 1
+            self._stats[f"{lane}_wait_seconds"] += waited
+            self._stats[f"{lane}_max_wait_seconds"] = max(waited, self._stats[f"{lane}_max_wait_seconds"])
+
+    def throttled (self, verb_class, retry_after):
+        """The API server said 429; hold back everyone in `verb_class` for `retry_after` seconds."""
+        with self._lock:
+            bucket = self._buckets[verb_class]
+            bucket.refill()
+            bucket.tokens = min(bucket.tokens, 0) - retry_after * bucket.qps
+            self._stats["throttled"] += 1
+
+    max_retries = 5
+
+    def retry_after (self, api_exception, attempt):
+        """How long to wait before retrying after `api_exception`, or None not to retry."""
+        if api_exception.status != 429 or attempt >= self.max_retries:
+            return None
+        try:
+            return float((api_exception.headers or {}).get("Retry-After"))
+        except (TypeError, ValueError):
+            return float(2 ** attempt)   # No (or an HTTP-date) Retry-After; back off exponentially
+
+    def stats (self):
+        with self._lock:
+            return dict(self._stats,
+                        **{f"{verb_class}_tokens": round(bucket.tokens, 1)
+                           for verb_class, bucket in self._buckets.items()})
+
+
+class _ApiClient (kubernetes.client.ApiClient):
+    """An `ApiClient` with a default per-request timeout, and optionally a forced `Content-Type`.
+
+    Several of them may share the same `rest_client` (i.e. the same
+    urllib3 connection pool).
+    """
+    def __init__(self, configuration, request_timeout=None, content_type=None, rest_client=None):
+        super().__init__(configuration)
+        self._default_request_timeout = request_timeout
+        self._forced_content_type = content_type
+        if rest_client is not None:
+            self.rest_client = rest_client
+
+    def call_api(self, resource_path, method,
+                 path_params=None, query_params=None, header_params=None,
+                 body=None, post_params=None, files=None,
+                 response_type=None, auth_settings=None, async_req=None,
+                 _return_http_data_only=None, collection_formats=None,
+                 _preload_content=True, _request_timeout=None):
+        # Streaming requests (i.e. watches) may stay quiet for a long time; leave them alone.
+        if _request_timeout is None and _preload_content:
+            _request_timeout = self._default_request_timeout
+        if self._forced_content_type is not None:
+            # As seen in https://github.com/kubernetes-client/python/issues/1216#issuecomment-691116322
+            header_params['Content-Type'] = self.select_header_content_type([self._forced_content_type])
+
+        rate_limiter = KubernetesAPI.rate_limiter
+        for attempt in range(RateLimiter.max_retries + 1):
+            if rate_limiter is not None and _preload_content:
+                rate_limiter.acquire(RateLimiter.verb_class(method))
+            try:
+                return super().call_api(resource_path, method, path_params, query_params, header_params, body,
+                                        post_params, files, response_type, auth_settings, async_req, _return_http_data_only,
+                                        collection_formats, _preload_content, _request_timeout)
+            except kubernetes.client.exceptions.ApiException as e:
+                retry_after = rate_limiter.retry_after(e, attempt) if rate_limiter is not None else None
+                if retry_after is None:
+                    raise e
+                logging.warning(f"Kubernetes API server says 429 on {method} {resource_path}; retrying in {retry_after}s")
+                rate_limiter.throttled(RateLimiter.verb_class(method), retry_after)
+
+
+class _AsyncApiClient (kubernetes_asyncio.client.ApiClient):
+    """Same as `_ApiClient`'s rate limiting, for `kubernetes_asyncio`."""
+    def call_api(self, resource_path, method, *args, **kwargs):
+        return self._call_api_rate_limited(resource_path, method, *args, **kwargs)
+
+    async def _call_api_rate_limited(self, resource_path, method, *args, **kwargs):
+        rate_limiter = KubernetesAPI.rate_limiter
+        for attempt in range(RateLimiter.max_retries + 1):
+            if rate_limiter is not None and kwargs.get("_preload_content", True):
+                await rate_limiter.acquire_async(RateLimiter.verb_class(method))
+            try:
+                return await super().call_api(resource_path, method, *args, **kwargs)
+            except kubernetes_asyncio.client.exceptions.ApiException as e:
+                retry_after = rate_limiter.retry_after(e, attempt) if rate_limiter is not None else None
+                if retry_after is None:
+                    raise e
+                logging.warning(f"Kubernetes API server says 429 on {method} {resource_path}; retrying in {retry_after}s")
+                rate_limiter.throttled(RateLimiter.verb_class(method), retry_after)
+
+
 class KubernetesAPI:
-    """A dispenser of singletons to access the Kubernetes API easily."""
+    """A dispenser of singletons to access the Kubernetes API easily.
+
+    All of them share one `ApiClient`, and therefore one connection pool.
+    """
     __singleton = None
 
+    connection_pool_maxsize = None
+    request_timeout = None
+    rate_limiter = None
+
+    @classmethod
+    def configure(cls, connection_pool_maxsize=None, request_timeout=None, rate_limiter=None):
+        """Set the size of the connection pool, the default timeout (in seconds) of each request,
+        and the `RateLimiter` (if any) that all requests (including `AsyncKubernetesAPI`'s) go through.
+
+        Only effective if called before any other use of this class.
+        """
+        cls.connection_pool_maxsize = connection_pool_maxsize
+        cls.request_timeout = request_timeout
+        cls.rate_limiter = rate_limiter
+
     @classmethod
     def __get(cls):
         if cls.__singleton is None:
@@ -38,26 +228,27 @@ class KubernetesAPI:
     def __init__(self):
         kubernetes.config.load_config()
 
-        self._custom = kubernetes.client.CustomObjectsApi()
-        self._core = kubernetes.client.CoreV1Api()
-        self._extensions = kubernetes.client.ApiextensionsV1Api()
-        self._dynamic = kubernetes.dynamic.DynamicClient(kubernetes.client.ApiClient())
-        self._networking = kubernetes.client.NetworkingV1Api()
-
-        class ApiClientForJsonPatch(kubernetes.client.ApiClient):
-            """As seen in https://github.com/kubernetes-client/python/issues/1216#issuecomment-691116322"""
-            def call_api(self, resource_path, method,
-                         path_params=None, query_params=None, header_params=None,
-                         body=None, post_params=None, files=None,
-                         response_type=None, auth_settings=None, async_req=None,
-                         _return_http_data_only=None, collection_formats=None,
-                         _preload_content=True, _request_timeout=None):
-                header_params['Content-Type'] = self.select_header_content_type(['application/json-patch+json'])
-                return super().call_api(resource_path, method, path_params, query_params, header_params, body,
-                                        post_params, files, response_type, auth_settings, async_req, _return_http_data_only,
-                                        collection_formats, _preload_content, _request_timeout)
-
-        self._custom_jsonpatch = kubernetes.client.CustomObjectsApi(ApiClientForJsonPatch())
+        configuration = kubernetes.client.Configuration.get_default_copy()
+        if self.connection_pool_maxsize is not None:
+            configuration.connection_pool_maxsize = self.connection_pool_maxsize
+        self._api_client = _ApiClient(configuration, request_timeout=self.request_timeout)
+
+        self._custom = kubernetes.client.CustomObjectsApi(self._api_client)
+        self._core = kubernetes.client.CoreV1Api(self._api_client)
+        self._extensions = kubernetes.client.ApiextensionsV1Api(self._api_client)
+        self._dynamic = kubernetes.dynamic.DynamicClient(self._api_client)
+        self._networking = kubernetes.client.NetworkingV1Api(self._api_client)
+        self._custom_jsonpatch = kubernetes.client.CustomObjectsApi(
+            _ApiClient(configuration, request_timeout=self.request_timeout,
+                       content_type='application/json-patch+json',
+                       rest_client=self._api_client.rest_client))
+
+        apply_api_client = _ApiClient(configuration, request_timeout=self.request_timeout,
+                                      content_type='application/apply-patch+yaml',
+                                      rest_client=self._api_client.rest_client)
+        self._custom_apply = kubernetes.client.CustomObjectsApi(apply_api_client)
+        self._core_apply = kubernetes.client.CoreV1Api(apply_api_client)
+        self._networking_apply = kubernetes.client.NetworkingV1Api(apply_api_client)
 
     @classproperty
     def custom(cls):
@@ -67,10 +258,25 @@ class KubernetesAPI:
     def custom_jsonpatch(cls):
         return cls.__get()._custom_jsonpatch
 
+    @classproperty
+    def custom_apply(cls):
+        """Same as `custom`, except that `patch_*` methods do server-side apply."""
+        return cls.__get()._custom_apply
+
     @classproperty
     def core(cls):
         return cls.__get()._core
 
+    @classproperty
+    def core_apply(cls):
+        """Same as `core`, except that `patch_*` methods do server-side apply."""
+        return cls.__get()._core_apply
+
+    @classproperty
+    def networking_apply(cls):
+        """Same as `networking`, except that `patch_*` methods do server-side apply."""
+        return cls.__get()._networking_apply
+
     @classproperty
     def extensions(cls):
         return cls.__get()._extensions
@@ -83,6 +289,341 @@ class KubernetesAPI:
     def networking(cls):
         return cls.__get()._networking
 
+    @classmethod
+    def sanitize(cls, obj):
+        """Turn `obj` (which may contain “built-in” objects, e.g. `V1Secret`) into plain dicts and lists."""
+        return cls.__get()._api_client.sanitize_for_serialization(obj)
+
+    @classmethod
+    def pool_stats(cls):
+        """How busy the connection pool is, e.g. for a `kopf.on.probe`."""
+        pool_manager = cls.__get()._api_client.rest_client.pool_manager
+        stats = dict(maxsize=pool_manager.connection_pool_kw.get("maxsize", 1),
+                     in_use=0, connections_opened=0, requests=0)
+        for key in pool_manager.pools.keys():
+            pool = pool_manager.pools[key]
+            # `pool.pool` holds one item (either an idle connection, or None) per slot not currently in use.
+            stats["in_use"] += pool.pool.maxsize - pool.pool.qsize()
+            stats["connections_opened"] += pool.num_connections
+            stats["requests"] += pool.num_requests
+        stats["saturation"] = stats["in_use"] / stats["maxsize"]
+        return stats
+
+
+class AsyncKubernetesAPI:
+    """Same as `KubernetesAPI`, but with `kubernetes_asyncio`.
+
+    Only usable from within the event loop, after `await setup()`.
+    """
+    __singleton = None
+
+    @classmethod
+    async def setup(cls, connection_pool_maxsize=None):
+        if cls.__singleton is None:
+            await kubernetes_asyncio.config.load_config()
+            cls.__singleton = cls(connection_pool_maxsize)
+
+    @classmethod
+    def __get(cls):
+        if cls.__singleton is None:
+            raise RuntimeError("AsyncKubernetesAPI.setup() was not awaited")
+        return cls.__singleton
+
+    def __init__(self, connection_pool_maxsize=None):
+        configuration = kubernetes_asyncio.client.Configuration.get_default_copy()
+        if connection_pool_maxsize is not None:
+            configuration.connection_pool_maxsize = connection_pool_maxsize
+        self._api_client = _AsyncApiClient(configuration)
+        self._custom = kubernetes_asyncio.client.CustomObjectsApi(self._api_client)
+        self._core = kubernetes_asyncio.client.CoreV1Api(self._api_client)
+
+    @classproperty
+    def custom(cls):
+        return cls.__get()._custom
+
+    @classproperty
+    def core(cls):
+        return cls.__get()._core
+
+
+class OwnerIndex:
+    """An in-memory index of Kubernetes objects, by owner UID.
+
+    Meant to be fed from a watch (e.g. a `@kopf.on.event` handler) by
+    calling `on_event()` with the raw object body.
+    """
+    def __init__ (self):
+        self._lock = threading.Lock()
+        self._by_owner_uid = {}       # owner UID → {(namespace, name): body}
+        self._owner_uids_by_key = {}  # (namespace, name) → [owner UID]
+
+    def on_event (self, event_type, body):
+        metadata = body.get("metadata", {})
+        key = (metadata.get("namespace"), metadata.get("name"))
+        with self._lock:
+            for owner_uid in self._owner_uids_by_key.pop(key, []):
+                owned = self._by_owner_uid.get(owner_uid, {})
+                owned.pop(key, None)
+                if not owned:
+                    self._by_owner_uid.pop(owner_uid, None)
+
+            if event_type == "DELETED":
+                return
+
+            owner_uids = [o.get("uid") for o in (metadata.get("ownerReferences") or [])]
+            if owner_uids:
+                self._owner_uids_by_key[key] = owner_uids
+                for owner_uid in owner_uids:
+                    self._by_owner_uid.setdefault(owner_uid, {})[key] = body
+
+    def owned_by (self, owner_uid):
+        """Returns the bodies of the objects owned by `owner_uid`, or `[]` if none are known (yet)."""
+        with self._lock:
+            return list(self._by_owner_uid.get(owner_uid, {}).values())
+
+
+def server_side_apply (patch_method, body, live=None, **kwargs):
+    """Converge an object to `body` with one server-side apply PATCH.
+
+    `patch_method` is one of the `patch_*` methods of
+    `KubernetesAPI.custom_apply`, `.core_apply` etc.; `kwargs` are
+    passed to it (besides `body`).
+
+    If `live` (what the object looks like now, e.g. according to a
+    watch) already has everything that `body` says, nothing is written,
+    and the return value is None.
+    """
+    body = KubernetesAPI.sanitize(body)
+    if live is not None and is_subset(body, KubernetesAPI.sanitize(live)):
+        return None
+
+    return patch_method(body=body, field_manager=server_side_apply.field_manager, force=True, **kwargs)
+
+server_side_apply.field_manager = "wp-operator"
+
+
+def is_subset (desired, actual):
+    """True iff every field set in `desired` has the same value in `actual`."""
+    if isinstance(desired, dict):
+        return (isinstance(actual, dict) and
+                all(k in actual and is_subset(v, actual[k]) for k, v in desired.items()))
+    elif isinstance(desired, list):
+        return (isinstance(actual, list) and len(desired) == len(actual) and
+                all(is_subset(d, a) for d, a in zip(desired, actual)))
+    else:
+        return desired == actual
+
+
+class ObjectCache:
+    """An in-memory copy of all objects of some kind, by namespace and name.
+
+    Meant to be fed from a watch with `on_event()`, like `OwnerIndex`.
+    """
+    def __init__ (self):
+        self._lock = threading.Lock()
+        self._bodies = {}   # (namespace, name) → body
+
+    def on_event (self, event_type, body):
+        metadata = body.get("metadata", {})
+        key = (metadata.get("namespace"), metadata.get("name"))
+        with self._lock:
+            if event_type == "DELETED":
+                self._bodies.pop(key, None)
+            else:
+                self._bodies[key] = body
+
+    def get (self, namespace, name):
+        """Returns the body of that object, or None if not known (yet)."""
+        with self._lock:
+            return self._bodies.get((namespace, name))
+
+
+class MariaDBIndex:
+    """An in-memory index of MariaDBs, and of the Service to reach each of them at.
+
+    Meant to be fed from two watches: `on_mariadb_event()` for the
+    MariaDBs themselves, and `on_service_event()` for the Services
+    that they own. A MariaDB may own several suitable Services; it
+    stays reachable until the last of them is gone.
+    """
+    def __init__ (self):
+        self._lock = threading.Lock()
+        self._mariadbs = {}              # (namespace, name) → body
+        self._endpoints = {}             # (namespace, MariaDB name) → {Service name: port}, oldest first
+        self._mariadb_by_service = {}    # (namespace, Service name) → MariaDB name
+
+    @staticmethod
+    def _key (body):
+        metadata = body.get("metadata", {})
+        return (metadata.get("namespace"), metadata.get("name"))
+
+    def on_mariadb_event (self, event_type, body):
+        key = self._key(body)
+        with self._lock:
+            if event_type == "DELETED":
+                self._mariadbs.pop(key, None)
+            else:
+                self._mariadbs[key] = body
+
+    def on_service_event (self, event_type, body):
+        namespace, service_name = key = self._key(body)
+        mariadb_name = port = None
+        if event_type != "DELETED":
+            spec = body.get("spec", {})
+            mariadb_owners = [o for o in (body["metadata"].get("ownerReferences") or [])
+                              if o.get("kind") == "MariaDB"]
+            ports = [p for p in (spec.get("ports") or []) if p.get("name") == "mariadb"]
+            # Not the headless one
+            if mariadb_owners and ports and not spec.get("publishNotReadyAddresses"):
+                mariadb_name, port = mariadb_owners[0]["name"], ports[0]["port"]
+
+        with self._lock:
+            previous_mariadb_name = self._mariadb_by_service.get(key)
+            if previous_mariadb_name is not None and previous_mariadb_name != mariadb_name:
+                self._forget(namespace, previous_mariadb_name, service_name)
+            if mariadb_name is not None:
+                self._remember(namespace, mariadb_name, service_name, port)
+
+    def remember (self, namespace, mariadb_name, service_name, port):
+        with self._lock:
+            self._remember(namespace, mariadb_name, service_name, port)
+
+    def _remember (self, namespace, mariadb_name, service_name, port):
+        self._endpoints.setdefault((namespace, mariadb_name), {})[service_name] = port
+        self._mariadb_by_service[(namespace, service_name)] = mariadb_name
+
+    def _forget (self, namespace, mariadb_name, service_name):
+        del self._mariadb_by_service[(namespace, service_name)]
+        services = self._endpoints.get((namespace, mariadb_name), {})
+        services.pop(service_name, None)
+        if not services:
+            self._endpoints.pop((namespace, mariadb_name), None)
+
+    def mariadb (self, namespace, name):
+        """Returns the body of that MariaDB, or None if not known (yet)."""
+        with self._lock:
+            return self._mariadbs.get((namespace, name))
+
+    def endpoint (self, namespace, mariadb_name):
+        """Returns a (Service name, port) tuple, or None if not known (yet)."""
+        with self._lock:
+            services = self._endpoints.get((namespace, mariadb_name))
+            if not services:
+                return None
+            service_name = next(iter(services))
+            return (service_name, services[service_name])
+
+
+class ConditionWaiter:
+    """Wait for objects to show some condition in their `status.conditions`, without polling.
+
+    Meant to be fed from watches with `on_event()`. `wait()` (from a
+    thread) and `wait_async()` (from the asyncio event loop) return as
+    soon as the awaited condition shows up in either an event, or the
+    “cold” GET that they perform upon starting to wait.
+    """
+    class _Waiter:
+        def __init__ (self, condition_type, expected_message):
+            self.condition_type = condition_type
+            self.expected_message = expected_message
+            self.last_message = ''
+            self.future = concurrent.futures.Future()
+
+    def __init__ (self):
+        self._lock = threading.Lock()
+        self._waiters = {}   # (plural, namespace, name) → [_Waiter]
+
+    def on_event (self, plural, event_type, body):
+        if event_type == "DELETED":
+            return
+        metadata = body.get("metadata", {})
+        with self._lock:
+            waiters = list(self._waiters.get((plural, metadata.get("namespace"), metadata.get("name")), []))
+        for waiter in waiters:
+            self._update(waiter, body)
+
+    def wait (self, plural, namespace, name, condition_type, expected_message, timeout, get):
+        """Wait for `condition_type` to have `expected_message`.
+
+        `get` is a function that returns the object's current body.
+        Raises `TimeoutError`, with the last seen message, if that
+        doesn't happen in `timeout` seconds.
+        """
+        with self._waiting(plural, namespace, name, condition_type, expected_message) as waiter:
+            self._update(waiter, get())
+            try:
+                waiter.future.result(timeout=timeout)
+                return
+            except concurrent.futures.TimeoutError:
+                self._update(waiter, get())   # In case we missed an event
+                if not waiter.future.done():
+                    raise TimeoutError(waiter.last_message)
+
+    async def wait_async (self, plural, namespace, name, condition_type, expected_message, timeout, get):
+        """Same as `wait()`, from within the asyncio event loop. `get` is a coroutine function."""
+        with self._waiting(plural, namespace, name, condition_type, expected_message) as waiter:
+            self._update(waiter, await get())
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(waiter.future)), timeout)
+                return
+            except asyncio.TimeoutError:
+                self._update(waiter, await get())   # In case we missed an event
+                if not waiter.future.done():
+                    raise TimeoutError(waiter.last_message)
+
+    @contextlib.contextmanager
+    def _waiting (self, plural, namespace, name, condition_type, expected_message):
+        key = (plural, namespace, name)
+        waiter = self._Waiter(condition_type, expected_message)
+        with self._lock:
+            self._waiters.setdefault(key, []).append(waiter)
+        try:
+            yield waiter
+        finally:
+            with self._lock:
+                waiters = self._waiters[key]
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._waiters[key]
+
+    def _update (self, waiter, body):
+        for condition in (body.get("status") or {}).get("conditions", []):
+            if condition.get("type") == waiter.condition_type:
+                waiter.last_message = condition.get("message")
+                if waiter.last_message == waiter.expected_message:
+                    with self._lock:
+                        if not waiter.future.done():
+                            waiter.future.set_result(True)
+
+
+class WarmUpGate:
+    """Holds back decisions that depend on some in-memory state, until
+    that state was loaded in bulk.
+
+    Wrap the bulk load in `with gate.warming_up():`; `wait()` blocks
+    until it is done.
+    """
+    def __init__ (self, name):
+        self.name = name
+        self._open = threading.Event()
+        self.warmup_seconds = None
+
+    @contextlib.contextmanager
+    def warming_up (self):
+        started = time.monotonic()
+        yield
+        self.warmup_seconds = round(time.monotonic() - started, 3)
+        logging.info(f"[{self.name}] warmed up in {self.warmup_seconds}s")
+        self._open.set()
+
+    def wait (self, timeout):
+        """Raises `TimeoutError` if still warming up after `timeout` seconds."""
+        if not self._open.wait(timeout):
+            raise TimeoutError(f"{self.name} is still warming up")
+
+    def stats (self):
+        return dict(ready=self._open.is_set(), warmup_seconds=self.warmup_seconds)
+
 
 class KubernetesObject:
     """Model for a persistent record in the Kubernetes API server.
@@ -90,9 +631,27 @@ class KubernetesObject:
     This is an abstract base class. Instantiable subclasses are named after
     the `kind:` of the objects they model.
     """
+    cache = None   # Subclasses may set this to an `ObjectCache`
+
     def __init__ (self, definition):
         self._definition = definition
 
+    @classmethod
+    def get_cached (cls, namespace, name):
+        """Same as `cls.get()`, except that it serves from `cls.cache` if it knows of that object."""
+        body = cls.cache.get(namespace, name) if cls.cache is not None else None
+        return cls(body) if body is not None else cls.get(namespace=namespace, name=name)
+
+    @classmethod
+    def get_cached_or_none (cls, namespace, name):
+        """Same as `get_cached()`, except that it returns None if there is no such object."""
+        try:
+            return cls.get_cached(namespace=namespace, name=name)
+        except kubernetes.client.exceptions.ApiException as e:
+            if e.status != 404:
+                raise e
+            return None
+
     @property
     def body (self):
         return self._definition
@@ -135,6 +694,27 @@ class KubernetesObject:
             raise ValueError(f"Found {len(candidates)} {candidates[0].kind}s owned by {self.moniker}, expected just one")
             return candidates
 
+    def _sole_owned_indexed (self, cls, expected_name):
+        """Same as `self._sole_owned(cls.all(self.namespace))`, only cheaper.
+
+        Reads from `cls.owner_index` if it knows of any object owned by
+        us; otherwise (cold cache), GETs `expected_name` and checks that
+        we own it. Only if that fails too, does it list them all.
+        """
+        owned = cls.owner_index.owned_by(self.uid)
+        if owned:
+            return self._sole_owned([cls(body) for body in owned])
+
+        try:
+            candidate = cls.get(namespace=self.namespace, name=expected_name)
+            if self.uid in candidate.owner_uids:
+                return candidate
+        except kubernetes.client.exceptions.ApiException as e:
+            if e.status != 404:
+                raise e
+
+        return self._sole_owned(cls.all(namespace=self.namespace))
+
 
 class KubernetesBuiltinObject (KubernetesObject):
     """One of the “built-in” (metaprogrammed) objects in the Kubernetes store.
@@ -156,13 +736,16 @@ class KubernetesBuiltinObject (KubernetesObject):
     def api_version (self):
         return "v1"                      # See comment above
 
+    # Instances may be built out of either the “built-in” objects
+    # that `KubernetesAPI` returns, or the plain dicts that watches
+    # (e.g. `OwnerIndex`) see. `.field()` works with both.
     @property
     def name (self):
-        return self._definition.metadata.name
+        return self.field("metadata.name")
 
     @property
     def namespace (self):
-        return self._definition.metadata.namespace
+        return self.field("metadata.namespace")
 
     __UNSET = object()
 
@@ -193,12 +776,19 @@ class KubernetesBuiltinObject (KubernetesObject):
 
 class Secret (KubernetesBuiltinObject):
     kind = "Secret"
+    owner_index = OwnerIndex()
+    cache = ObjectCache()
 
     @classmethod
     def all (cls, namespace):
         return cls.from_list(
             KubernetesAPI.core.list_namespaced_secret(namespace=namespace))
 
+    @classmethod
+    def get (cls, namespace, name):
+        return cls(KubernetesAPI.core.read_namespaced_secret(
+            name=name, namespace=namespace))
+
     def decode (self, field):
         return base64.b64decode(self.field(f"data.{field}")).decode("utf-8")
 
@@ -207,6 +797,11 @@ class Secret (KubernetesBuiltinObject):
         return self.decode("password")
 
 
+class Ingress (KubernetesBuiltinObject):
+    kind = "Ingress"
+    cache = ObjectCache()
+
+
 class Service (KubernetesBuiltinObject):
     @classmethod
     def all (cls, namespace):
@@ -323,10 +918,34 @@ class CustomAPIKubernetesObject (KubernetesObject):
             **self._search_kwargs)
 
 
+    async def status_set_key_async (self, status_key, status_value):
+        """Same as `status_set_key`, with `AsyncKubernetesAPI`."""
+        await AsyncKubernetesAPI.custom.patch_namespaced_custom_object_status(
+            body=dict(status={}),
+            name=self.name,
+            namespace=self.namespace,
+            **self._search_kwargs)
+
+        await AsyncKubernetesAPI.custom.patch_namespaced_custom_object_status(
+            body=[
+                {
+                    "op": "add",
+                    "path": f"/status/{status_key}",
+                    "value": status_value
+                }
+            ],
+            name=self.name,
+            namespace=self.namespace,
+            _content_type='application/json-patch+json',
+            **self._search_kwargs)
+
+
 class MariaDBUser (CustomAPIKubernetesObject):
     _search_kwargs = dict(group="k8s.mariadb.com",
                           version="v1alpha1",
                           plural="users")
+    owner_index = OwnerIndex()
+    cache = ObjectCache()
 
     @property
     def username (self):
@@ -339,6 +958,8 @@ class MariaDBDatabase (CustomAPIKubernetesObject):
     _search_kwargs = dict(group="k8s.mariadb.com",
                           version="v1alpha1",
                           plural="databases")
+    owner_index = OwnerIndex()
+    cache = ObjectCache()
 
     @property
     def dbname (self):
@@ -348,7 +969,7 @@ class MariaDBDatabase (CustomAPIKubernetesObject):
 
     @property
     def mariadb (self):
-        return MariaDB.get(
+        return MariaDB.get_cached(
             name=self.field("spec.mariaDbRef.name"),
             namespace=self.namespace)
 
@@ -357,6 +978,12 @@ class MariaDB (CustomAPIKubernetesObject) :
     _search_kwargs = dict(group="k8s.mariadb.com",
                           version="v1alpha1",
                           plural="mariadbs")
+    index = MariaDBIndex()
+
+    @classmethod
+    def get_cached (cls, namespace, name):
+        body = cls.index.mariadb(namespace, name)
+        return cls(body) if body is not None else cls.get(namespace=namespace, name=name)
 
     @property
     def service (self):
@@ -366,12 +993,47 @@ class MariaDB (CustomAPIKubernetesObject) :
                     if p.name == "mariadb":
                         return s
 
+    @property
+    def root_password (self):
+        ref = self.field("spec.rootPasswordSecretKeyRef")
+        return Secret.get_cached(namespace=self.namespace, name=ref["name"]).decode(ref["key"])
+
+    @property
+    def service_name (self):
+        return self._service_endpoint[0]
+
+    @property
+    def service_port (self):
+        return self._service_endpoint[1]
+
+    @property
+    def _service_endpoint (self):
+        endpoint = self.index.endpoint(self.namespace, self.name)
+        if endpoint is not None:
+            return endpoint
+
+        service = self.service
+        if service is None:
+            raise ValueError(f"{self.moniker} has no Service (yet)")
+        [port] = [p.port for p in service.ports if p.name == "mariadb"]
+        self.index.remember(self.namespace, self.name, service.name, port)
+        return (service.name, port)
+
 
 class WordpressSite (CustomAPIKubernetesObject):
     _search_kwargs = dict(group='wordpress.epfl.ch',
                           version='v2',
                           plural='wordpresssites')
 
+    # How the operator names the objects it creates on behalf of a site:
+    name_prefixes = {
+        "db": "wp-db-",
+        "user": "wp-db-user-",
+        "grant": "wp-db-grant-",
+        "password": "wp-db-password-",
+        "route": "wp-route-"
+    }
+
     @property
     def path (self):
         return self.field("spec.path")
@@ -410,15 +1072,15 @@ class WordpressSite (CustomAPIKubernetesObject):
 
     @cached_property
     def database (self):
-        return self._sole_owned(MariaDBDatabase.all(namespace=self.namespace))
+        return self._sole_owned_indexed(MariaDBDatabase, self.name_prefixes["db"] + self.name)
 
     @cached_property
     def user (self):
-        return self._sole_owned(MariaDBUser.all(namespace=self.namespace))
+        return self._sole_owned_indexed(MariaDBUser, self.name_prefixes["user"] + self.name)
 
     @cached_property
     def secret (self):
-        return self._sole_owned(Secret.all(namespace=self.namespace))
+        return self._sole_owned_indexed(Secret, self.name_prefixes["password"] + self.name)
 
 
 class NamespaceLeaderElection:
@@ -3,7 +3,10 @@
 # Run with `python3 wp_operator.py run --`
 #
 import argparse
+import asyncio
 import base64
+import collections
+import concurrent.futures
 import datetime
 from functools import cached_property
 import logging
@@ -11,6 +14,7 @@ import os
 import re
 import secrets
 import sys
+import threading
 import time
 import shlex
 import subprocess
@@ -19,7 +23,10 @@ import json
 import kopf
 import kopf.cli
 import requests
+import kubernetes.watch
 from kubernetes import client, config
+import kubernetes_asyncio.client
+import kubernetes_asyncio.watch
 from kubernetes.client.exceptions import ApiException
 from urllib3 import disable_warnings
 # Remove warning: InsecureRequestWarning (Unverified HTTPS request is being made to host 'api.okd-test.fsd.team'.
@@ -27,8 +34,15 @@ from urllib3 import disable_warnings
 from urllib3.exceptions import InsecureRequestWarning
 
 from php import phpize
-from wp_kubernetes import KubernetesAPI, NamespaceLeaderElection
-from wordpresses import WordpressSiteWithWpCli
+from wp_kubernetes import KubernetesAPI, AsyncKubernetesAPI, NamespaceLeaderElection, ConditionWaiter, RateLimiter, \
+    WarmUpGate, WordpressSite, MariaDB, MariaDBDatabase, MariaDBUser, Secret, Ingress, server_side_apply
+from wordpresses import WordpressSiteWithWpCli, subprocess_run_async
+from wp_cli_workers import WpCliWorkerPool
+from placement import PlacementIndex, PlacementStrategy, MetricsSource
+from routes import RouteRecord, RouteTrie
+from sql_rewriter import DumpRewriter
+from restore_queue import RestoreQueue, RestoreJob
+from restore_cache import RestoredSnapshot, RestoredSnapshotCache
 
 
 disable_warnings(InsecureRequestWarning)
@@ -61,6 +75,99 @@ class Config:
                             default="eeacms/rsync") # TODO https://hub.docker.com/r/eeacms/rsync
         parser.add_argument('--image-pull-secret', help='Pull secret to use for pulling image.',
                             default="")
+        parser.add_argument('--async-handlers', help='Run the WordPressSite handlers as coroutines, so that sites waiting on MariaDB, restores or PHP do not hold one of the --max-workers threads',
+                            action='store_true')
+        parser.add_argument('--wp-cli-workers', help='Max number of pre-booted WP-CLI worker processes (0 to always fork a fresh `wp`)',
+                            type=int,
+                            default=0)
+        parser.add_argument('--wp-cli-worker-max-requests', help='Number of commands after which a WP-CLI worker gets recycled',
+                            type=int,
+                            default=100)
+        parser.add_argument('--wp-cli-worker-max-memory', help='Memory usage (in MiB) above which a WP-CLI worker gets recycled',
+                            type=int,
+                            default=192)
+        parser.add_argument('--database-ready-timeout', help='Seconds to wait for a MariaDB Database to be Ready',
+                            type=int,
+                            default=60)
+        parser.add_argument('--user-ready-timeout', help='Seconds to wait for a MariaDB User to be Ready',
+                            type=int,
+                            default=60)
+        parser.add_argument('--grant-ready-timeout', help='Seconds to wait for a MariaDB Grant to be Ready',
+                            type=int,
+                            default=60)
+        parser.add_argument('--restore-complete-timeout', help='Seconds to wait for a MariaDB Restore to be Complete',
+                            type=int,
+                            default=600)
+        parser.add_argument('--media-restore-timeout', help='Seconds to wait for the media restore pod to terminate',
+                            type=int,
+                            default=600)
+        parser.add_argument('--media-restore-workers', help='Number of pods that restore a site\'s media at the same time, each with its share of the year/month upload directories (1 for a single `rsync` of everything)',
+                            type=int,
+                            default=1)
+        parser.add_argument('--restore-max-concurrent', help='Max number of site restores running at the same time, in their own threads (0 to run restores within the creation handler instead)',
+                            type=int,
+                            default=2)
+        parser.add_argument('--restore-max-per-source', help='Max number of site restores running at the same time from the same source MariaDB',
+                            type=int,
+                            default=1)
+        parser.add_argument('--restore-max-per-target', help='Max number of site restores running at the same time into the same MariaDB',
+                            type=int,
+                            default=2)
+        parser.add_argument('--restore-max-attempts', help='Max number of times to try a queued site restore (1 not to retry failed ones)',
+                            type=int,
+                            default=3)
+        parser.add_argument('--restore-retry-delay', help='Seconds to wait before retrying a failed site restore; doubles after each further failure',
+                            type=int,
+                            default=60)
+        parser.add_argument('--restore-cache-ttl', help='Seconds to keep source databases restored from S3 on the mariadb-restore instance, for other sites to restore from (0 to drop them after each restore). '
+                                 'Restores do not pin a backup, so within that time a site may get restored from an older backup than the latest',
+                            type=int,
+                            default=3600)
+        parser.add_argument('--restore-cache-max-entries', help='Max number of unused source databases to keep on the mariadb-restore instance',
+                            type=int,
+                            default=20)
+        parser.add_argument('--restore-parallel-tables', help='Number of tables to dump and import at the same time when restoring a site\'s database, largest tables first (1 to stream the whole database at once)',
+                            type=int,
+                            default=1)
+        parser.add_argument('--kubernetes-connection-pool-size', help='Max number of concurrent connections to the Kubernetes API server (default: --max-workers plus 2)',
+                            type=int,
+                            default=None)
+        parser.add_argument('--kubernetes-request-timeout', help='Default timeout (in seconds) of each request to the Kubernetes API server, watches excepted',
+                            type=float,
+                            default=30)
+        parser.add_argument('--kubernetes-read-qps', help='Sustained rate of GET / LIST requests to the Kubernetes API server (with bursts of twice that); 0 for no limit',
+                            type=float,
+                            default=20)
+        parser.add_argument('--kubernetes-write-qps', help='Sustained rate of POST / PATCH / PUT / DELETE requests to the Kubernetes API server (with bursts of twice that)',
+                            type=float,
+                            default=10)
+        parser.add_argument('--placement-strategy', help='How to pick the MariaDB for a new site: count, data_size, qps, connections, or a weighted combination such as "count:1,qps:2"',
+                            type=PlacementStrategy.parse,
+                            default=PlacementStrategy.parse("count"))
+        parser.add_argument('--placement-metrics', help='JSON file or http(s) URL with per-MariaDB metrics, as {"namespace/mariadb": {"data_size_bytes": ..., "qps": ..., "connections": ...}}',
+                            default="")
+        parser.add_argument('--kubernetes-creation-headroom', help='Fraction of the Kubernetes API rate limits that is reserved to creating new sites',
+                            type=float,
+                            default=0.25)
+        parser.add_argument('--warm-up-timeout', help='Seconds that placing a new database, or creating a Route, may wait for the initial load of all MariaDBs, Databases and Routes',
+                            type=int,
+                            default=120)
+        parser.add_argument('--route-consolidation-interval', help='Seconds between passes that delete the Routes whose closest parent Route already goes to the same service; 0 to never do that',
+                            type=int,
+                            default=0)
+        parser.add_argument('--route-consolidation-dry-run', help='Only log the Routes that route consolidation would delete',
+                            action='store_true')
+        parser.add_argument('--rebalance-interval', help='Seconds between rounds of moving databases from the fullest MariaDBs to the emptiest ones (according to --placement-strategy); 0 to never move databases',
+                            type=int,
+                            default=0)
+        parser.add_argument('--rebalance-max-concurrent', help='Max number of databases being moved at the same time',
+                            type=int,
+                            default=2)
+        parser.add_argument('--rebalance-tolerance', help='How much higher (as a fraction) the score of a MariaDB may be than the lowest one, before databases get moved out of it',
+                            type=float,
+                            default=0.2)
+        parser.add_argument('--rebalance-move-live-databases', help='Actually move the databases that rebalancing plans to move (each site is read-only while its database moves); without this, only log the plan',
+                            action='store_true')
         return parser
 
     @classmethod
@@ -78,6 +185,40 @@ class Config:
         cls.media_restore_to_pvc = cmdline.media_restore_to_pvc
         cls.image_for_restore = cmdline.image_for_restore
         cls.image_pull_secret = cmdline.image_pull_secret
+        cls.async_handlers = cmdline.async_handlers
+        cls.wp_cli_workers = cmdline.wp_cli_workers
+        cls.wp_cli_worker_max_requests = cmdline.wp_cli_worker_max_requests
+        cls.wp_cli_worker_max_memory = cmdline.wp_cli_worker_max_memory
+        cls.wait_timeouts = {
+            "databases": cmdline.database_ready_timeout,
+            "users": cmdline.user_ready_timeout,
+            "grants": cmdline.grant_ready_timeout,
+            "restores": cmdline.restore_complete_timeout,
+        }
+        cls.media_restore_timeout = cmdline.media_restore_timeout
+        cls.media_restore_workers = cmdline.media_restore_workers
+        cls.restore_max_concurrent = cmdline.restore_max_concurrent
+        cls.restore_max_per_source = cmdline.restore_max_per_source
+        cls.restore_max_per_target = cmdline.restore_max_per_target
+        cls.restore_max_attempts = cmdline.restore_max_attempts
+        cls.restore_retry_delay = cmdline.restore_retry_delay
+        cls.restore_cache_ttl = cmdline.restore_cache_ttl
+        cls.restore_cache_max_entries = cmdline.restore_cache_max_entries
+        cls.restore_parallel_tables = cmdline.restore_parallel_tables
+        cls.kubernetes_connection_pool_size = cmdline.kubernetes_connection_pool_size
+        cls.kubernetes_request_timeout = cmdline.kubernetes_request_timeout
+        cls.kubernetes_read_qps = cmdline.kubernetes_read_qps
+        cls.kubernetes_write_qps = cmdline.kubernetes_write_qps
+        cls.kubernetes_creation_headroom = cmdline.kubernetes_creation_headroom
+        cls.placement_strategy = cmdline.placement_strategy
+        cls.placement_metrics = cmdline.placement_metrics
+        cls.warm_up_timeout = cmdline.warm_up_timeout
+        cls.route_consolidation_interval = cmdline.route_consolidation_interval
+        cls.route_consolidation_dry_run = cmdline.route_consolidation_dry_run
+        cls.rebalance_interval = cmdline.rebalance_interval
+        cls.rebalance_max_concurrent = cmdline.rebalance_max_concurrent
+        cls.rebalance_tolerance = cmdline.rebalance_tolerance
+        cls.rebalance_move_live_databases = cmdline.rebalance_move_live_databases
 
     @classmethod
     def script_dir(cls):
@@ -109,65 +250,131 @@ def on_kopf_startup (settings, **_):
 
 
 class MariaDBPlacer:
-    def __init__(self):
-        self._mariadbs_by_namespace = {}
-
-        # TODO wait for KOPF to be done sending us the initial updates
+    def __init__(self, strategy=None, metrics=None, warm_up_timeout=120):
+        self._index = PlacementIndex()
+        self._strategy = strategy or PlacementStrategy.parse("count")
+        self._metrics = metrics or MetricsSource()
+        self._lock = threading.Lock()
+        self._auto_allocate = {}     # (namespace, MariaDB name) → whether it has the wp-auto-allocate label
+        self._parked_events = {}     # (namespace, MariaDB name) → {database name: event type}
+        self.ready = WarmUpGate("MariaDBPlacer")
+        self._warm_up_timeout = warm_up_timeout
 
         @kopf.on.event('databases.k8s.mariadb.com')
         def on_event_database(event, spec, name, namespace, patch, **kwargs):
-            try:
-                mariadbref = KubernetesAPI.custom.get_namespaced_custom_object(group="k8s.mariadb.com",
-                                                                               version="v1alpha1",
-                                                                               namespace=namespace,
-                                                                               plural="mariadbs",
-                                                                               name=spec['mariaDbRef']['name'])
-                if mariadbref and mariadbref.get('metadata', {}).get('labels', {}).get('wp-auto-allocate'):
-                    if (event['type'] in [None, 'ADDED', 'MODIFIED']):
-                        databases = self._mariadbs_at(namespace, spec['mariaDbRef']['name']).setdefault("databases", [])
-                        db_exist = False
-                        for db in databases:
-                            if (db['name'] == name and db['namespace'] == namespace):
-                                db_exist = True
-                        if not db_exist:
-                            self._mariadbs_at(namespace, spec['mariaDbRef']['name']).setdefault("databases", []).append(
-                                {'name': name, 'namespace': namespace, 'spec': spec})
-                    elif (event['type'] == 'DELETED'):
-                        previous_databases = self._mariadbs_at(namespace, spec['mariaDbRef']['name']).setdefault("databases",
-                                                                                                                 [])
-                        self._mariadbs_at(namespace, spec['mariaDbRef']['name'])["databases"] = [
-                            db for db in previous_databases
-                            if not (db['name'] == name and db['namespace'] == namespace)
-                        ]
-                    self._log_mariadbs()
-
-            except ApiException as e:
-                logging.error(f" ↳ [{namespace}/{spec['mariaDbRef']['name']}] The mariadb {spec['mariaDbRef']['name']} doesn't exist")
+            self._on_database_event(event['type'], namespace, name, spec['mariaDbRef']['name'])
 
         @kopf.on.event('mariadbs')
         def on_event_mariadb(event, spec, name, namespace, labels, patch, **kwargs):
-            if (labels and labels.get('wp-auto-allocate')):
-                if (event['type'] in [None, 'ADDED', 'MODIFIED']):
-                    self._mariadbs_at(namespace, name)["spec"] = spec
-                elif (event['type'] == 'DELETED'):
-                    if namespace in self._mariadbs_by_namespace:
-                        if name in self._mariadbs_by_namespace[namespace]:
-                            del self._mariadbs_by_namespace[namespace][name]
-            self._log_mariadbs()
-
-    def _mariadbs_at(self, namespace, name):
-        return self._mariadbs_by_namespace.setdefault(namespace, {}).setdefault(name, {})
-
-    def _log_mariadbs(self):
-        for namespace_name, content in self._mariadbs_by_namespace.items():
-            # Create a copy to prevent RuntimeError (dictionary changed size during iteration)
-            content_copy = content.copy()
-            if content_copy.items():
-                for mariadb_name, mariadb_content in content_copy.items():
-                    logging.info(f"[MariaDBPlacer] mariadb_name: {mariadb_name}, db_count: {len(mariadb_content.get('databases', []))}")
-
-    def place_and_create_database(self, namespace, prefix, name, ownerReferences):
-        mariadb_ref = self._least_populated_mariadb(namespace)
+            self._on_mariadb_event(event['type'], namespace, name, labels)
+
+    def warm_up(self, namespace):
+        """Load all MariaDBs, then all Databases, with one LIST each (rather than one watch event at a time)."""
+        with self.ready.warming_up():
+            for mariadb in MariaDB.all(namespace):
+                self._on_mariadb_event(None, namespace, mariadb.name, mariadb.field("metadata.labels", {}))
+            for database in MariaDBDatabase.all(namespace):
+                self._on_database_event(None, namespace, database.name, database.field("spec.mariaDbRef.name"))
+
+    def _on_mariadb_event(self, event_type, namespace, name, labels):
+        auto_allocate = bool(labels and labels.get('wp-auto-allocate'))
+        with self._lock:
+            if (event_type == 'DELETED'):
+                self._auto_allocate.pop((namespace, name), None)
+            else:
+                self._auto_allocate[(namespace, name)] = auto_allocate
+            parked_events = self._parked_events.pop((namespace, name), {})
+
+        if auto_allocate:
+            if (event_type in [None, 'ADDED', 'MODIFIED']):
+                self._index.add_mariadb(namespace, name)
+            elif (event_type == 'DELETED'):
+                self._index.remove_mariadb(namespace, name)
+            self._log_mariadb(namespace, name)
+
+        if parked_events:
+            logging.info(f"[MariaDBPlacer] replaying {len(parked_events)} parked event(s) for databases in mariadb {name}")
+            for db_name, db_event_type in parked_events.items():
+                self._on_database_event(db_event_type, namespace, db_name, name)
+
+    def _on_database_event(self, event_type, namespace, name, mariadb_name):
+        with self._lock:
+            auto_allocate = self._auto_allocate.get((namespace, mariadb_name))
+            if auto_allocate is None:
+                # We haven't heard of that MariaDB (yet); wait until we do.
+                parked = self._parked_events.setdefault((namespace, mariadb_name), {})
+                if event_type == 'DELETED':
+                    parked.pop(name, None)
+                else:
+                    parked[name] = event_type
+                return
+
+        if auto_allocate:
+            self._index_database_event(event_type, namespace, name, mariadb_name)
+
+    def _index_database_event(self, event_type, namespace, name, mariadb_name):
+        if (event_type in [None, 'ADDED', 'MODIFIED']):
+            changed = self._index.add_database(namespace, name, mariadb_name)
+        elif (event_type == 'DELETED'):
+            changed = self._index.remove_database(namespace, name) is not None
+        else:
+            changed = False
+        if changed:
+            self._log_mariadb(namespace, mariadb_name)
+
+    def _log_mariadb(self, namespace, mariadb_name):
+        logging.info(f"[MariaDBPlacer] mariadb_name: {mariadb_name}, db_count: {self._index.count(namespace, mariadb_name)}")
+
+    def place_and_create_database(self, namespace, prefix, name, ownerReferences, site=None):
+        """Returns the name of the MariaDB that the database is on.
+
+        If `site` is set and the database is new, the placement decision
+        gets recorded into its status.
+        """
+        try:
+            self.ready.wait(self._warm_up_timeout)
+        except TimeoutError as e:
+            raise kopf.TemporaryError(str(e), delay=10)
+
+        db_name = f"{prefix['db']}{name}"
+        live = MariaDBDatabase.get_cached_or_none(namespace=namespace, name=db_name)
+        if live is not None:
+            # Never move an existing database
+            mariadb_ref = live.field("spec.mariaDbRef.name")
+            logging.info(f" ↳ [{namespace}/{name}] Database {db_name} already exists in {mariadb_ref}")
+        else:
+            mariadb_ref, scores = self._choose_mariadb(namespace)
+            logging.info(f" ↳ [{namespace}/{name}] Placing {db_name} in {mariadb_ref} (strategy: {self._strategy}, scores: {scores})")
+            if site is not None:
+                site.status_set_key("placement", {
+                    "mariadb": mariadb_ref,
+                    "strategy": str(self._strategy),
+                    "scores": scores
+                })
+        self._index.add_database(namespace, db_name, mariadb_ref)
+        self._apply_database(namespace, db_name, mariadb_ref, ownerReferences,
+                             live=live.body if live is not None else None)
+
+        return mariadb_ref
+
+    def move_database(self, namespace, prefix, name, ownerReferences, mariadb_ref, site=None):
+        """Point an existing database to another MariaDB, whither its data was just copied."""
+        db_name = f"{prefix['db']}{name}"
+        moved_from = self._index.mariadb_of(namespace, db_name)
+        logging.info(f" ↳ [{namespace}/{name}] Moving {db_name} from {moved_from} to {mariadb_ref}")
+        applied = self._apply_database(namespace, db_name, mariadb_ref, ownerReferences)
+        # Don't wait for the watch to tell `WordpressIngressReconciler` and friends:
+        MariaDBDatabase.owner_index.on_event("MODIFIED", applied)
+        MariaDBDatabase.cache.on_event("MODIFIED", applied)
+        self._index.add_database(namespace, db_name, mariadb_ref)
+        if site is not None:
+            site.status_set_key("placement", {
+                "mariadb": mariadb_ref,
+                "strategy": str(self._strategy),
+                "movedFrom": moved_from
+            })
+
+    def _apply_database(self, namespace, db_name, mariadb_ref, ownerReferences, live=None):
         db_spec = {
             "mariaDbRef": {
                 "name": mariadb_ref
@@ -175,9 +382,6 @@ class MariaDBPlacer:
             "characterSet": "utf8mb4",
             "collate": "utf8mb4_unicode_ci"
         }
-        db_name = f"{prefix['db']}{name}"
-        self._mariadbs_at(namespace, mariadb_ref).setdefault("databases", []).append(
-            {'name': db_name, 'namespace': namespace, 'spec': db_spec})
         body = {
             "apiVersion": "k8s.mariadb.com/v1alpha1",
             "kind": "Database",
@@ -189,84 +393,192 @@ class MariaDBPlacer:
             "spec": db_spec
         }
 
+        return server_side_apply(
+            KubernetesAPI.custom_apply.patch_namespaced_custom_object,
+            body, live=live,
+            group="k8s.mariadb.com",
+            version="v1alpha1",
+            namespace=namespace,
+            plural="databases",
+            name=db_name)
+
+    def namespaces(self):
+        return self._index.namespaces()
+
+    def plan_moves(self, namespace, tolerance, movable):
+        """Returns a list of (database name, from MariaDB, to MariaDB); see `PlacementStrategy.plan_moves()`."""
+        return self._strategy.plan_moves(namespace, self._index, self._metrics,
+                                         tolerance=tolerance, movable=movable)
+
+    def _choose_mariadb(self, namespace):
+        mariadb_name, scores = self._strategy.choose(namespace, self._index, self._metrics)
+        if mariadb_name is None:
+            raise kopf.TemporaryError(f"No MariaDB labeled wp-auto-allocate in namespace {namespace} (yet)")
+        return mariadb_name, scores
+
+
+class DatabaseRebalancer:
+    """Move databases from the fullest MariaDBs to the emptiest ones, as seen by a `MariaDBPlacer`.
+
+    Every `interval` seconds, plans moves with the placer's strategy,
+    and carries them out (with `WordPressSiteOperator.move_database()`)
+    at most `max_concurrent` at a time. Sites are only frozen (i.e.
+    read-only) while their own database moves. With `dry_run`, the
+    planned moves only get logged.
+    """
+    def __init__(self, placer, route_controller, interval, max_concurrent, tolerance, dry_run=True):
+        self._placer = placer
+        self._route_controller = route_controller
+        self._interval = interval
+        self._tolerance = tolerance
+        self._dry_run = dry_run
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrent,
+                                                               thread_name_prefix="rebalancer")
+        self._stopped = threading.Event()
+        self._stats = collections.Counter()
+
+    def start(self):
+        threading.Thread(target=self._run, name="rebalancer", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return dict(self._stats)
+
+    def _run(self):
+        # Waiting first also gives the watches time to fill the placer's index.
+        while not self._stopped.wait(self._interval):
+            try:
+                self.rebalance()
+            except Exception:
+                logging.exception("[DatabaseRebalancer] rebalancing round failed")
+
+    def rebalance(self):
+        db_prefix = WordpressSite.name_prefixes["db"]
+        futures = []
+        for namespace in self._placer.namespaces():
+            moves = self._placer.plan_moves(namespace, self._tolerance,
+                                            movable=lambda db_name: db_name.startswith(db_prefix))
+            for db_name, source, target in moves:
+                if self._dry_run:
+                    logging.info(f"[DatabaseRebalancer] would move {namespace}/{db_name} from {source} to {target} (dry run)")
+                    self._stats["planned"] += 1
+                    continue
+                futures.append(self._executor.submit(
+                    self._move, namespace, db_name[len(db_prefix):], source, target))
+        concurrent.futures.wait(futures)
+
+    def _move(self, namespace, site_name, source, target):
         try:
-            KubernetesAPI.custom.create_namespaced_custom_object(
-                group="k8s.mariadb.com",
-                version="v1alpha1",
-                namespace=namespace,
-                plural="databases",
-                body=body
-            )
+            site = WordpressSite.get(namespace=namespace, name=site_name)
         except ApiException as e:
-            if e.status != 409:
+            if e.status != 404:
                 raise e
-            database = KubernetesAPI.custom.get_namespaced_custom_object(group="k8s.mariadb.com",
-                                                            version="v1alpha1",
-                                                            namespace=namespace,
-                                                            plural="databases",
-                                                            name=db_name)
-            mariadb_ref = database.get("spec", {}).get("mariaDbRef", {}).get("name", '')
-            logging.info(f" ↳ [{namespace}/{name}] Database {db_name} already exists in {mariadb_ref}")
-
-        return mariadb_ref
-
-    def _least_populated_mariadb(self, namespace):
-        db_count_by_mariadb = []
-        for namespace_name, content in self._mariadbs_by_namespace.items():
-            if namespace_name == namespace:
-                for mariadb_name, mariadb_content in content.items():
-                    db_count_by_mariadb.append(
-                        {'mariadb_name': mariadb_name, 'len': len(mariadb_content.setdefault("databases", []))})
-        mariadb_min = min(db_count_by_mariadb, key=lambda x: x['len'])
-        return mariadb_min['mariadb_name']
+            return   # Not a site's database after all
+        try:
+            WordPressSiteOperator(site.body, self._placer, self._route_controller,
+                                  site.uid).move_database(source, target)
+            self._stats["moved"] += 1
+        except Exception:
+            logging.exception(f"[DatabaseRebalancer] failed to move {namespace}/{site_name} from {source} to {target}")
+            self._stats["failed"] += 1
 
 
 class RouteController:
-    def __init__(self):
-        self._routes_by_namespace = {}
+    def __init__(self, warm_up_timeout=120):
+        self._routes_by_namespace = {}   # namespace → RouteTrie
+        self.ready = WarmUpGate("RouteController")
+        self._warm_up_timeout = warm_up_timeout
 
         @kopf.on.event('routes')
-        def on_event_routes(event, spec, name, namespace, **kwargs):
-            # Convert kopf Spec object to a dictionary (especially for the `update`)
-            spec_dict = dict(spec)
-            if (event['type'] in [None, 'ADDED', 'MODIFIED']):
-                if name in self._routes_at(namespace):
-                    self._routes_at(namespace)[name]['spec'].update(spec_dict)
-                else:
-                    self._routes_at(namespace)[name] = {'spec': spec_dict}
-            elif (event['type'] == 'DELETED'):
-                if namespace in self._routes_by_namespace:
-                    if name in self._routes_by_namespace[namespace]:
-                        del self._routes_by_namespace[namespace][name]
-            else:
-                logging.error(f"[ERROR] @kopf.on.event('routes'): Unknown event.type '{event['type']}' for route '{name}'")
+        def on_event_routes(event, spec, name, namespace, body, **kwargs):
+            self._on_route_event(event['type'], namespace, name, spec, body)
+
+    def warm_up(self, namespace):
+        """Load all Routes with one LIST (rather than one watch event at a time)."""
+        with self.ready.warming_up():
+            routes = KubernetesAPI.custom.list_namespaced_custom_object(
+                group="route.openshift.io", version="v1", namespace=namespace, plural="routes")
+            for route in routes["items"]:
+                self._on_route_event(None, namespace, route["metadata"]["name"], route.get("spec", {}), route)
+
+    # The fields of a Route that `create_route()` sets
+    _managed_fields = [
+        ("metadata", "ownerReferences"),
+        ("metadata", "annotations", "haproxy.router.openshift.io/balance"),
+        ("metadata", "annotations", "haproxy.router.openshift.io/disable_cookies"),
+        ("metadata", "labels", "app"),
+        ("metadata", "labels", "route"),
+        ("spec", "to", "kind"),
+        ("spec", "to", "name"),
+        ("spec", "tls", "termination"),
+        ("spec", "tls", "insecureEdgeTerminationPolicy"),
+        ("spec", "tls", "destinationCACertificate"),
+        ("spec", "host"),
+        ("spec", "path"),
+        ("spec", "port", "targetPort"),
+        ("spec", "alternateBackends")
+    ]
+
+    def _on_route_event(self, event_type, namespace, name, spec, body=None):
+        if (event_type in [None, 'ADDED', 'MODIFIED']):
+            routes = self._routes_at(namespace)
+            fingerprint = RouteRecord.fingerprint_of(body, self._managed_fields) if body is not None else None
+            routes.set(RouteRecord.from_spec(name, spec, previous=routes.get(name), fingerprint=fingerprint))
+        elif (event_type == 'DELETED'):
+            if namespace in self._routes_by_namespace:
+                self._routes_by_namespace[namespace].remove(name)
+        else:
+            logging.error(f"[ERROR] @kopf.on.event('routes'): Unknown event.type '{event_type}' for route '{name}'")
 
-    def _routes_at(self, namespace):
-        return self._routes_by_namespace.setdefault(namespace, {})
+    def namespaces(self):
+        return list(self._routes_by_namespace)
 
-    def _is_a_parent_route(self, site_url, route_full_path):
-        s = [part for part in site_url.split('/') if part]
-        r = [part for part in route_full_path.split('/') if part]
-        if len(r) > len(s):
-            return False
-        for i in range(len(r)):
-            if s[i] != r[i]:
-                return False
-        return True
+    def _routes_at(self, namespace):
+        if namespace not in self._routes_by_namespace:
+            self._routes_by_namespace[namespace] = RouteTrie()
+        return self._routes_by_namespace[namespace]
 
     def _get_closest_parent_route(self, namespace, hostname, path):
-        site_url = f"{hostname}{path}"
-        closest_parent_route = None
-        parent_route_max_len = 0
-        for route, val in self._routes_at(namespace).items():
-            spec = val.get('spec')
-            host = spec.get('host')
-            path = spec.get('path', '')
-            route_full_path = f"{host}{path}"
-            if self._is_a_parent_route(site_url, route_full_path) and len(route_full_path) > parent_route_max_len:
-                parent_route_max_len = len(route_full_path)
-                closest_parent_route = {'name': route, 'spec': spec}
-        return closest_parent_route
+        closest = self._routes_at(namespace).closest_parent(hostname, path)
+        if closest is None:
+            return None
+        return {'name': closest.name, 'spec': closest.spec}
+
+    def redundant_routes(self, namespace):
+        """Returns the (route name, parent route name) of the Routes that the operator made, and needn't have.
+
+        That is, the ones whose closest parent Route goes to the same
+        service, e.g. because the parent got created after them.
+        """
+        routes = self._routes_at(namespace)
+        redundant = []
+        for record in routes.records():
+            if not record.name.startswith(WordpressSite.name_prefixes["route"]):
+                continue
+            parent = routes.closest_parent_of(record.name)
+            if parent and record.service == parent.service:
+                redundant.append((record.name, parent.name))
+        return redundant
+
+    def consolidate(self, namespace, dry_run=False):
+        """Delete the `redundant_routes()` (or with `dry_run`, just log them). Returns how many there were."""
+        redundant = self.redundant_routes(namespace)
+        for name, parent_name in redundant:
+            if dry_run:
+                logging.info(f"[RouteController] {namespace}/{name} is redundant with {parent_name} (dry run)")
+                continue
+            logging.info(f"[RouteController] Deleting {namespace}/{name}, redundant with {parent_name}")
+            try:
+                KubernetesAPI.custom.delete_namespaced_custom_object(
+                    group="route.openshift.io", version="v1", namespace=namespace, plural="routes", name=name)
+            except ApiException as e:
+                if e.status != 404:
+                    raise e
+            self._routes_at(namespace).remove(name)
+        return len(redundant)
 
     def _is_cloudflared_route(self, hostname):
         # TODO: Put this as configmap
@@ -277,6 +589,11 @@ class RouteController:
         ]
 
     def create_route(self, namespace, site_name, route_name, hostname, path, service_name, ownerReferences):
+        try:
+            self.ready.wait(self._warm_up_timeout)
+        except TimeoutError as e:
+            raise kopf.TemporaryError(str(e), delay=10)
+
         parent_route = self._get_closest_parent_route(namespace, hostname, path)
         if parent_route and service_name == parent_route.get('spec', {}).get('to', {}).get('name'):
             logging.info(
@@ -306,8 +623,6 @@ class RouteController:
             },
             "alternateBackends": []
         }
-        self._routes_at(namespace)[route_name] = {'spec': spec}
-
         body = {
             "apiVersion": "route.openshift.io/v1",
             "kind": "Route",
@@ -327,26 +642,108 @@ class RouteController:
             "spec": spec
         }
 
+        routes = self._routes_at(namespace)
+        previous = routes.get(route_name)
+        fingerprint = RouteRecord.fingerprint_of(body, self._managed_fields)
+        if previous is not None and previous.fingerprint == fingerprint:
+            logging.info(f" ↳ [{namespace}/{site_name}] Route {route_name} is up to date")
+            return
+
         try:
-            KubernetesAPI.custom.create_namespaced_custom_object(
+            server_side_apply(
+                KubernetesAPI.custom_apply.patch_namespaced_custom_object,
+                body,
                 group="route.openshift.io",
                 version="v1",
                 namespace=namespace,
                 plural="routes",
-                body=body
-            )
+                name=route_name)
+            routes.set(RouteRecord(route_name, hostname, path, service_name, fingerprint=fingerprint))
 
         except ApiException as e:
             logging.error(f" ↳ [{namespace}/{site_name}] Error creating route '{route_name}': {e}")
             raise e
 
 
+class RouteConsolidator:
+    """Every `interval` seconds, have a `RouteController` consolidate the Routes of all namespaces it knows of.
+
+    Fewer Routes make for a smaller HAProxy configuration in the
+    OpenShift router, which reloads faster.
+    """
+    def __init__(self, route_controller, interval, dry_run):
+        self._route_controller = route_controller
+        self._interval = interval
+        self._dry_run = dry_run
+        self._stopped = threading.Event()
+        self._stats = {}
+
+    def start(self):
+        threading.Thread(target=self._run, name="route-consolidator", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def stats(self):
+        return dict(self._stats)
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self.consolidate()
+            except Exception:
+                logging.exception("[RouteConsolidator] consolidation pass failed")
+
+    def consolidate(self):
+        redundant = 0
+        for namespace in self._route_controller.namespaces():
+            redundant = redundant + self._route_controller.consolidate(namespace, dry_run=self._dry_run)
+        self._stats = dict(redundant=redundant, dry_run=self._dry_run,
+                           last_pass=datetime.datetime.now(datetime.timezone.utc).isoformat())
+
+
 class SiteReconcilerWork:
+    """All the PHP-side work that a reconcile wants done to a site.
+
+    Work gets queued by the `PluginReconciler`s and the `reconcile_*`
+    methods of `WordPressSiteOperator`; then `flush()` compiles it into
+    one `wp eval` program, which runs the steps and reports which ones
+    succeeded.
+
+    Steps run in the order they were asked for, except that plugin
+    (de)activations and option writes wait until the next other step
+    (or the end), and then run as deactivations, activations, option
+    writes — just like the one-`wp`-command-per-step implementation
+    that this replaces did. Consecutive language changes make up one
+    step. The `wp_operator_status` read comes last.
+
+    A second program (and therefore WordPress bootstrap) is only
+    needed when a step must see the code of plugins that an earlier
+    step just (de)activated.
+    """
+
+    class Step:
+        def __init__(self, name, php_code, changes_plugins=False, needs_plugins_loaded=False, secrets=()):
+            self.name = name
+            self.php_code = php_code
+            self.changes_plugins = changes_plugins
+            self.needs_plugins_loaded = needs_plugins_loaded
+            self.secrets = secrets   # Substrings of `php_code` that must not be logged
+
     def __init__(self, wp_op):
         self.wp_op = wp_op
-        self._php_work = ''
+        self.secrets = {}   # Secrets read during this reconcile, by name
+        self._clear()
+
+    def _clear(self):
+        self._queued_steps = []
         self._plugins_to_activate = []
         self._plugins_to_deactivate = []
+        self._wp_options = []
+        self._locales_added = set()
+        self._slugs_deleted = set()
+        self._language_batch = None
+        self._update_php_status = False
 
     def activate_plugin(self, plugin_name):
         self._plugins_to_activate.append(plugin_name)
@@ -354,41 +751,245 @@ class SiteReconcilerWork:
     def deactivate_plugin(self, plugin_name):
         self._plugins_to_deactivate.append(plugin_name)
 
+    def set_wp_option(self, name, value, secret=False):
+        self._wp_options.append((name, value, secret))
+
     def add_language(self, lang):
-        self.flush()
-        self._do_run_wp(['pll', 'lang', 'create', f'{lang["name"]}', f'{lang["slug"]}', f'{lang["locale"]}',
-                         f'--rtl={lang["rtl"]}', f'--order={lang["term_group"]}', f'--flag={lang["flag"]}'])
+        if lang['locale'] in self._locales_added:
+            return
+        self._locales_added.add(lang['locale'])
+        self._queue_language_change(lang_to_add=lang)
 
     def delete_language(self, slug):
-        self.flush()
-        self._do_run_wp(['pll', 'lang', 'delete', f'{slug}'])
+        if slug in self._slugs_deleted:
+            return
+        self._slugs_deleted.add(slug)
+        self._queue_language_change(slug_to_delete=slug)
+
+    def _queue_language_change(self, lang_to_add=None, slug_to_delete=None):
+        """Consecutive language changes go into one batch (that deletes first, then adds)."""
+        batch = self._language_batch
+        if (batch is None or self._pending_steps() or not self._queued_steps
+                or self._queued_steps[-1] is not batch["step"]
+                or (slug_to_delete is not None and batch["add"])):
+            batch = dict(add=[], delete=[], step=None)
+            self._language_batch = batch
+        else:
+            self._queued_steps.pop()
+
+        if lang_to_add is not None:
+            batch["add"].append(lang_to_add)
+        if slug_to_delete is not None:
+            batch["delete"].append(slug_to_delete)
+        languages_to_add = sorted(batch["add"], key=lambda lang: int(lang["term_group"]))
+        batch["step"] = self.Step(
+            "languages " + ", ".join([f"-{slug}" for slug in batch["delete"]] +
+                                     [f"+{lang['slug']}" for lang in languages_to_add]),
+            self._php_sync_languages(languages_to_add, batch["delete"]),
+            needs_plugins_loaded=True)
+        self._queue(batch["step"])
 
     def apply_sql(self, sql_filename):
-        self.flush()
-        self._do_run_wp(['db', 'query'], stdin=open(sql_filename))
-
-    def set_wp_option(self, name, value):
-        self._php_work = self._php_work + f"update_option({phpize(name)},{phpize(value)}); \n"
+        with open(sql_filename) as f:
+            statements = [s for s in re.split(r';\s*\n', f.read()) if s.strip()]
+        self._queue(self.Step(
+            f"apply {sql_filename}",
+            f"""global $wpdb; foreach ({phpize(statements)} as $sql) {{ """ +
+            """if ($wpdb->query($sql) === false) throw new Exception($wpdb->last_error); }"""))
 
     def delete_transient(self, name):
-        self.flush()
-        self._do_run_wp(['transient', 'delete', name])
+        self._queue(self.Step(
+            f"delete transient {name}",
+            f"delete_transient({phpize(name)});"))
 
-    def flush(self):
-        if self._plugins_to_deactivate:
-            self._do_run_wp(['plugin', 'deactivate'] + self._plugins_to_deactivate)
+    def update_php_status(self):
+        """Read back the `wp_operator_status` into the CR's status, as the very last step."""
+        self._update_php_status = True
+
+    def _queue(self, step):
+        self._queued_steps.extend(self._pending_steps())
+        self._plugins_to_activate = []
         self._plugins_to_deactivate = []
+        self._wp_options = []
+        self._queued_steps.append(step)
+
+    def _pending_steps(self):
+        """The plugin (de)activations and option writes that are waiting for the next step."""
+        steps = []
+
+        if self._plugins_to_deactivate:
+            steps.append(self.Step(
+                f"deactivate plugins {', '.join(self._plugins_to_deactivate)}",
+                self._php_wp_cli(['plugin', 'deactivate'] + self._plugins_to_deactivate),
+                changes_plugins=True))
 
         if self._plugins_to_activate:
-            self._do_run_wp(['plugin', 'activate'] + self._plugins_to_activate)
-        self._plugins_to_activate = []
+            steps.append(self.Step(
+                f"activate plugins {', '.join(self._plugins_to_activate)}",
+                self._php_wp_cli(['plugin', 'activate'] + self._plugins_to_activate),
+                changes_plugins=True))
+
+        for name, value, secret in self._wp_options:
+            steps.append(self.Step(
+                f"set option {name}",
+                f"update_option({phpize(name)},{phpize(value)});",
+                secrets=[phpize(value)] if secret else []))
+
+        return steps
+
+    def _steps(self):
+        steps = self._queued_steps + self._pending_steps()
+
+        if self._update_php_status:
+            steps.append(self.Step(
+                "read status",
+                """$wp_operator_json['status'] = apply_filters('wp_operator_status', []);""",
+                needs_plugins_loaded=True))
+
+        return steps
+
+    @classmethod
+    def _php_sync_languages(cls, languages_to_add, slugs_to_delete):
+        """Polylang language changes, all at once through Polylang's model API.
+
+        Languages that are already there (resp. already gone) are skipped.
+        """
+        to_add = [dict(name=lang["name"], slug=lang["slug"], locale=lang["locale"],
+                       rtl=int(lang["rtl"]), term_group=int(lang["term_group"]), flag=lang["flag"])
+                  for lang in languages_to_add]
+        return f"""if (! function_exists('PLL')) throw new Exception('Polylang is not loaded');
+$model = PLL()->model;
+$languages = (isset($model->languages) && is_object($model->languages)) ? $model->languages : null;
+$get = $languages ? [$languages, 'get'] : [$model, 'get_language'];
+$add = $languages ? [$languages, 'add'] : [$model, 'add_language'];
+$delete = $languages ? [$languages, 'delete'] : [$model, 'delete_language'];
+foreach ({phpize(slugs_to_delete)} as $slug) {{
+  $language = call_user_func($get, $slug);
+  if ($language) {{
+    call_user_func($delete, $language->term_id);
+  }}
+}}
+foreach ({phpize(to_add)} as $args) {{
+  if (call_user_func($get, $args['slug']) || call_user_func($get, $args['locale'])) {{
+    continue;
+  }}
+  $args['rtl'] = (bool) $args['rtl'];
+  $result = call_user_func($add, $args);
+  if (is_wp_error($result)) {{
+    throw new Exception($args['slug'] . ': ' . $result->get_error_message());
+  }}
+}}"""
 
-        if self._php_work:
-            self._do_run_wp(['eval', self._php_work])
-        self._php_work = ''
+    @classmethod
+    def _php_wp_cli(cls, cmdline):
+        return f"$wp_operator_wp_cli({phpize(cls._wp_cli_command_line(cmdline))});"
 
-    def _do_run_wp(self, cmdline, **kwargs):
-        return self.wp_op.wp.run_wp_cli(cmdline, **kwargs)
+    @classmethod
+    def _wp_cli_command_line(cls, cmdline):
+        """Quote `cmdline` for `WP_CLI::runcommand()`.
+
+        That splits its command line with `WP_CLI\\Utils\\parse_str_to_argv()`,
+        which only strips a pair of surrounding quotes — there is no
+        escaping within them (so, no `shlex.quote()`).
+        """
+        def quote(arg):
+            if arg and not re.search(r"""\s|^["']""", arg):
+                return arg
+            for q in ('"', "'"):
+                if q not in arg and not arg.endswith("\\"):
+                    return f"{q}{arg}{q}"
+            raise ValueError(f"Cannot pass {arg!r} to WP_CLI::runcommand()")
+        return ' '.join(quote(arg) for arg in cmdline)
+
+    def _compile(self):
+        """Returns a list of PHP programs to run in sequence, each with its list of step names and of secrets."""
+        programs = []
+        steps = []
+        plugins_changed = False
+        for step in self._steps():
+            if steps and step.needs_plugins_loaded and plugins_changed:
+                programs.append(steps)
+                steps = []
+                plugins_changed = False
+            steps.append(step)
+            plugins_changed = plugins_changed or step.changes_plugins
+        if steps:
+            programs.append(steps)
+
+        return [(self._php_program(steps), [step.name for step in steps],
+                 [secret for step in steps for secret in step.secrets])
+                for steps in programs]
+
+    @classmethod
+    def _php_program(cls, steps):
+        php = """$wp_operator_json = ['steps' => []];
+$wp_operator_wp_cli = function ($command) {
+  $result = WP_CLI::runcommand($command, ['launch' => false, 'return' => 'all', 'exit_error' => false]);
+  if ($result->return_code) {
+    throw new Exception(trim($result->stderr));
+  }
+};
+$wp_operator_step = function ($name, $f) use (&$wp_operator_json) {
+  try {
+    $f();
+    $wp_operator_json['steps'][] = ['name' => $name, 'ok' => true];
+  } catch (Throwable $e) {
+    $wp_operator_json['steps'][] = ['name' => $name, 'ok' => false, 'error' => $e->getMessage()];
+  }
+};
+"""
+        for step in steps:
+            php = php + (f"$wp_operator_step({phpize(step.name)}, function () use ($wp_operator_wp_cli, &$wp_operator_json) {{ " +
+                         f"{step.php_code} }});\n")
+        return php
+
+    def flush(self):
+        results = []
+        for php_program, step_names, redact in self._compile_and_clear():
+            results.append(self.wp_op.wp.run_wp_eval_json(php_program, redact=redact))
+
+        status = self._check_results(results)
+        if status is not None:
+            self.wp_op.wp.status_set_key("wordpresssite", status)
+        self._raise_if_failed(results)
+
+    async def flush_async(self):
+        """Same as `flush()`, from within the asyncio event loop."""
+        results = []
+        for php_program, step_names, redact in self._compile_and_clear():
+            results.append(await self.wp_op.wp.run_wp_eval_json_async(php_program, redact=redact))
+
+        status = self._check_results(results)
+        if status is not None:
+            await self.wp_op.wp.status_set_key_async("wordpresssite", status)
+        self._raise_if_failed(results)
+
+    def _compile_and_clear(self):
+        programs = self._compile()
+        self._clear()
+        for php_program, step_names, redact in programs:
+            logging.info(f"{self.wp_op.wp.moniker}: running {len(step_names)} reconcile step(s) in one go: {', '.join(step_names)}")
+        return programs
+
+    def _check_results(self, results):
+        """Log how each step fared, and return the `wp_operator_status` if one was read."""
+        status = None
+        for result in results:
+            if result is None:   # DEBUG mode
+                continue
+            for step in result['steps']:
+                if step['ok']:
+                    logging.info(f" ↳ {step['name']}: OK")
+                else:
+                    logging.error(f" ↳ {step['name']}: FAILED: {step['error']}")
+            status = result.get('status', status)
+        return status
+
+    def _raise_if_failed(self, results):
+        failures = [step['name'] for result in results if result is not None
+                    for step in result['steps'] if not step['ok']]
+        if failures:
+            raise kopf.TemporaryError(f"{self.wp_op.wp.moniker}: reconcile steps failed: {', '.join(failures)}")
 
 
 class PluginReconciler:
@@ -427,11 +1028,13 @@ class PluginReconciler:
         if option.get('valueEncoding', None) == "JSON":
             value = json.loads(value)
 
-        self.work.set_wp_option(option['name'], value)
+        self.work.set_wp_option(option['name'], value, secret='valueFrom' in option)
 
     def _get_wp_option_indirect (self, valueFrom):
-        secret = KubernetesAPI.core.read_namespaced_secret(valueFrom['secretKeyRef']['name'], self.k8s_namespace)
-        return base64.b64decode(secret.data[valueFrom['secretKeyRef']['key']]).decode("utf-8")
+        secret_name = valueFrom['secretKeyRef']['name']
+        if secret_name not in self.work.secrets:
+            self.work.secrets[secret_name] = Secret.get_cached(namespace=self.k8s_namespace, name=secret_name)
+        return self.work.secrets[secret_name].decode(valueFrom['secretKeyRef']['key'])
 
 
 class PolylangPluginReconciler (PluginReconciler):
@@ -503,7 +1106,7 @@ class WordpressIngressReconciler:
 fastcgi_param WP_DEBUG           true;
 fastcgi_param WP_ROOT_URI        {path_slash};
 fastcgi_param WP_UPLOADS_DIRNAME {self.uploads_dirname};
-fastcgi_param WP_DB_HOST         {self.db.mariadb.service.name};
+fastcgi_param WP_DB_HOST         {self.db.mariadb.service_name};
 fastcgi_param WP_DB_NAME         {self.db.dbname};
 fastcgi_param WP_DB_USER         {self.user.username};
 fastcgi_param WP_DB_PASSWORD     {self.secret.mariadb_password};
@@ -511,7 +1114,7 @@ fastcgi_param WP_DB_PASSWORD     {self.secret.mariadb_password};
 """
 
     def reconcile (self):
-        """TODO: doesn't actually handle anything but initial creation. (Yet)"""
+        """Create or update the Ingress, with one server-side apply."""
         annotations = {
             "nginx.ingress.kubernetes.io/configuration-snippet":
             self._nginx_configuration_snippet
@@ -551,15 +1154,11 @@ fastcgi_param WP_DB_PASSWORD     {self.secret.mariadb_password};
             )
         )
 
-        try:
-            KubernetesAPI.networking.create_namespaced_ingress(
-                namespace=self.namespace,
-                body=body
-            )
-        except ApiException as e:
-            if e.status != 409:
-                raise e
-            logging.info(f" ↳ [{self.namespace}/{self.name}] Ingress {self.name} already exists")
+        server_side_apply(
+            KubernetesAPI.networking_apply.patch_namespaced_ingress,
+            body, live=Ingress.cache.get(self.namespace, self.name),
+            name=self.name,
+            namespace=self.namespace)
 
 class MediaRestoreOperator:
     def __init__ (self, namespace, wp_name, source_pvc, source_subdir, dest_pvc, dest_subdir, owner):
@@ -572,7 +1171,26 @@ class MediaRestoreOperator:
         self._dest_subdir = dest_subdir
         self._owner = owner
 
+        if not self._source_subdir.endswith("/"):
+            self._source_subdir = self._source_subdir + "/"
+
     def _body(self):
+        return self._pod_body(self._pod_name, [
+            "/usr/bin/rsync",
+            "-r",
+            f"{self._source_dir}/{self._source_subdir}",
+            f"{self._dest_dir}/{self._dest_subdir}"
+        ])
+
+    @property
+    def _source_dir(self):
+        return '/wp-media-data' if self._source_pvc == self._dest_pvc else '/wp-media-data-source'
+
+    @property
+    def _dest_dir(self):
+        return '/wp-media-data'
+
+    def _pod_body(self, pod_name, command, labels=None):
         pull_secret = []
         if Config.image_pull_secret != "":
             pull_secret = [
@@ -581,9 +1199,6 @@ class MediaRestoreOperator:
                 )
             ]
 
-        if not self._source_subdir.endswith("/"):
-            self._source_subdir = self._source_subdir + "/"
-
         wp_media_data_destination = 'wp-media-data'
         wp_media_data_source = 'wp-media-data'
 
@@ -623,8 +1238,9 @@ class MediaRestoreOperator:
             api_version="v1",
             kind="Pod",
             metadata=client.V1ObjectMeta(
-                name=self._pod_name,
+                name=pod_name,
                 namespace=self._namespace,
+                labels=labels,
                 owner_references=[self._owner]
             ),
             spec=client.V1PodSpec(
@@ -642,14 +1258,11 @@ class MediaRestoreOperator:
                             }
                         ),
                         name="restore",
-                        command=[
-                            "/usr/bin/rsync",
-                            "-r",
-                            f"/{wp_media_data_source}/{self._source_subdir}",
-                            f"/{wp_media_data_destination}/{self._dest_subdir}"
-                        ],
+                        command=command,
                         volume_mounts=volume_mounts,
-                        image=Config.image_for_restore
+                        image=Config.image_for_restore,
+                        # So that failures can be told without reading the log (see `_failure_message()`)
+                        termination_message_policy="FallbackToLogsOnError"
                     )
                 ],
                 volumes=volumes
@@ -657,49 +1270,550 @@ class MediaRestoreOperator:
         )
 
     def run_pod(self):
+        if self._create_pod():
+            self._wait_pod()
+
+    async def run_pod_async(self):
+        if await asyncio.to_thread(self._create_pod):
+            await self._wait_pod_async()
+
+    def _create_pod(self):
         logging.info(f" ↳ [{self._namespace}/{self._pod_name}] RESTORE - create pod for media restore {self._pod_name}")
         try:
             KubernetesAPI.core.create_namespaced_pod(
                 namespace=self._namespace,
                 body=self._body()
             )
-            self._wait_pod()
+            return True
         except ApiException as e:
             if e.status != 409:
                 raise e
             logging.info(f" ↳ [{self._namespace}/{self._pod_name}] Pod {self._pod_name} already exists")
+            return False
 
     def _wait_pod(self):
-        iteration = 0
-        while(True):
-            pod_status = KubernetesAPI.core.read_namespaced_pod_status(namespace=self._namespace,
-                                                                       name=self._pod_name)
-            if pod_status.status and pod_status.status.phase == "Succeeded":
-                self._delete_pod()
-                return
-            else:
-                pass
+        deadline = time.monotonic() + Config.media_restore_timeout
+        while time.monotonic() < deadline:
+            # The watch starts with an ADDED event for the pod as it is now, so we can't miss its completion.
+            watch = kubernetes.watch.Watch()
+            for event in watch.stream(KubernetesAPI.core.list_namespaced_pod,
+                                      namespace=self._namespace,
+                                      field_selector=f"metadata.name={self._pod_name}",
+                                      timeout_seconds=self._watch_timeout(deadline)):
+                pod = event['object']
+                if self._phase(pod) == "Succeeded":
+                    watch.stop()
+                    self._delete_pod()
+                    return
+                elif self._phase(pod) == "Failed":
+                    watch.stop()
+                    raise kopf.PermanentError(self._failure_message(pod, self._log_tail()))
+
+        raise kopf.PermanentError(f"create {self._pod_name} timed out")
+
+    async def _wait_pod_async(self):
+        deadline = time.monotonic() + Config.media_restore_timeout
+        while time.monotonic() < deadline:
+            watch = kubernetes_asyncio.watch.Watch()
+            async with watch.stream(AsyncKubernetesAPI.core.list_namespaced_pod,
+                                    namespace=self._namespace,
+                                    field_selector=f"metadata.name={self._pod_name}",
+                                    timeout_seconds=self._watch_timeout(deadline)) as stream:
+                async for event in stream:
+                    pod = event['object']
+                    if self._phase(pod) == "Succeeded":
+                        await AsyncKubernetesAPI.core.delete_namespaced_pod(namespace=self._namespace, name=self._pod_name)
+                        return
+                    elif self._phase(pod) == "Failed":
+                        raise kopf.PermanentError(self._failure_message(pod, await self._log_tail_async()))
+
+        raise kopf.PermanentError(f"create {self._pod_name} timed out")
+
+    @staticmethod
+    def _watch_timeout(deadline):
+        return max(1, int(deadline - time.monotonic()))
+
+    @staticmethod
+    def _phase(pod):
+        return pod.status.phase if pod.status else None
+
+    _log_tail_lines = 20
+
+    def _log_tail(self):
+        """The last lines of the pod's log, or None if they can't be read."""
+        try:
+            return KubernetesAPI.core.read_namespaced_pod_log(namespace=self._namespace, name=self._pod_name,
+                                                              tail_lines=self._log_tail_lines)
+        except ApiException as e:
+            logging.warning(f" ↳ [{self._namespace}/{self._pod_name}] could not read log: {e.reason}")
+            return None
 
-            if iteration < 60: # Wait up to 10 mins for the restore to end
-                time.sleep(10)
-                iteration = iteration + 1
-            else:
-                raise kopf.PermanentError(f"create {self._pod_name} timed out or failed")
+    async def _log_tail_async(self):
+        try:
+            return await AsyncKubernetesAPI.core.read_namespaced_pod_log(namespace=self._namespace, name=self._pod_name,
+                                                                         tail_lines=self._log_tail_lines)
+        except kubernetes_asyncio.client.exceptions.ApiException as e:
+            logging.warning(f" ↳ [{self._namespace}/{self._pod_name}] could not read log: {e.reason}")
+            return None
+
+    def _failure_message(self, pod, log_tail):
+        """Says how `pod` failed, with the tail of its log.
+
+        If `log_tail` is None (e.g. the operator may not read logs), the
+        container's termination message stands in; as per its
+        `termination_message_policy`, that is the end of its log.
+        """
+        terminated = None
+        for container_status in pod.status.container_statuses or []:
+            if container_status.state and container_status.state.terminated:
+                terminated = container_status.state.terminated
+        exit_code = terminated.exit_code if terminated else None
+        if log_tail is None:
+            log_tail = (terminated.message if terminated and terminated.message
+                        else "(could not read the log, and there is no termination message)")
+        return f"{pod.metadata.name} failed with exit code {exit_code}; last lines of its log:\n{log_tail}"
 
     def _delete_pod(self):
         KubernetesAPI.core.delete_namespaced_pod(namespace=self._namespace, name=self._pod_name)
 
+
+class ParallelMediaRestoreOperator(MediaRestoreOperator):
+    """Restore media with `workers` pods at once, each `rsync`ing its share of the site's year/month upload directories.
+
+    Progress goes to `set_status(status)` as it happens; given that
+    status back as `previous_status`, a later run (e.g. `RestoreQueue`'s
+    retry after a failure or timeout) only copies the shards that are
+    not done yet, and `rsync --partial` resumes the files that were in
+    flight.
+    """
+    _rest_of_tree = "."   # The shard of whatever is not in a year/month directory
+
+    # Prints a `SHARD <shard> <files> <bytes>` line for each year/month directory, and the rest.
+    # Only POSIX `find` and `awk`, and `stat -c` (as the restore image may well be busybox-based).
+    _plan_script = r"""
+cd "$1" || exit 1
+{ find . -type f -exec stat -c '%s %n' {} + || echo FIND_FAILED; } | awk '
+$0 == "FIND_FAILED" { failed = 1; next }
+{
+    size = $1; dir = substr($0, length(size) + 2); sub(/\/[^\/]*$/, "", dir); shard = "."
+    if (match(dir, /^\.\/[0-9][0-9][0-9][0-9]\/[0-9][0-9]($|\/)/)) shard = substr(dir, 3, 7)
+    files[shard]++; bytes[shard] += size
+}
+END {
+    if (failed) exit 1
+    for (shard in files) printf "SHARD\t%s\t%d\t%.0f\n", shard, files[shard], bytes[shard]
+}'
+"""
+
+    # Copies each shard given as an argument, printing `DONE <shard>` after each.
+    _worker_script = r"""
+src="$1"; dst="$2"; shift 2
+for shard in "$@"; do
+    if [ "$shard" = . ]; then
+        /usr/bin/rsync -rt --partial --exclude='/[0-9][0-9][0-9][0-9]/[0-9][0-9]/' "$src" "$dst" || exit 1
+    else
+        mkdir -p "$dst$shard" && /usr/bin/rsync -rt --partial "$src$shard/" "$dst$shard/" || exit 1
+    fi
+    printf 'DONE\t%s\n' "$shard"
+done
+"""
+
+    def __init__ (self, workers, previous_status, set_status, **kwargs):
+        super().__init__(**kwargs)
+        self._workers = workers
+        self._previous_status = previous_status or {}
+        self._set_status = set_status
+        self._labels = {"wordpress.epfl.ch/media-restore": self._wp_name}
+
+    @property
+    def _source(self):
+        return f"{self._source_dir}/{self._source_subdir}"
+
+    @property
+    def _dest(self):
+        return f"{self._dest_dir}/{self._dest_subdir}/"
+
+    @property
+    def _label_selector(self):
+        return ",".join(f"{k}={v}" for k, v in self._labels.items())
+
+    def run_pod(self):
+        deadline = time.monotonic() + Config.media_restore_timeout
+        self._delete_leftover_pods()
+
+        status = self._resumed_status() or dict(source=self._source, shards=self._plan(deadline), shardsDone=[])
+        pods = {}
+        for pod_name, body, shards in self._worker_pods(status):
+            KubernetesAPI.core.create_namespaced_pod(namespace=self._namespace, body=body)
+            pods[pod_name] = shards
+
+        self._raise_if_failed(status, self._wait_pods(pods, deadline, self._shard_progress(status)))
+
+    async def run_pod_async(self):
+        deadline = time.monotonic() + Config.media_restore_timeout
+        await self._delete_leftover_pods_async()
+
+        status = self._resumed_status() or dict(source=self._source, shards=await self._plan_async(deadline),
+                                                shardsDone=[])
+        pods = {}
+        for pod_name, body, shards in self._worker_pods(status):
+            await AsyncKubernetesAPI.core.create_namespaced_pod(namespace=self._namespace, body=body)
+            pods[pod_name] = shards
+
+        self._raise_if_failed(status, await self._wait_pods_async(pods, deadline, self._shard_progress(status)))
+
+    @staticmethod
+    def split_shards(shards, workers):
+        """Deal `shards` ({shard: [files, bytes]}) to at most `workers` workers, largest first to the least loaded."""
+        loads = [[0, i, []] for i in range(min(workers, len(shards)))]
+        for shard in sorted(shards, key=lambda shard: shards[shard][1], reverse=True):
+            load = min(loads)
+            load[0] = load[0] + shards[shard][1]
+            load[2].append(shard)
+        return [load[2] for load in loads]
+
+    def _resumed_status(self):
+        """The status of the previous run, if it was for the same source; None if there is no plan to resume."""
+        status = dict(self._previous_status)
+        if status.get("source") != self._source or "shards" not in status:
+            return None
+        return status
+
+    def _worker_pods(self, status):
+        """Yields the (pod name, body, shards) of the pods to copy the shards of `status` that are not done yet."""
+        remaining = {shard: size for shard, size in status["shards"].items()
+                     if shard not in status["shardsDone"]}
+        if len(remaining) < len(status["shards"]):
+            logging.info(f" ↳ [{self._namespace}/{self._wp_name}] RESTORE - resuming media restore, "
+                         f"{len(remaining)} of {len(status['shards'])} shards left")
+        self._report(status)
+
+        for i, shards in enumerate(self.split_shards(remaining, self._workers)):
+            pod_name = f"{self._wp_name}-media-restore-{i}-{round(time.time())}"
+            logging.info(f" ↳ [{self._namespace}/{pod_name}] RESTORE - create pod for {len(shards)} media shards")
+            yield (pod_name,
+                   self._pod_body(pod_name, ["/bin/sh", "-c", self._worker_script, "restore-media",
+                                             self._source, self._dest] + shards,
+                                  labels=self._labels),
+                   shards)
+
+    def _shard_progress(self, status):
+        """Returns an `on_log(pod_name, log)` that reports the shards that the log says are done."""
+        def on_log(pod_name, log):
+            done = [line.split("\t")[1] for line in log.splitlines() if line.startswith("DONE\t")]
+            new = [shard for shard in done if shard not in status["shardsDone"]]
+            if new:
+                status["shardsDone"] = status["shardsDone"] + new
+                self._report(status)
+        return on_log
+
+    def _raise_if_failed(self, status, failures):
+        if failures:
+            raise kopf.TemporaryError(f"media restore of {self._wp_name} failed after "
+                                      f"{len(status['shardsDone'])} of {len(status['shards'])} shards; will resume:\n"
+                                      + "\n".join(failures), delay=60)
+
+    def _report(self, status):
+        done = [status["shards"][shard] for shard in status["shardsDone"]]
+        total = list(status["shards"].values())
+        status.update(filesDone=sum(files for files, _ in done), filesTotal=sum(files for files, _ in total),
+                      bytesDone=sum(size for _, size in done), bytesTotal=sum(size for _, size in total))
+        self._set_status(status)
+
+    def _plan_pod(self):
+        pod_name = f"{self._wp_name}-media-plan-{round(time.time())}"
+        logging.info(f" ↳ [{self._namespace}/{pod_name}] RESTORE - create pod to plan media restore")
+        return (pod_name, self._pod_body(pod_name, ["/bin/sh", "-c", self._plan_script, "plan-media", self._source],
+                                         labels=self._labels))
+
+    @staticmethod
+    def _parse_plan(pod_name, log):
+        shards = {}
+        for line in log.splitlines():
+            if line.startswith("SHARD\t"):
+                (_, shard, files, size) = line.split("\t")
+                shards[shard] = [int(files), int(size)]
+        if not shards:
+            # Rather than report success having copied nothing, whether the source is empty or the plan went wrong
+            raise kopf.PermanentError(f"{pod_name} found no media to restore; last lines of its log:\n"
+                                      + "\n".join(log.splitlines()[-MediaRestoreOperator._log_tail_lines:]))
+        return shards
+
+    def _plan(self, deadline):
+        (pod_name, body) = self._plan_pod()
+        KubernetesAPI.core.create_namespaced_pod(namespace=self._namespace, body=body)
+        logs = {}
+        failures = self._wait_pods({pod_name: None}, deadline, lambda pod_name, log: logs.update({pod_name: log}))
+        if failures:
+            raise kopf.PermanentError(failures[0])
+        return self._parse_plan(pod_name, logs.get(pod_name, ""))
+
+    async def _plan_async(self, deadline):
+        (pod_name, body) = self._plan_pod()
+        await AsyncKubernetesAPI.core.create_namespaced_pod(namespace=self._namespace, body=body)
+        logs = {}
+        failures = await self._wait_pods_async({pod_name: None}, deadline,
+                                               lambda pod_name, log: logs.update({pod_name: log}))
+        if failures:
+            raise kopf.PermanentError(failures[0])
+        return self._parse_plan(pod_name, logs.get(pod_name, ""))
+
+    # How often to read the logs of the pods that are still running, for progress
+    _progress_interval = 30
+
+    def _wait_pods(self, pods, deadline, on_log):
+        """Watch `pods` until they all terminate; feed their logs to `on_log` as they go.
+
+        Returns the failure messages of those that failed. Pods that
+        succeed get deleted; so do all of them upon timeout.
+        """
+        running = set(pods)
+        failures = []
+        while running:
+            if time.monotonic() >= deadline:
+                for pod_name in running:
+                    self._delete_pod_named(pod_name)
+                raise self._timed_out()
+            # Each watch starts with an ADDED event for each pod as it is now, so we can't miss a completion.
+            watch = kubernetes.watch.Watch()
+            for event in watch.stream(KubernetesAPI.core.list_namespaced_pod,
+                                      namespace=self._namespace,
+                                      label_selector=self._label_selector,
+                                      timeout_seconds=self._watch_timeout(self._progress_deadline(deadline))):
+                pod = event['object']
+                if not self._terminated(pod, running):
+                    continue
+                if self._on_terminated(pod, self._read_log(pod.metadata.name), running, failures, on_log):
+                    self._delete_pod_named(pod.metadata.name)
+                if not running:
+                    watch.stop()
+            for pod_name in sorted(running):
+                on_log(pod_name, self._read_log(pod_name))
+        return failures
+
+    async def _wait_pods_async(self, pods, deadline, on_log):
+        """Same as `_wait_pods()`, with `AsyncKubernetesAPI`."""
+        running = set(pods)
+        failures = []
+        while running:
+            if time.monotonic() >= deadline:
+                for pod_name in running:
+                    await self._delete_pod_named_async(pod_name)
+                raise self._timed_out()
+            watch = kubernetes_asyncio.watch.Watch()
+            async with watch.stream(AsyncKubernetesAPI.core.list_namespaced_pod,
+                                    namespace=self._namespace,
+                                    label_selector=self._label_selector,
+                                    timeout_seconds=self._watch_timeout(self._progress_deadline(deadline))) as stream:
+                async for event in stream:
+                    pod = event['object']
+                    if not self._terminated(pod, running):
+                        continue
+                    if self._on_terminated(pod, await self._read_log_async(pod.metadata.name),
+                                           running, failures, on_log):
+                        await self._delete_pod_named_async(pod.metadata.name)
+                    if not running:
+                        break
+            for pod_name in sorted(running):
+                on_log(pod_name, await self._read_log_async(pod_name))
+        return failures
+
+    def _progress_deadline(self, deadline):
+        return min(deadline, time.monotonic() + self._progress_interval)
+
+    def _terminated(self, pod, running):
+        return pod.metadata.name in running and self._phase(pod) in ("Succeeded", "Failed")
+
+    def _on_terminated(self, pod, log, running, failures, on_log):
+        """Take `pod` out of `running`, having fed its whole `log` to `on_log`. Returns whether it succeeded."""
+        running.discard(pod.metadata.name)
+        on_log(pod.metadata.name, log)
+        if self._phase(pod) == "Failed":
+            log_tail = "\n".join(log.splitlines()[-self._log_tail_lines:])
+            failures.append(self._failure_message(pod, log_tail))
+            return False
+        return True
+
+    def _timed_out(self):
+        return kopf.TemporaryError(f"media restore of {self._wp_name} timed out; will resume", delay=60)
+
+    # What reading the log of a pod that has not started yet (400), or is already gone (404), returns
+    _no_log_yet = (400, 404)
+
+    def _read_log(self, pod_name):
+        """The whole log of `pod_name`, or "" if it has none yet.
+
+        Any other error (e.g. 403, if the operator may not read logs)
+        gets raised; as, without the logs, it can't tell what got done.
+        """
+        try:
+            return KubernetesAPI.core.read_namespaced_pod_log(namespace=self._namespace, name=pod_name)
+        except ApiException as e:
+            if e.status not in self._no_log_yet:
+                raise e
+            return ""
+
+    async def _read_log_async(self, pod_name):
+        try:
+            return await AsyncKubernetesAPI.core.read_namespaced_pod_log(namespace=self._namespace, name=pod_name)
+        except kubernetes_asyncio.client.exceptions.ApiException as e:
+            if e.status not in self._no_log_yet:
+                raise e
+            return ""
+
+    def _delete_pod_named(self, pod_name):
+        try:
+            KubernetesAPI.core.delete_namespaced_pod(namespace=self._namespace, name=pod_name)
+        except ApiException as e:
+            if e.status != 404:
+                raise e
+
+    async def _delete_pod_named_async(self, pod_name):
+        try:
+            await AsyncKubernetesAPI.core.delete_namespaced_pod(namespace=self._namespace, name=pod_name)
+        except kubernetes_asyncio.client.exceptions.ApiException as e:
+            if e.status != 404:
+                raise e
+
+    def _delete_leftover_pods(self):
+        """Pods of a previous run (e.g. before an operator restart) would `rsync` to the same place."""
+        for pod in KubernetesAPI.core.list_namespaced_pod(namespace=self._namespace,
+                                                          label_selector=self._label_selector).items:
+            logging.info(f" ↳ [{self._namespace}/{pod.metadata.name}] RESTORE - delete leftover media restore pod")
+            self._delete_pod_named(pod.metadata.name)
+
+    async def _delete_leftover_pods_async(self):
+        pods = await AsyncKubernetesAPI.core.list_namespaced_pod(namespace=self._namespace,
+                                                                 label_selector=self._label_selector)
+        for pod in pods.items:
+            logging.info(f" ↳ [{self._namespace}/{pod.metadata.name}] RESTORE - delete leftover media restore pod")
+            await self._delete_pod_named_async(pod.metadata.name)
+
+class ModelIndexes:
+    """Feed the in-memory indexes of the `wp_kubernetes` model classes from kopf's watches."""
+    @classmethod
+    def hook(cls):
+        for resource, model in [('databases.k8s.mariadb.com', MariaDBDatabase),
+                                ('users.k8s.mariadb.com', MariaDBUser),
+                                ('secrets', Secret)]:
+            cls._hook_one(f"owner_index_{resource}", resource, model.owner_index.on_event)
+            cls._hook_one(f"cache_{resource}", resource, model.cache.on_event)
+
+        cls._hook_one("mariadb_index_mariadbs", 'mariadbs', MariaDB.index.on_mariadb_event)
+        cls._hook_one("mariadb_index_services", 'services', MariaDB.index.on_service_event)
+        cls._hook_one("cache_ingresses", 'ingresses.networking.k8s.io', Ingress.cache.on_event)
+
+    @classmethod
+    def _hook_one(cls, id, resource, on_event_callback):
+        @kopf.on.event(resource, id=id)
+        def on_event(event, **kwargs):
+            on_event_callback(event['type'], event['object'])
+
+
 class WordPressSiteOperator:
 
+  @classmethod
+  def _hook_mariadb_conditions(cls, plural):
+      @kopf.on.event(f'{plural}.k8s.mariadb.com', id=f'mariadb_conditions_{plural}')
+      def on_event_mariadb_object(event, **kwargs):
+          cls.mariadb_conditions.on_event(plural, event['type'], event['object'])
+
   @classmethod
   def go(cls):
-      placer = MariaDBPlacer()
-      route_controller = RouteController()
+      placer = MariaDBPlacer(strategy=Config.placement_strategy,
+                             metrics=MetricsSource.from_location(Config.placement_metrics),
+                             warm_up_timeout=Config.warm_up_timeout)
+      route_controller = RouteController(warm_up_timeout=Config.warm_up_timeout)
+      ModelIndexes.hook()
+
+      @kopf.on.startup(id='warm_up')
+      def warm_up(**kwargs):
+          # kopf's own watches only start after the startup handlers are done.
+          placer.warm_up(NamespaceFromEnv.get())
+          route_controller.warm_up(NamespaceFromEnv.get())
+
+      @kopf.on.probe(id='warm_up')
+      def warm_up_stats(**kwargs):
+          return dict(placer=placer.ready.stats(), routes=route_controller.ready.stats())
+
+      @kopf.on.probe(id='kubernetes_api_pool')
+      def kubernetes_api_pool_stats(**kwargs):
+          return KubernetesAPI.pool_stats()
+
+      if KubernetesAPI.rate_limiter is not None:
+          @kopf.on.probe(id='kubernetes_api_rate_limiter')
+          def kubernetes_api_rate_limiter_stats(**kwargs):
+              return KubernetesAPI.rate_limiter.stats()
+
+      for plural in Config.wait_timeouts:
+          cls._hook_mariadb_conditions(plural)
+
+      if Config.wp_cli_workers > 0:
+          wp_cli_workers = WpCliWorkerPool(
+              size=Config.wp_cli_workers,
+              script=Config.file_in_script_dir("wp-cli-worker.php"),
+              max_requests=Config.wp_cli_worker_max_requests,
+              max_memory_mb=Config.wp_cli_worker_max_memory)
+          WordpressSiteWithWpCli.wp_cli_workers = wp_cli_workers
+
+          @kopf.on.probe(id='wp_cli_workers')
+          def wp_cli_workers_stats(**kwargs):
+              return wp_cli_workers.stats()
+
+          @kopf.on.cleanup()
+          def shutdown_wp_cli_workers(**kwargs):
+              wp_cli_workers.shutdown()
+
+      if Config.rebalance_interval > 0:
+          rebalancer = DatabaseRebalancer(placer, route_controller,
+                                          interval=Config.rebalance_interval,
+                                          max_concurrent=Config.rebalance_max_concurrent,
+                                          tolerance=Config.rebalance_tolerance,
+                                          dry_run=not Config.rebalance_move_live_databases)
+
+          @kopf.on.startup(id='database_rebalancer')
+          def start_database_rebalancer(**kwargs):
+              rebalancer.start()
+
+          @kopf.on.probe(id='database_rebalancer')
+          def database_rebalancer_stats(**kwargs):
+              return rebalancer.stats()
+
+          @kopf.on.cleanup(id='database_rebalancer')
+          def stop_database_rebalancer(**kwargs):
+              rebalancer.stop()
+
+      cls._setup_restored_snapshots()
+
+      if Config.restore_max_concurrent > 0:
+          cls._setup_restore_queue(placer, route_controller)
+
+      if Config.route_consolidation_interval > 0:
+          route_consolidator = RouteConsolidator(route_controller,
+                                                 interval=Config.route_consolidation_interval,
+                                                 dry_run=Config.route_consolidation_dry_run)
+
+          @kopf.on.startup(id='route_consolidator')
+          def start_route_consolidator(**kwargs):
+              route_consolidator.start()
+
+          @kopf.on.probe(id='route_consolidator')
+          def route_consolidator_stats(**kwargs):
+              return route_consolidator.stats()
+
+          @kopf.on.cleanup(id='route_consolidator')
+          def stop_route_consolidator(**kwargs):
+              route_consolidator.stop()
+
+      if Config.async_handlers:
+          AsyncWordPressSiteOperator.go_async(placer, route_controller)
+          return
 
       @kopf.on.create('wordpresssites')
       def on_create_wordpresssite(body, name, namespace, meta, **kwargs):
           wps_uid = meta.get('uid')
-          WordPressSiteOperator(body, placer, route_controller, wps_uid).create_site()
+          with RateLimiter.lane("creation"):
+              WordPressSiteOperator(body, placer, route_controller, wps_uid).create_site()
 
       @kopf.on.delete('wordpresssites')
       def on_delete_wordpresssite(body, name, namespace, meta, **kwargs):
@@ -714,18 +1828,115 @@ class WordPressSiteOperator:
           wps_uid = meta.get('uid')
           WordPressSiteOperator(body, placer, route_controller, wps_uid).reconcile_site()
 
+  restore_queue = None
+  """A `RestoreQueue`, unless restores run within the creation handler (see `--restore-max-concurrent`)."""
+
+  @classmethod
+  def _setup_restore_queue(cls, placer, route_controller):
+      def run_restore_job(job):
+          site = WordpressSite.get(namespace=job.namespace, name=job.name)
+          # Even in `--async-handlers` mode: this is a thread of the queue's own.
+          op = WordPressSiteOperator(site.body, placer, route_controller, site.uid)
+          op.mariadb_name = job.target
+          op.database_name = f"{op.prefix['db']}{op.wp.name}"
+          op.run_restore(attempt=job.attempt)
+
+      restore_queue = RestoreQueue(run_restore_job,
+                                   max_concurrent=Config.restore_max_concurrent,
+                                   max_per_source=Config.restore_max_per_source,
+                                   max_per_target=Config.restore_max_per_target,
+                                   max_attempts=Config.restore_max_attempts,
+                                   retry_delay=Config.restore_retry_delay)
+      WordPressSiteOperator.restore_queue = restore_queue
+
+      @kopf.on.startup(id='restore_queue')
+      def start_restore_queue(**kwargs):
+          restore_queue.start()
+          # Pick up where the previous run of the operator left off, including the retries it had yet to do
+          def next_attempt(site):
+              state = site.field("status.restore.state", None)
+              attempts = site.field("status.restore.attempts", 1)
+              if state in ("queued", "running"):
+                  return attempts
+              elif state == "failed" and attempts < Config.restore_max_attempts:
+                  return attempts + 1
+              return None
+
+          pending = [(site, next_attempt(site)) for site in WordpressSite.all(NamespaceFromEnv.get())]
+          pending = [(site, attempt) for site, attempt in pending if attempt is not None]
+          for site, attempt in sorted(pending, key=lambda pending: pending[0].field("status.restore.queuedAt")):
+              logging.info(f"Resuming the {site.field('status.restore.state')} restore of {site.moniker} (attempt {attempt})")
+              restore_queue.enqueue(RestoreJob(site.namespace, site.name,
+                                               source=site.field("status.restore.source", None),
+                                               target=site.field("status.restore.target"),
+                                               attempt=attempt))
+
+      @kopf.on.probe(id='restore_queue')
+      def restore_queue_stats(**kwargs):
+          return restore_queue.stats()
+
+      @kopf.on.cleanup(id='restore_queue')
+      def stop_restore_queue(**kwargs):
+          restore_queue.stop()
+
+  restored_snapshots = None
+  """The `RestoredSnapshotCache` of source databases on the mariadb-restore instance."""
+
+  restored_from_annotation = "wordpress.epfl.ch/restored-from"
+  restored_at_annotation = "wordpress.epfl.ch/restored-at"
+
+  @classmethod
+  def _setup_restored_snapshots(cls):
+      restored_snapshots = RestoredSnapshotCache(drop=cls._drop_restored_snapshot,
+                                                 ttl=Config.restore_cache_ttl,
+                                                 max_entries=Config.restore_cache_max_entries)
+      WordPressSiteOperator.restored_snapshots = restored_snapshots
+
+      @kopf.on.startup(id='restored_snapshots')
+      def start_restored_snapshots(**kwargs):
+          # Take over (or clean up after) the previous run of the operator
+          for db in MariaDBDatabase.all(NamespaceFromEnv.get()):
+              annotations = db.field("metadata.annotations", None) or {}
+              source = annotations.get(cls.restored_from_annotation)
+              if source is None or db.field("spec.mariaDbRef.name") != os.getenv("MARIADB-RESTORE"):
+                  continue
+              snapshot = RestoredSnapshot(db.namespace, db.dbname, source, db.name)
+              restored_at = annotations.get(cls.restored_at_annotation)
+              if restored_at is None:
+                  cls._drop_restored_snapshot(snapshot)   # Restore never completed
+              else:
+                  snapshot.restored_at = datetime.datetime.fromisoformat(restored_at).timestamp()
+                  restored_snapshots.adopt(snapshot)
+          restored_snapshots.sweep()
+          restored_snapshots.start()
+
+      @kopf.on.probe(id='restored_snapshots')
+      def restored_snapshots_stats(**kwargs):
+          return restored_snapshots.stats()
+
+      @kopf.on.cleanup(id='restored_snapshots')
+      def stop_restored_snapshots(**kwargs):
+          restored_snapshots.stop()
+
+  @staticmethod
+  def _drop_restored_snapshot(snapshot):
+      logging.info(f"Delete temp database {snapshot.k8s_name}")
+      try:
+          KubernetesAPI.custom.delete_namespaced_custom_object(group="k8s.mariadb.com",
+                                                               version="v1alpha1",
+                                                               namespace=snapshot.namespace,
+                                                               plural="databases",
+                                                               name=snapshot.k8s_name)
+      except ApiException as e:
+          if e.status != 404:
+              raise e
+
   def __init__(self, body, placer, route_controller, wps_uid):
       self.wp = WordpressSiteWithWpCli(
           body, ingress_name=body["metadata"]["name"])
       self.placer = placer
       self.route_controller = route_controller
-      self.prefix = {
-          "db": "wp-db-",
-          "user": "wp-db-user-",
-          "grant": "wp-db-grant-",
-          "password": "wp-db-password-",
-          "route": "wp-route-"
-      }
+      self.prefix = WordpressSite.name_prefixes
       self.ownerReferences = {
           "apiVersion": "wordpress.epfl.ch/v2",
           "kind": "WordpressSite",
@@ -736,122 +1947,451 @@ class WordPressSiteOperator:
   def create_site(self):
       logging.info(f"Create WordPressSite {self.wp.moniker}")
 
-      self.mariadb_name = self.placer.place_and_create_database(self.wp.namespace, self.prefix, self.wp.name, self.ownerReferences)
+      self.mariadb_name = self.placer.place_and_create_database(self.wp.namespace, self.prefix, self.wp.name, self.ownerReferences,
+                                                                site=self.wp)
       self.database_name = f"{self.prefix['db']}{self.wp.name}"
 
       self._waitMariaDBObjectReady("databases", self.database_name)
 
       self.create_secret()
       self.create_user()
+      self._waitMariaDBObjectReady("users", self.user_name)
       self.create_grant()
+      self._waitMariaDBObjectReady("grants", self.grant_name)
 
-      mariadb_password_base64 = str(KubernetesAPI.core.read_namespaced_secret(self.secret_name, self.wp.namespace).data['password'])
-      mariadb_password = base64.b64decode(mariadb_password_base64).decode('ascii')
-
-      self.install_wordpress_via_php(mariadb_password)
+      self.install_wordpress_via_php(self._read_mariadb_password())
 
       self.create_ingress()
 
+      if self.wp.restore is not None and self.restore_queue is not None:
+          self.enqueue_restore()   # The restore job creates the Route, once done
+          logging.info(f"End of create WordPressSite {self.wp.moniker} (restore queued)")
+          return
+
       if self.wp.restore is not None:
           self.restore_site(self.wp.restore, self.wp.hostname, self.wp.path)
           self.wp.update_php_status()
-          self.wp.run_wp_cli(["eval", "do_action('wp_operator_post_restore', NULL);"])
+          self.wp.run_wp_cli(self._post_restore_cmdline)
       else:
           self.reconcile_site()
 
+      self.create_route()
+
+      logging.info(f"End of create WordPressSite {self.wp.moniker}")
+
+  _post_restore_cmdline = ["eval", "do_action('wp_operator_post_restore', NULL);"]
+
+  def _read_mariadb_password(self):
+      mariadb_password_base64 = str(KubernetesAPI.core.read_namespaced_secret(self.secret_name, self.wp.namespace).data['password'])
+      return base64.b64decode(mariadb_password_base64).decode('ascii')
+
+  def create_route(self):
       route_name = f"{self.prefix['route']}{self.wp.name}"
       service_name = 'wp-nginx'
       self.route_controller.create_route(self.wp.namespace, self.wp.name, route_name, self.wp.hostname, self.wp.path, service_name, self.ownerReferences)
 
-      logging.info(f"End of create WordPressSite {self.wp.moniker}")
-
   def deactivate_all_plugins(self):
       logging.info(f"Deactivate all plugins  for WordPressSite {self.wp.moniker}")
       self.wp.run_wp_cli(["plugin", "deactivate", "--all"])
 
   def restore_site(self, restore, hostname, path):
-      if restore["wpDbBackupRef"]["mariaDBLookup"]:
-          # - Get the mariadb from the source_information in the CR
-          mariadb_source_name = restore["wpDbBackupRef"]["mariaDBLookup"]["mariadbNameSource"]
-          db_source_name = restore["wpDbBackupRef"]["mariaDBLookup"]["databaseNameSource"]
-          logging.info(f" ↳ [{self.wp.moniker}] RESTORE - by mariaDBLookup: {db_source_name} for {self.database_name}")
+      self._restore_database(restore, hostname, path)
 
-          # - From the s3, restore the db source on the mariadb-restore
-          logging.info(f" ↳ [{self.wp.moniker}] RESTORE - create DB source: {db_source_name}")
-          k8s_name = self.create_database_for_restore(db_source_name)
-          self._waitMariaDBObjectReady("databases", k8s_name)
+      self._media_restore_operator(restore).run_pod()
 
-          # - Read the root secret for mariadb-restore
-          secret = KubernetesAPI.core.read_namespaced_secret(restore["wpDbBackupRef"]["mariaDBLookup"]["mariadbSecretName"],
-                                                             self.wp.namespace)
-          decoded_secret = base64.b64decode(secret.data["root-password"]).decode("utf-8")
-
-          # - When the DB is created, restore data from s3
-          logging.info(f" ↳ [{self.wp.moniker}] RESTORE - restore DB from s3: {db_source_name}")
-          restore_name = self.restore_from_s3 (restore["s3"], mariadb_source_name, db_source_name, os.getenv("MARIADB-RESTORE"))
-          logging.info(f" ↳ [{self.wp.moniker}] RESTORE - waiting for restore: {restore_name}")
-          self._waitMariaDBObjectComplete("restores", restore_name)
-
-          # 5- Use mysqldump to dump the db from the restored DB into mariadb-restore
-          logging.info(f"Running dump of {k8s_name} and import to {self.database_name}")
-
-          dump_cmd = ["mariadb-dump", "-h", os.getenv("MARIADB-RESTORE"), "-u", "root", f"-p{decoded_secret}", "--databases", db_source_name]
-          logging.info(f" ↳ [{self.wp.moniker}] RESTORE - DUMP: {' '.join(dump_cmd)}")
-
-          sed_url = ["sed", "-e", rf"s|{restore['wpDbBackupRef']['mariaDBLookup']['urlSource']}|https://{hostname}{path}|g"]
-          logging.info(f" ↳ [{self.wp.moniker}] RESTORE - SED URL: {' '.join(sed_url)}")
-
-          sed_dbname = ["sed", "-e", rf"s|{db_source_name}|{self.database_name}|g"]
-          logging.info(f" ↳ [{self.wp.moniker}] RESTORE - SED DB NAME: {' '.join(sed_dbname)}")
-
-          restore_cmd = ["mariadb", "-u", "root", "-h", self.mariadb_name, f"-p{decoded_secret}", self.database_name]
-          logging.info(f" ↳ [{self.wp.moniker}] RESTORE - IMPORT INTO NEW DB: {' '.join(restore_cmd)}")
+      logging.info(f" ↳ [{self.wp.moniker}] RESTORE - refresh menu-api for {self.wp.name}")
+      self._refresh_menu_after_restore(hostname, path)
 
-          mariadb_dump = subprocess.Popen(dump_cmd, stdout=subprocess.PIPE)
-          dump_replaced_url = subprocess.Popen(sed_url, stdin=mariadb_dump.stdout, stdout=subprocess.PIPE)
+  def _restore_database(self, restore, hostname, path):
+      if restore["wpDbBackupRef"]["mariaDBLookup"]:
+          (snapshot, must_restore) = self._acquire_restored_snapshot(restore)
+          if must_restore:
+              try:
+                  self._restore_snapshot(restore)
+              except Exception as e:
+                  self.restored_snapshots.failed(snapshot, e)
+                  raise e
+              self._snapshot_restored(snapshot)
+
+          try:
+              self._dump_and_import(restore, hostname, path, snapshot.k8s_name)
+          finally:
+              self.restored_snapshots.release(snapshot)
+
+  def _acquire_restored_snapshot(self, restore):
+      """Returns `(snapshot, must_restore)`; waits if another site is restoring the same source database."""
+      lookup = restore["wpDbBackupRef"]["mariaDBLookup"]
+      (snapshot, must_restore) = self.restored_snapshots.acquire(
+          self.wp.namespace, lookup["databaseNameSource"], lookup["mariadbNameSource"],
+          k8s_name=self._restore_source_k8s_name(lookup["databaseNameSource"]))
+      self._log_acquired_snapshot(snapshot, must_restore)
+      return (snapshot, must_restore)
+
+  def _log_acquired_snapshot(self, snapshot, must_restore):
+      if not must_restore:
+          restored_at = datetime.datetime.fromtimestamp(snapshot.restored_at, datetime.timezone.utc)
+          # Restores bring back whichever backup is the latest at the time; a newer one may have been taken since
+          logging.warning(f" ↳ [{self.wp.moniker}] RESTORE - reusing {snapshot.moniker}, restored at {restored_at.isoformat()} "
+                          "from the latest backup at that time, which may have been superseded since")
+
+  def _restore_snapshot(self, restore):
+      k8s_name = self._create_restore_source_database(restore)
+      self._waitMariaDBObjectReady("databases", k8s_name)
+
+      restore_name = self._restore_source_database_from_s3(restore)
+      logging.info(f" ↳ [{self.wp.moniker}] RESTORE - waiting for restore: {restore_name}")
+      self._waitMariaDBObjectComplete("restores", restore_name)
+
+  def _snapshot_restored(self, snapshot):
+      self.restored_snapshots.restored(snapshot)
+      restored_at = datetime.datetime.fromtimestamp(snapshot.restored_at, datetime.timezone.utc)
+      try:
+          # So that the next run of the operator can reuse it
+          KubernetesAPI.custom.patch_namespaced_custom_object(
+              group="k8s.mariadb.com",
+              version="v1alpha1",
+              namespace=snapshot.namespace,
+              plural="databases",
+              name=snapshot.k8s_name,
+              body={"metadata": {"annotations": {self.restored_at_annotation: restored_at.isoformat()}}})
+      except ApiException as e:
+          logging.warning(f" ↳ [{self.wp.moniker}] RESTORE - could not annotate {snapshot.k8s_name}: {e}")
+
+  def enqueue_restore(self):
+      """Have `restore_queue` restore this site; the job's progress goes to `status.restore`."""
+      lookup = self.wp.restore["wpDbBackupRef"]["mariaDBLookup"]
+      job = RestoreJob(self.wp.namespace, self.wp.name,
+                       source=lookup["mariadbNameSource"] if lookup else None,
+                       target=self.mariadb_name)
+      self.wp.status_set_key("restore", {
+          "state": "queued",
+          "queuedAt": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+          "source": job.source,
+          "target": job.target,
+          "stepsDone": []
+      })
+      self.restore_queue.enqueue(job)
+
+  def run_restore(self, attempt=1):
+      """Run a queued restore, skipping the steps that a previous run (e.g. before a restart) completed.
+
+      `attempt` counts the runs of that restore, from 1; it goes to
+      `status.restore.attempts`, for the retries to pick up after a
+      restart.
+      """
+      restore = self.wp.restore
+      status = dict(self.wp.field("status.restore", None) or {})
+      steps_done = list(status.get("stepsDone", []))
+
+      def progress(**kwargs):
+          status.update(kwargs)
+          self.wp.status_set_key("restore", status)
+
+      def post_restore():
+          self.wp.update_php_status()
+          self.wp.run_wp_cli(self._post_restore_cmdline)
+
+      steps = [
+          ("database", lambda: self._restore_database(restore, self.wp.hostname, self.wp.path)),
+          ("media", lambda: self._media_restore_operator(restore).run_pod()),
+          ("menu", lambda: self._refresh_menu_after_restore(self.wp.hostname, self.wp.path)),
+          ("postRestore", post_restore),
+          ("route", self.create_route)
+      ]
+
+      status.pop("message", None)   # From the previous attempt
+      progress(state="running", attempts=attempt,
+               startedAt=datetime.datetime.now(datetime.timezone.utc).isoformat())
+      try:
+          for step, run in steps:
+              if step in steps_done:
+                  logging.info(f" ↳ [{self.wp.moniker}] RESTORE - {step}: already done")
+                  continue
+              progress(step=step)
+              run()
+              steps_done.append(step)
+              progress(stepsDone=steps_done)
+      except Exception as e:
+          progress(state="failed", message=str(e),
+                   finishedAt=datetime.datetime.now(datetime.timezone.utc).isoformat())
+          raise e
+      progress(state="done", step=None,
+               finishedAt=datetime.datetime.now(datetime.timezone.utc).isoformat())
+      logging.info(f"End of restore of WordPressSite {self.wp.moniker}")
+
+  def _create_restore_source_database(self, restore):
+      # - Get the mariadb from the source_information in the CR
+      mariadb_source_name = restore["wpDbBackupRef"]["mariaDBLookup"]["mariadbNameSource"]
+      db_source_name = restore["wpDbBackupRef"]["mariaDBLookup"]["databaseNameSource"]
+      logging.info(f" ↳ [{self.wp.moniker}] RESTORE - by mariaDBLookup: {db_source_name} for {self.database_name}")
+
+      # - From the s3, restore the db source on the mariadb-restore
+      logging.info(f" ↳ [{self.wp.moniker}] RESTORE - create DB source: {db_source_name}")
+      return self.create_database_for_restore(db_source_name, mariadb_source_name)
+
+  def _restore_source_database_from_s3(self, restore):
+      mariadb_source_name = restore["wpDbBackupRef"]["mariaDBLookup"]["mariadbNameSource"]
+      db_source_name = restore["wpDbBackupRef"]["mariaDBLookup"]["databaseNameSource"]
+
+      # - When the DB is created, restore data from s3
+      logging.info(f" ↳ [{self.wp.moniker}] RESTORE - restore DB from s3: {db_source_name}")
+      restore_name = self.restore_from_s3 (restore["s3"], mariadb_source_name, db_source_name, os.getenv("MARIADB-RESTORE"))
+      return restore_name
+
+  def _dump_and_import(self, restore, hostname, path, k8s_name):
+      db_source_name = restore["wpDbBackupRef"]["mariaDBLookup"]["databaseNameSource"]
+
+      # - Read the root secret for mariadb-restore
+      secret = KubernetesAPI.core.read_namespaced_secret(restore["wpDbBackupRef"]["mariaDBLookup"]["mariadbSecretName"],
+                                                         self.wp.namespace)
+      decoded_secret = base64.b64decode(secret.data["root-password"]).decode("utf-8")
+
+      # 5- Use mysqldump to dump the db from the restored DB into mariadb-restore
+      logging.info(f"Running dump of {k8s_name} and import to {self.database_name}")
+
+      # One pass, that keeps PHP-serialized values valid (unlike `sed`)
+      rewriters = []
+      def make_rewriter():
+          rewriter = DumpRewriter({
+              restore['wpDbBackupRef']['mariaDBLookup']['urlSource']: f"https://{hostname}{path}",
+              db_source_name: self.database_name
+          }, label=f"{self.wp.moniker} RESTORE")
+          rewriters.append(rewriter)
+          return rewriter
+
+      source = (os.getenv("MARIADB-RESTORE"), decoded_secret, db_source_name)
+      target = (self.mariadb_name, decoded_secret, self.database_name)
+      if Config.restore_parallel_tables > 1:
+          self._pipe_database_tables("RESTORE", source, target, make_rewriter,
+                                     parallelism=Config.restore_parallel_tables)
+      else:
+          self._pipe_database("RESTORE", source, target, rewriter=make_rewriter())
+      self.wp.status_set_key("restoreRewrite", DumpRewriter.total_stats(rewriters))
+
+  def _pipe_database(self, what, source, target, rewriter=None, tables=None):
+      """Pipe `mariadb-dump` of `source` into `target`, through `rewriter` (a `DumpRewriter`) if set.
+
+      `source` and `target` are (host, root password, database name)
+      tuples. Passwords go through the environment (rather than the
+      command lines, and therefore the logs).
+
+      The whole database gets dumped with `--databases`, whose `CREATE
+      DATABASE IF NOT EXISTS` and `USE` statements create and select
+      the database on `target` (`rewriter` renaming it if need be); so
+      the import has no default database, which need not exist yet.
+      If `tables` is set, only those get dumped, and `target`'s
+      database must exist already.
+      """
+      (source_host, source_password, source_db) = source
+      (target_host, target_password, target_db) = target
+      if tables is None:
+          dump_cmd = ["mariadb-dump", "-h", source_host, "-u", "root", "--databases", source_db]
+          import_cmd = ["mariadb", "-u", "root", "-h", target_host]
+      else:
+          dump_cmd = ["mariadb-dump", "-h", source_host, "-u", "root", source_db] + list(tables)
+          import_cmd = ["mariadb", "-u", "root", "-h", target_host, target_db]
+
+      logging.info(f" ↳ [{self.wp.moniker}] {what} - DUMP: {shlex.join(dump_cmd)}")
+      mariadb_dump = subprocess.Popen(dump_cmd, stdout=subprocess.PIPE,
+                                      env=dict(os.environ, MYSQL_PWD=source_password))
+      logging.info(f" ↳ [{self.wp.moniker}] {what} - IMPORT: {shlex.join(import_cmd)}")
+      import_db = subprocess.Popen(import_cmd, stdin=subprocess.PIPE if rewriter else mariadb_dump.stdout,
+                                   stdout=subprocess.PIPE, env=dict(os.environ, MYSQL_PWD=target_password))
+
+      rewrite_errors = []
+      if rewriter is None:
           mariadb_dump.stdout.close()
+          pump = None
+      else:
+          def rewrite():
+              try:
+                  with mariadb_dump.stdout, import_db.stdin:
+                      rewriter.rewrite(mariadb_dump.stdout, import_db.stdin)
+              except Exception as e:
+                  rewrite_errors.append(e)
+                  mariadb_dump.kill()
+          pump = threading.Thread(target=rewrite, name=f"rewrite-{self.wp.name}")
+          pump.start()
+
+      with import_db.stdout:
+          outs = import_db.stdout.read()
+      if pump is not None:
+          pump.join()
+      mariadb_dump.wait()
+      import_db.wait()
+
+      pipeline_failures = 0
+      if mariadb_dump.returncode != 0:
+          logging.error(f"{what} pipeline: mariadb-dump command failed with code {mariadb_dump.returncode}")
+          pipeline_failures = pipeline_failures + 1
+      for e in rewrite_errors:
+          logging.error(f"{what} pipeline: rewriting failed: {e}")
+          pipeline_failures = pipeline_failures + 1
+      if import_db.returncode != 0:
+          logging.error(f"{what} pipeline: import command failed with code {import_db.returncode}: {outs}")
+          pipeline_failures = pipeline_failures + 1
+
+      if pipeline_failures:
+          raise kopf.PermanentError(f"{what} pipeline failed")
+
+  def _pipe_database_tables(self, what, source, target, make_rewriter, parallelism):
+      """Same as `_pipe_database()`, one table per pipeline, with `parallelism` of them at once.
+
+      Tables go largest first, so that the longest imports don't start
+      last. `make_rewriter` returns a new `DumpRewriter` for each. The
+      progress and timings of each table go to the WordpressSite's
+      `status.restoreTables`.
+
+      Only base tables are copied (no views, nor stored routines;
+      WordPress has none).
+      """
+      tables = self._list_tables(source)
+      logging.info(f" ↳ [{self.wp.moniker}] {what} - {len(tables)} tables, {parallelism} at a time")
+
+      progress = {table: {"bytes": size, "state": "pending"} for table, size in tables}
+      progress_lock = threading.Lock()
+
+      def report(table, **kwargs):
+          with progress_lock:
+              progress[table].update(kwargs)
+              self.wp.status_set_key("restoreTables", progress)
+
+      def pipe_table(table):
+          report(table, state="running")
+          started = time.monotonic()
+          try:
+              self._pipe_database(f"{what} {table}", source, target, rewriter=make_rewriter(), tables=[table])
+          except Exception as e:
+              report(table, state="failed", seconds=round(time.monotonic() - started, 1))
+              raise e
+          report(table, state="done", seconds=round(time.monotonic() - started, 1))
+
+      with concurrent.futures.ThreadPoolExecutor(max_workers=parallelism,
+                                                 thread_name_prefix=f"{what.lower()}-{self.wp.name}") as executor:
+          futures = [executor.submit(pipe_table, table) for table, _ in tables]
+      failed = [table for (table, _), future in zip(tables, futures) if future.exception() is not None]
+      if failed:
+          raise kopf.PermanentError(f"{what} pipeline failed for table(s) {', '.join(failed)}")
+
+  def _list_tables(self, source):
+      """Returns the (name, size in bytes) of the base tables of `source`'s database, largest first."""
+      (host, password, db) = source
+      query = ("SELECT table_name, data_length + index_length FROM information_schema.tables "
+               f"WHERE table_schema = '{db.replace(chr(39), chr(39) * 2)}' AND table_type = 'BASE TABLE' "
+               "ORDER BY 2 DESC")
+      result = subprocess.run(["mariadb", "-h", host, "-u", "root", "--batch", "--skip-column-names", "-e", query],
+                              env=dict(os.environ, MYSQL_PWD=password), check=True, capture_output=True, text=True)
+      tables = []
+      for line in result.stdout.splitlines():
+          table, size = line.split("\t")
+          tables.append((table, int(size) if size.isdigit() else 0))
+      return tables
+
+  def move_database(self, source, target):
+      """Copy the site's database from MariaDB `source` to `target`, and point the site there.
+
+      The site is read-only from just before the copy, until its Grant
+      on `target` is Ready. The copy creates the database on `target`;
+      the Database object only moves there afterwards. Should pointing
+      the site to `target` fail partway, it gets pointed back to
+      `source` (with all its privileges).
+
+      The copy on `source` stays behind, read-only, for safekeeping;
+      `status.databaseLeftBehind` says where.
+      """
+      self.database_name = f"{self.prefix['db']}{self.wp.name}"
+      source_mariadb = MariaDB.get_cached(namespace=self.wp.namespace, name=source)
+      target_mariadb = MariaDB.get_cached(namespace=self.wp.namespace, name=target)
 
-          dump_replaced_dbname = subprocess.Popen(sed_dbname, stdin=dump_replaced_url.stdout, stdout=subprocess.PIPE)
-          dump_replaced_url.stdout.close()
-
-          restore_db = subprocess.Popen(restore_cmd, stdin=dump_replaced_dbname.stdout, stdout=subprocess.PIPE)
-          dump_replaced_dbname.stdout.close()
-
-          outs, _ = restore_db.communicate()
-          mariadb_dump.wait()
-          dump_replaced_url.wait()
-          dump_replaced_dbname.wait()
-          restore_db.wait()
-
-          # TODO : how to manage DEBUG mode ?
-
-          pipeline_failures = 0
-          if mariadb_dump.returncode != 0:
-              logging.error(f"restore_site pipeline: mariadb-dump command failed with code {mariadb_dump.returncode}")
-              pipeline_failures = pipeline_failures + 1
-          if dump_replaced_url.returncode != 0:
-              logging.error(f"restore_site pipeline: sed command for url failed with code {dump_replaced_url.returncode}")
-              pipeline_failures = pipeline_failures + 1
-          if dump_replaced_dbname.returncode != 0:
-              logging.error(f"restore_site pipeline: sed command for dbname failed with code {dump_replaced_dbname.returncode}")
-              pipeline_failures = pipeline_failures + 1
-          if restore_db.returncode != 0:
-              logging.error(f"restore_site pipeline: restore command failed with code {restore_db.returncode}: {outs}")
-              pipeline_failures = pipeline_failures + 1
-
-          if pipeline_failures:
-              raise kopf.PermanentError("restore_site pipeline failed")
-
-          logging.info(f"Delete temp database {k8s_name}")
-          KubernetesAPI.custom.delete_namespaced_custom_object(group="k8s.mariadb.com",
-                                version="v1alpha1",
-                                namespace=self.wp.namespace,
-                                plural="databases",
-                                name=k8s_name
-                                )
+      # Freeze
+      self.mariadb_name = source
+      self.create_grant(privileges=["SELECT"])
+      try:
+          self._waitMariaDBObjectReady("grants", self.grant_name)
+          self._revoke_writes(source_mariadb)
+          self._pipe_database("MOVE",
+                              source=(source_mariadb.service_name, source_mariadb.root_password, self.database_name),
+                              target=(target_mariadb.service_name, target_mariadb.root_password, self.database_name))
+      except Exception as e:
+          logging.error(f" ↳ [{self.wp.moniker}] MOVE - copy to {target} failed, staying on {source}")
+          self.create_grant()
+          raise e
+
+      # Flip (and thaw)
+      try:
+          self._point_to(target)
+      except Exception as e:
+          logging.error(f" ↳ [{self.wp.moniker}] MOVE - switching to {target} failed, going back to {source}")
+          try:
+              self._point_to(source)
+          except Exception:
+              logging.exception(f" ↳ [{self.wp.moniker}] MOVE - could not go back to {source} either")
+          raise e
+
+      self.wp.status_set_key("databaseLeftBehind", {
+          "mariadb": source,
+          "database": self.database_name,
+          "since": datetime.datetime.now(datetime.timezone.utc).isoformat()
+      })
+      logging.warning(f" ↳ [{self.wp.moniker}] MOVE - done; the copy of {self.database_name} on {source} "
+                      "stays behind, read-only, until someone drops it")
+
+  def _point_to(self, mariadb_name):
+      """Point the site's Database, User, Grant (with all privileges) and ingress to `mariadb_name`."""
+      self.mariadb_name = mariadb_name
+      self.placer.move_database(self.wp.namespace, self.prefix, self.wp.name, self.ownerReferences, mariadb_name,
+                                site=self.wp)
+      self._waitMariaDBObjectReady("databases", self.database_name)
+      self.create_user()
+      self._waitMariaDBObjectReady("users", self.user_name)
+      self.create_grant()
+      self._waitMariaDBObjectReady("grants", self.grant_name)
+      self.create_ingress()
 
+  def _revoke_writes(self, mariadb):
+      """Leave the site's user nothing but SELECT on its database in `mariadb`, and close its sessions.
+
+      mariadb-operator GRANTs the privileges that a Grant lists, but
+      does not REVOKE those that it no longer lists; so the Grant with
+      just SELECT is not enough by itself. And sessions that are already
+      open keep the privileges they had; killing them makes WordPress
+      reconnect, read-only.
+      """
+      user = self.user_name.replace("'", "''")
+      db = self.database_name.replace("`", "``")
+      env = dict(os.environ, MYSQL_PWD=mariadb.root_password)
+      sql = (f"REVOKE ALL PRIVILEGES ON `{db}`.* FROM '{user}'@'%'; "
+             f"GRANT SELECT ON `{db}`.* TO '{user}'@'%'")
+      logging.info(f" ↳ [{self.wp.moniker}] MOVE - revoking writes on {mariadb.service_name}")
+      subprocess.run(["mariadb", "-h", mariadb.service_name, "-u", "root", "-e", sql],
+                     env=env, check=True, capture_output=True)
+
+      sessions = subprocess.run(["mariadb", "-h", mariadb.service_name, "-u", "root", "--batch", "--skip-column-names",
+                                 "-e", f"SELECT id FROM information_schema.processlist WHERE user = '{user}'"],
+                                env=env, check=True, capture_output=True, text=True).stdout.split()
+      if sessions:
+          logging.info(f" ↳ [{self.wp.moniker}] MOVE - killing {len(sessions)} session(s) of {self.user_name}")
+          # `--force`, as some of them may be gone already
+          subprocess.run(["mariadb", "-h", mariadb.service_name, "-u", "root", "--force",
+                          "-e", "; ".join(f"KILL CONNECTION {int(session)}" for session in sessions)],
+                         env=env, capture_output=True)
+
+  def _media_restore_operator(self, restore):
       logging.info(f" ↳ [{self.wp.moniker}] RESTORE - media for {self.wp.name}")
-      MediaRestoreOperator(
+      if Config.media_restore_workers > 1:
+          return ParallelMediaRestoreOperator(
+              workers=Config.media_restore_workers,
+              previous_status=self.wp.field("status.mediaRestore", None),
+              set_status=lambda status: self.wp.status_set_key("mediaRestore", status),
+              namespace=self.wp.namespace,
+              wp_name=self.wp.name,
+              source_pvc=restore['mediaPersistentVolumeClaim']['claimName'],
+              source_subdir=restore['mediaPersistentVolumeClaim']['subPath'],
+              dest_pvc=Config.media_restore_to_pvc,
+              dest_subdir=self.wp.name,
+              owner=self.ownerReferences
+          )
+      return MediaRestoreOperator(
           namespace=self.wp.namespace,
           wp_name=self.wp.name,
           source_pvc=restore['mediaPersistentVolumeClaim']['claimName'],
@@ -859,24 +2399,28 @@ class WordPressSiteOperator:
           dest_pvc=Config.media_restore_to_pvc,
           dest_subdir=self.wp.name,
           owner=self.ownerReferences
-      ).run_pod()
-
-      logging.info(f" ↳ [{self.wp.moniker}] RESTORE - refresh menu-api for {self.wp.name}")
-      self._refresh_menu_after_restore(hostname, path)
+      )
 
   def _refresh_menu_after_restore(self, hostname, path):
       url = f"https://{hostname}{path}"
       r = requests.get(f"http://{os.getenv('MENU_API_HOST')}:3001/refreshSingleMenu/?url={url}")
       logging.info(f" ↳ [{self.wp.moniker}] RESTORE - refresh menu-api for {url} ends with {r.json()}")
 
-  def create_database_for_restore(self, name):
-    k8s_name = f"{name}-restore"
+  @staticmethod
+  def _restore_source_k8s_name(name):
+    return f"{name}-restore"
+
+  def create_database_for_restore(self, name, mariadb_source_name):
+    k8s_name = self._restore_source_k8s_name(name)
     body = {
         "apiVersion": "k8s.mariadb.com/v1alpha1",
         "kind": "Database",
         "metadata": {
             "name": k8s_name,
-            "namespace": self.wp.namespace
+            "namespace": self.wp.namespace,
+            "annotations": {
+                self.restored_from_annotation: mariadb_source_name
+            }
         },
         "spec": {
             "name": name,
@@ -968,6 +2512,10 @@ class WordPressSiteOperator:
     return restore_name
 
   def install_wordpress_via_php(self, secret):
+      cmdline = self._install_wordpress_cmdline(secret)
+      self._check_install_wordpress_result(cmdline, subprocess.run(cmdline, capture_output=True, text=True))
+
+  def _install_wordpress_cmdline(self, secret):
       logging.info(f" ↳ [install_wordpress_via_php] Configuring (ensure-wordpress-and-theme.php) with {self.wp.name=}, {self.wp.path=}, {self.wp.title=}, {self.wp.tagline=}")
 
       cmdline = [Config.php, "ensure-wordpress-and-theme.php",
@@ -988,34 +2536,38 @@ class WordPressSiteOperator:
       if 'DEBUG' in os.environ:
           logging.info(f" (... not really)")
           cmdline.insert(0, "echo")
-      result = subprocess.run(cmdline, capture_output=True, text=True)
+      return cmdline
 
+  def _check_install_wordpress_result(self, cmdline, result):
       logging.info(result.stdout)
 
       if "WordPress successfully installed" not in result.stdout and 'DEBUG' not in os.environ :
-          raise subprocess.CalledProcessError(result.returncode, cmdline_text)
+          raise subprocess.CalledProcessError(result.returncode, ' '.join(shlex.quote(arg) for arg in cmdline))
       else:
           logging.info(f" ↳ [install_wordpress_via_php] End of configuring")
 
   def reconcile_site(self):
+      self._plan_reconcile().flush()
+      logging.info(f"Reconcile WordPressSite {self.wp.moniker} end")
+
+  def _plan_reconcile(self):
       logging.info(f"Reconcile WordPressSite {self.wp.moniker}")
+      work = SiteReconcilerWork(self)
 
       logging.info("Plugins")
-      self.reconcile_plugins()
+      self.reconcile_plugins(work)
 
       logging.info("Languages")
-      self.reconcile_languages()
+      self.reconcile_languages(work)
 
       logging.info("UnitId")
-      self.reconcile_unitId()
+      self.reconcile_unitId(work)
 
-      self.wp.update_php_status()
-
-      logging.info(f"Reconcile WordPressSite {self.wp.moniker} end")
+      work.update_php_status()
+      return work
 
-  def reconcile_plugins(self):
+  def reconcile_plugins(self, work):
       logging.info(f"Reconcile WordPressSite plugins {self.wp.moniker}")
-      work = SiteReconcilerWork(self)
 
       plugins_wanted = self.wp.plugins
       plugins_got = self.wp.status_wordpresssite.get("plugins", {})
@@ -1035,12 +2587,10 @@ class WordPressSiteOperator:
           p = PluginReconciler.get(plugin_name=name, work=work, k8s_namespace=self.wp.namespace)
           p.deactivate()
 
-      work.flush()
       logging.info(f"End of reconcile WordPressSite plugins {self.wp.moniker}")
 
-  def reconcile_languages(self):
+  def reconcile_languages(self, work):
     logging.info(f"Reconcile WordPressSite languages {self.wp.moniker}")
-    work = SiteReconcilerWork(self)
 
     polylang = self.wp.plugins.get("polylang", {}).get("polylang", {})
     languages_wanted = polylang.get("languages", [])
@@ -1063,14 +2613,11 @@ class WordPressSiteOperator:
         if language:
             work.add_language(language)
 
-    work.flush()
     logging.info(f"End of reconcile WordPressSite languages {self.wp.moniker}")
 
-  def reconcile_unitId(self):
+  def reconcile_unitId(self, work):
       logging.info(f"Reconcile WordPressSite unit_id {self.wp.moniker}")
-      work = SiteReconcilerWork(self)
       work.set_wp_option('plugin:epfl_accred:unit_id', self.wp.unit_id)
-      work.flush()
       logging.info(f"Reconcile WordPressSite unit_id {self.wp.moniker}")
 
   @property
@@ -1078,27 +2625,42 @@ class WordPressSiteOperator:
       return self.prefix["password"] + self.wp.name
 
   def create_secret(self):
-      secret = secrets.token_urlsafe(32)
-      logging.info(f" ↳ [{self.wp.moniker}] Create Secret name={self.secret_name}")
+      live = Secret.get_cached_or_none(namespace=self.wp.namespace, name=self.secret_name)
+      if live is not None and live.field("data.password", None):
+          logging.info(f" ↳ [{self.wp.moniker}] Secret {self.secret_name} already exists")
+          password_base64 = live.field("data.password")   # Never change it
+      else:
+          logging.info(f" ↳ [{self.wp.moniker}] Create Secret name={self.secret_name}")
+          password_base64 = base64.b64encode(secrets.token_urlsafe(32).encode("ascii")).decode("ascii")
+
       body = client.V1Secret(
+          api_version="v1",
+          kind="Secret",
           type="Opaque",
           metadata=client.V1ObjectMeta(
               name=self.secret_name,
               namespace=self.wp.namespace,
               owner_references=[self.ownerReferences]
           ),
-          string_data={"password": secret}
+          data={"password": password_base64}
       )
 
-      try:
-          KubernetesAPI.core.create_namespaced_secret(namespace=self.wp.namespace, body=body)
-      except ApiException as e:
-          if e.status != 409:
-              raise e
-          logging.info(f" ↳ [{self.wp.moniker}] Secret {self.secret_name} already exists")
+      server_side_apply(
+          KubernetesAPI.core_apply.patch_namespaced_secret,
+          body, live=live.body if live is not None else None,
+          name=self.secret_name,
+          namespace=self.wp.namespace)
+
+  @property
+  def user_name(self):
+      return self.prefix["user"] + self.wp.name
+
+  @property
+  def grant_name(self):
+      return self.prefix["grant"] + self.wp.name
 
   def create_user(self):
-      user_name = f"{self.prefix['user']}{self.wp.name}"
+      user_name = self.user_name
       password_name = f"{self.prefix['password']}{self.wp.name}"
       logging.info(f" ↳ [{self.wp.moniker}] Create User name={user_name}")
       body = {
@@ -1122,24 +2684,18 @@ class WordPressSiteOperator:
           }
       }
 
-      try:
-          KubernetesAPI.custom.create_namespaced_custom_object(
-              group="k8s.mariadb.com",
-              version="v1alpha1",
-              namespace=self.wp.namespace,
-              plural="users",
-              body=body
-          )
-      except ApiException as e:
-          if e.status != 409:
-              raise e
-          logging.info(f" ↳ [{self.wp.moniker}] User {user_name} already exists")
-
-      self._waitMariaDBObjectReady("users", user_name)
+      server_side_apply(
+          KubernetesAPI.custom_apply.patch_namespaced_custom_object,
+          body, live=MariaDBUser.cache.get(self.wp.namespace, user_name),
+          group="k8s.mariadb.com",
+          version="v1alpha1",
+          namespace=self.wp.namespace,
+          plural="users",
+          name=user_name)
 
-  def create_grant(self):
-      grant_name = f"{self.prefix['grant']}{self.wp.name}"
-      logging.info(f" ↳ [{self.wp.moniker}] Create Grant: {grant_name}")
+  def create_grant(self, privileges=("ALL PRIVILEGES",)):
+      grant_name = self.grant_name
+      logging.info(f" ↳ [{self.wp.moniker}] Create Grant: {grant_name} ({', '.join(privileges)})")
       body = {
           "apiVersion": "k8s.mariadb.com/v1alpha1",
           "kind": "Grant",
@@ -1152,9 +2708,7 @@ class WordPressSiteOperator:
               "mariaDbRef": {
                   "name": self.mariadb_name
               },
-              "privileges": [
-                  "ALL PRIVILEGES"
-              ],
+              "privileges": list(privileges),
               "database": f"{self.prefix['db']}{self.wp.name}",
               "table" : "*",
               "username": f"{self.prefix['user']}{self.wp.name}",
@@ -1163,76 +2717,195 @@ class WordPressSiteOperator:
           }
       }
 
-      try:
-          KubernetesAPI.custom.create_namespaced_custom_object(
-              group="k8s.mariadb.com",
-              version="v1alpha1",
-              namespace=self.wp.namespace,
-              plural="grants",
-              body=body
-          )
-      except ApiException as e:
-          if e.status != 409:
-              raise e
-          logging.info(f" ↳ [{self.wp.moniker}] Grant {grant_name} already exists")
+      server_side_apply(
+          KubernetesAPI.custom_apply.patch_namespaced_custom_object,
+          body,
+          group="k8s.mariadb.com",
+          version="v1alpha1",
+          namespace=self.wp.namespace,
+          plural="grants",
+          name=grant_name)
 
-      self._waitMariaDBObjectReady("grants", grant_name)
+  mariadb_conditions = ConditionWaiter()
+  """Fed from a watch on each of `Config.wait_timeouts`' kinds in `go()`."""
 
   def _waitMariaDBObjectComplete(self, customObjectType, customObjectName):
-    # Wait until the customobject creation completes (either in error or successfully)
-
-    message = ''
-    iteration = 0
-    while(True):
-        newUser = KubernetesAPI.custom.get_namespaced_custom_object(group="k8s.mariadb.com",
-                                                                    version="v1alpha1",
-                                                                    namespace=self.wp.namespace,
-                                                                    plural=customObjectType,
-                                                                    name=customObjectName)
-        for condition in newUser.get("status", {}).get("conditions", []):
-            if condition.get("type") == "Complete":
-                message = condition.get("message")
-                if message == "Success":
-                    return
-                else:
-                    pass
-
-        if iteration < 60: # Wait up to 10 mins for the restore to end
-            time.sleep(10)
-            iteration = iteration + 1
-        else:
-            raise kopf.PermanentError(f"create {customObjectName} timed out or failed, last condition message: {message}")
-
-  def _waitMariaDBObjectReady(self, customObjectType, customObjectName):
       # Wait until the customobject creation completes (either in error or successfully)
+      self._wait_mariadb_object_condition(customObjectType, customObjectName, "Complete", "Success")
 
-      message = ''
-      iteration = 0
-      while(True):
-          newUser = KubernetesAPI.custom.get_namespaced_custom_object(group="k8s.mariadb.com",
-                                                                 version="v1alpha1",
-                                                                 namespace=self.wp.namespace,
-                                                                 plural=customObjectType,
-                                                                 name=customObjectName)
-          for condition in newUser.get("status", {}).get("conditions", []):
-              if condition.get("type") == "Ready":
-                  message = condition.get("message")
-                  if message == "Created":
-                      return
-                  else:
-                      pass
-
-          if iteration < 12:
-              time.sleep(5)
-              iteration = iteration + 1
-          else:
-              raise kopf.PermanentError(f"create {customObjectName} timed out or failed, last condition message: {message}")
+  def _waitMariaDBObjectReady(self, customObjectType, customObjectName):
+      self._wait_mariadb_object_condition(customObjectType, customObjectName, "Ready", "Created")
+
+  def _wait_mariadb_object_condition(self, customObjectType, customObjectName,
+                                     condition_type, expected_message):
+      def get():
+          return KubernetesAPI.custom.get_namespaced_custom_object(group="k8s.mariadb.com",
+                                                                   version="v1alpha1",
+                                                                   namespace=self.wp.namespace,
+                                                                   plural=customObjectType,
+                                                                   name=customObjectName)
+      try:
+          self.mariadb_conditions.wait(customObjectType, self.wp.namespace, customObjectName,
+                                       condition_type, expected_message,
+                                       timeout=Config.wait_timeouts[customObjectType], get=get)
+      except TimeoutError as e:
+          raise kopf.PermanentError(f"create {customObjectName} timed out or failed, last condition message: {e}")
 
   def create_ingress (self):
       logging.info(f"Creating ingress for {self.wp.name}")
       WordpressIngressReconciler(self.wp).reconcile()
 
 
+class AsyncWordPressSiteOperator (WordPressSiteOperator):
+  """Same as `WordPressSiteOperator`, for `--async-handlers` mode.
+
+  Everything that waits (for MariaDB objects, restores, media restore
+  pods, WP-CLI and PHP) does so in the asyncio event loop, rather than
+  pinning one of kopf's `--max-workers` threads. The remaining, short
+  blocking Kubernetes API calls are sent to a thread.
+  """
+
+  @classmethod
+  def go_async(cls, placer, route_controller):
+      @kopf.on.startup()
+      async def setup_async_kubernetes_api(**kwargs):
+          await AsyncKubernetesAPI.setup(connection_pool_maxsize=Config.kubernetes_connection_pool_size)
+
+      @kopf.on.create('wordpresssites')
+      async def on_create_wordpresssite(body, name, namespace, meta, **kwargs):
+          wps_uid = meta.get('uid')
+          with RateLimiter.lane("creation"):
+              await cls(body, placer, route_controller, wps_uid).create_site()
+
+      @kopf.on.delete('wordpresssites')
+      async def on_delete_wordpresssite(body, name, namespace, meta, **kwargs):
+          wps_uid = meta.get('uid')
+          await cls(body, placer, route_controller, wps_uid).deactivate_all_plugins()
+
+      @kopf.on.field('wordpress.epfl.ch', 'v2', 'wordpresssites', field='spec')
+      @kopf.on.field('wordpress.epfl.ch', 'v2', 'wordpresssites', field='status.wordpresssite.plugins')
+      @kopf.on.field('wordpress.epfl.ch', 'v2', 'wordpresssites', field='status.wordpresssite.languages')
+      @kopf.on.field('wordpress.epfl.ch', 'v2', 'wordpresssites', field='status.wordpresssite.unitid')
+      async def on_update_wordpresssite(body, name, namespace, meta, status, **kwargs):
+          wps_uid = meta.get('uid')
+          await cls(body, placer, route_controller, wps_uid).reconcile_site()
+
+  async def create_site(self):
+      logging.info(f"Create WordPressSite {self.wp.moniker}")
+
+      self.mariadb_name = await asyncio.to_thread(
+          self.placer.place_and_create_database, self.wp.namespace, self.prefix, self.wp.name, self.ownerReferences,
+          site=self.wp)
+      self.database_name = f"{self.prefix['db']}{self.wp.name}"
+
+      await self._waitMariaDBObjectReady("databases", self.database_name)
+
+      await asyncio.to_thread(self.create_secret)
+      await asyncio.to_thread(self.create_user)
+      await self._waitMariaDBObjectReady("users", self.user_name)
+      await asyncio.to_thread(self.create_grant)
+      await self._waitMariaDBObjectReady("grants", self.grant_name)
+
+      await self.install_wordpress_via_php(await asyncio.to_thread(self._read_mariadb_password))
+
+      await asyncio.to_thread(self.create_ingress)
+
+      if self.wp.restore is not None and self.restore_queue is not None:
+          await asyncio.to_thread(self.enqueue_restore)   # The restore job creates the Route, once done
+          logging.info(f"End of create WordPressSite {self.wp.moniker} (restore queued)")
+          return
+
+      if self.wp.restore is not None:
+          await self.restore_site(self.wp.restore, self.wp.hostname, self.wp.path)
+          await self.wp.update_php_status_async()
+          await self.wp.run_wp_cli_async(self._post_restore_cmdline)
+      else:
+          await self.reconcile_site()
+
+      await asyncio.to_thread(self.create_route)
+
+      logging.info(f"End of create WordPressSite {self.wp.moniker}")
+
+  async def deactivate_all_plugins(self):
+      logging.info(f"Deactivate all plugins  for WordPressSite {self.wp.moniker}")
+      await self.wp.run_wp_cli_async(["plugin", "deactivate", "--all"])
+
+  async def restore_site(self, restore, hostname, path):
+      if restore["wpDbBackupRef"]["mariaDBLookup"]:
+          (snapshot, must_restore) = await self._acquire_restored_snapshot(restore)
+          if must_restore:
+              try:
+                  await self._restore_snapshot(restore)
+              except Exception as e:
+                  self.restored_snapshots.failed(snapshot, e)
+                  raise e
+              except asyncio.CancelledError:
+                  # Don't leave the sites waiting for that snapshot hanging
+                  self.restored_snapshots.failed(snapshot, kopf.TemporaryError(f"restore of {snapshot.moniker} cancelled"))
+                  raise
+              await asyncio.to_thread(self._snapshot_restored, snapshot)
+
+          try:
+              # The dump pipeline is a chain of `Popen`s; a thread waits on it.
+              await asyncio.to_thread(self._dump_and_import, restore, hostname, path, snapshot.k8s_name)
+          finally:
+              await asyncio.to_thread(self.restored_snapshots.release, snapshot)
+
+      await self._media_restore_operator(restore).run_pod_async()
+
+      logging.info(f" ↳ [{self.wp.moniker}] RESTORE - refresh menu-api for {self.wp.name}")
+      await asyncio.to_thread(self._refresh_menu_after_restore, hostname, path)
+
+  async def _acquire_restored_snapshot(self, restore):
+      # Waiting for another site's restore of that snapshot can take a while; don't hold a thread meanwhile.
+      lookup = restore["wpDbBackupRef"]["mariaDBLookup"]
+      (snapshot, must_restore) = await self.restored_snapshots.acquire_async(
+          self.wp.namespace, lookup["databaseNameSource"], lookup["mariadbNameSource"],
+          k8s_name=self._restore_source_k8s_name(lookup["databaseNameSource"]))
+      self._log_acquired_snapshot(snapshot, must_restore)
+      return (snapshot, must_restore)
+
+  async def _restore_snapshot(self, restore):
+      k8s_name = await asyncio.to_thread(self._create_restore_source_database, restore)
+      await self._waitMariaDBObjectReady("databases", k8s_name)
+
+      restore_name = await asyncio.to_thread(self._restore_source_database_from_s3, restore)
+      logging.info(f" ↳ [{self.wp.moniker}] RESTORE - waiting for restore: {restore_name}")
+      await self._waitMariaDBObjectComplete("restores", restore_name)
+
+  async def install_wordpress_via_php(self, secret):
+      cmdline = self._install_wordpress_cmdline(secret)
+      result = await subprocess_run_async(cmdline, check=False, capture_output=True, text=True)
+      self._check_install_wordpress_result(cmdline, result)
+
+  async def reconcile_site(self):
+      work = await asyncio.to_thread(self._plan_reconcile)
+      await work.flush_async()
+      logging.info(f"Reconcile WordPressSite {self.wp.moniker} end")
+
+  async def _waitMariaDBObjectComplete(self, customObjectType, customObjectName):
+      await self._wait_mariadb_object_condition(customObjectType, customObjectName, "Complete", "Success")
+
+  async def _waitMariaDBObjectReady(self, customObjectType, customObjectName):
+      await self._wait_mariadb_object_condition(customObjectType, customObjectName, "Ready", "Created")
+
+  async def _wait_mariadb_object_condition(self, customObjectType, customObjectName,
+                                           condition_type, expected_message):
+      async def get():
+          return await AsyncKubernetesAPI.custom.get_namespaced_custom_object(
+              group="k8s.mariadb.com",
+              version="v1alpha1",
+              namespace=self.wp.namespace,
+              plural=customObjectType,
+              name=customObjectName)
+      try:
+          await self.mariadb_conditions.wait_async(customObjectType, self.wp.namespace, customObjectName,
+                                                   condition_type, expected_message,
+                                                   timeout=Config.wait_timeouts[customObjectType], get=get)
+      except TimeoutError as e:
+          raise kopf.PermanentError(f"create {customObjectName} timed out or failed, last condition message: {e}")
+
+
 class NamespaceFromEnv:
     @classmethod
     def guess (cls):
@@ -1279,6 +2952,14 @@ def ensure_final_slash (path):
 
 if __name__ == '__main__':
     Config.load_from_command_line()
+    KubernetesAPI.configure(
+        # Room for every kopf worker, plus the leader election and the probes
+        connection_pool_maxsize=Config.kubernetes_connection_pool_size or Config.max_workers + 2,
+        request_timeout=Config.kubernetes_request_timeout,
+        rate_limiter=(RateLimiter(read_qps=Config.kubernetes_read_qps,
+                                  write_qps=Config.kubernetes_write_qps,
+                                  creation_headroom=Config.kubernetes_creation_headroom)
+                      if Config.kubernetes_read_qps > 0 else None))
     NamespaceFromEnv.setup()
     WordPressSiteOperator.go()
 